@@ -1,13 +1,18 @@
 from .dreamina_image_node import DreaminaImageNode
+from .dreamina_async_nodes import DreaminaSubmitNode, DreaminaCollectNode
 
 # 节点类映射 - 注册所有节点
 NODE_CLASS_MAPPINGS = {
     "Dreamina_Image": DreaminaImageNode,
+    "Dreamina_Submit": DreaminaSubmitNode,
+    "Dreamina_Collect": DreaminaCollectNode,
 }
 
 # 节点显示名称映射
 NODE_DISPLAY_NAME_MAPPINGS = {
     "Dreamina_Image": "Dreamina AI图片生成",
+    "Dreamina_Submit": "Dreamina 提交任务",
+    "Dreamina_Collect": "Dreamina 获取结果",
 }
 
 __version__ = "1.0.0"
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次组装峰值内存测试
+对比优化前（逐张 float32 转换 + torch.cat）与预分配批次（uint8 直接写入 + 原地归一化）的峰值常驻内存。
+每种方式在独立子进程中运行，以 ru_maxrss 的增量作为峰值内存。
+
+用法: python benchmarks/bench_batch_memory.py [--width 4096] [--height 4096] [--count 4]
+"""
+
+import argparse
+import io
+import resource
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def make_corpus(width, height, count):
+    import numpy as np
+    from PIL import Image
+
+    corpus = []
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        small = rng.integers(0, 256, (height // 64, width // 64, 3), dtype=np.uint8)
+        img = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=90)
+        corpus.append(buf.getvalue())
+    return corpus
+
+
+def baseline(corpus):
+    """优化前的实现"""
+    import numpy as np
+    import torch
+    from PIL import Image
+
+    images = []
+    for data in corpus:
+        pil_image = Image.open(io.BytesIO(data)).convert("RGB")
+        np_image = np.array(pil_image, dtype=np.float32) / 255.0
+        images.append(torch.from_numpy(np_image).unsqueeze(0))
+    return torch.cat(images, dim=0)
+
+
+def preallocated(corpus):
+    import numpy as np
+    from PIL import Image
+    from core.image_loader import assemble_batch
+
+    pixels = [np.array(Image.open(io.BytesIO(data)).convert("RGB"), dtype=np.uint8) for data in corpus]
+    return assemble_batch(pixels)
+
+
+def max_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode, width, height, count):
+    import torch  # noqa: F401  预先导入，避免把torch自身的内存计入
+
+    corpus = make_corpus(width, height, count)
+    before = max_rss_mb()
+    batch = {"baseline": baseline, "preallocated": preallocated}[mode](corpus)
+    peak = max_rss_mb() - before
+    result_mb = batch.numel() * batch.element_size() / 1024 / 1024
+    print(f"{mode:<14} 峰值增量 {peak:8.1f} MB  (结果批次 {result_mb:.1f} MB, 形状 {tuple(batch.shape)})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4096)
+    parser.add_argument("--height", type=int, default=4096)
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--mode", choices=["baseline", "preallocated"])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_child(args.mode, args.width, args.height, args.count)
+        return
+
+    print("=" * 60)
+    print(f"{args.count} 张 {args.width}x{args.height} 图片批次组装峰值内存")
+    print("=" * 60)
+    for mode in ("baseline", "preallocated"):
+        subprocess.run([sys.executable, __file__, "--mode", mode,
+                        "--width", str(args.width), "--height", str(args.height),
+                        "--count", str(args.count)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解码基准测试：对样例图片逐个后端计时，并给出自动选择（ImageDecoder）的结果。
+可以用 --corpus 指定真实输出图片目录（jpg/png/webp），否则生成合成样例。
+
+用法: python benchmarks/bench_decode.py [--corpus DIR] [--size 2048] [--rounds 5]
+"""
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.image_decoder import ImageDecoder, _BACKEND_FACTORIES, detect_format
+
+
+def synthetic_corpus(size):
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (size // 32, size // 32, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((size, size), Image.Resampling.BICUBIC)
+    corpus = []
+    for fmt, kwargs in (("JPEG", {"quality": 90}), ("PNG", {}), ("WEBP", {"quality": 90})):
+        buf = io.BytesIO()
+        img.save(buf, fmt, **kwargs)
+        corpus.append((f"synthetic.{fmt.lower()}", buf.getvalue()))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
+            corpus.append((path.name, path.read_bytes()))
+    return corpus
+
+
+def time_decode(fn, data, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="样例图片目录")
+    parser.add_argument("--size", type=int, default=2048, help="合成样例边长")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.size)
+    backends = []
+    for name, factory in _BACKEND_FACTORIES.items():
+        try:
+            backends.append(factory())
+        except Exception as e:
+            print(f"跳过不可用的后端 {name}: {e}")
+    decoder = ImageDecoder()
+
+    print("=" * 60)
+    print(f"样例数: {len(corpus)}, 自动选择顺序: {[b.name for b in decoder.backends]}")
+    print("=" * 60)
+    for name, data in corpus:
+        fmt = detect_format(data)
+        line = [f"{name:<24} {fmt:<5}"]
+        for backend in backends:
+            if fmt in backend.formats:
+                line.append(f"{backend.name}={time_decode(backend.decode, data, args.rounds):7.1f}ms")
+        line.append(f"auto={time_decode(decoder.decode, data, args.rounds):7.1f}ms")
+        print("  ".join(line))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载基准测试：从"任务状态50"（拿到图片URL）到"张量批次就绪"的耗时
+使用本地HTTP服务器模拟CDN延迟，对比串行下载与并发下载。
+
+用法: python benchmarks/bench_download.py [--latency 0.3] [--size 2048] [--count 4]
+"""
+
+import argparse
+import io
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import requests
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.image_loader import ImageDownloader
+
+
+def make_image_bytes(size, seed):
+    rng = np.random.default_rng(seed)
+    # 低频噪声更接近真实图片的压缩率
+    small = rng.integers(0, 256, (size // 32, size // 32, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((size, size), Image.Resampling.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, "WEBP", quality=90)
+    return buf.getvalue()
+
+
+def start_server(images, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            idx = int(self.path.strip("/").split(".")[0])
+            time.sleep(latency)
+            body = images[idx]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/webp")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serial_baseline(urls):
+    """优化前的实现：逐张下载并解码"""
+    images = []
+    for url in urls:
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        pil_image = Image.open(io.BytesIO(response.content)).convert("RGB")
+        np_image = np.array(pil_image, dtype=np.float32) / 255.0
+        images.append(torch.from_numpy(np_image).unsqueeze(0))
+    return torch.cat(images, dim=0)
+
+
+def concurrent_download(urls, downloader):
+    return downloader.download(urls)
+
+
+def bench(name, fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        batch = fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{name:<12} 中位数 {timings[len(timings) // 2] * 1000:8.1f} ms  "
+          f"最快 {timings[0] * 1000:8.1f} ms  批次形状 {tuple(batch.shape)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟CDN单次请求延迟(秒)")
+    parser.add_argument("--size", type=int, default=2048, help="图片边长")
+    parser.add_argument("--count", type=int, default=4, help="图片数量")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    images = [make_image_bytes(args.size, i) for i in range(args.count)]
+    server = start_server(images, args.latency)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/{i}.webp" for i in range(args.count)]
+
+    print("=" * 60)
+    print(f"{args.count} 张 {args.size}x{args.size} WebP, 模拟延迟 {args.latency * 1000:.0f} ms")
+    print("=" * 60)
+    downloader = ImageDownloader({"download": {"max_workers": args.count}})
+    bench("串行", lambda: serial_baseline(urls), args.rounds)
+    bench("并发", lambda: concurrent_download(urls, downloader), args.rounds)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入耗时基准测试：各入口模块在全新解释器中的导入时间，以及是否加载了 torch / numpy
+Web 服务器与命令行工具依赖的 core 模块不应加载 torch；单独导入 torch 的耗时作为对照，
+即优化前 core.api_client 在模块加载时导入 torch 需要额外付出的时间。
+
+用法: python benchmarks/bench_import.py [--repeat 5]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+TARGETS = [
+    ("core.api_client", "core.api_client"),
+    ("core.batch_runner", "core.batch_runner"),
+    ("web.server", "server"),
+    ("torch (对照)", "torch"),
+]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {web!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "torch": "torch" in sys.modules, "numpy": "numpy" in sys.modules}}))
+"""
+
+
+def measure(module: str) -> dict:
+    """在新的解释器中导入模块，返回耗时与已加载的重量级依赖"""
+    code = PROBE.format(root=str(ROOT), web=str(ROOT / "web"), module=module)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'模块':<20}{'中位耗时(ms)':>14}{'torch':>8}{'numpy':>8}")
+    for name, module in TARGETS:
+        try:
+            runs = [measure(module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<20}导入失败: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+            continue
+        elapsed = statistics.median(run["elapsed"] for run in runs) * 1000
+        print(f"{name:<20}{elapsed:>14.1f}{str(runs[0]['torch']):>8}{str(runs[0]['numpy']):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多账号并发压力测试：验证并发请求各自使用绑定账号的cookie签名
+本地HTTP服务器回显请求cookie中的sessionid，多个线程分别绑定不同账号并发发送请求，
+统计回显的sessionid与绑定账号不一致的次数。
+
+用法: python benchmarks/stress_accounts.py [--accounts 20] [--threads 40] [--requests 50]
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.token_manager import TokenManager
+from core.api_client import ApiClient
+
+
+def start_echo_server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            cookies = dict(part.split("=", 1) for part in self.headers.get("cookie", "").split("; ") if "=" in part)
+            body = json.dumps({"ret": "0", "data": {"sessionid": cookies.get("sessionid", "")}}).encode()
+            # 随机延迟让不同账号的请求交错
+            time.sleep(random.random() * 0.005)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def worker(api_client, account_index, count, use_context):
+    """绑定一个账号连续发送请求，返回签名错误的次数"""
+    token_manager = api_client.token_manager
+    expected = token_manager.accounts[account_index]["sessionid"]
+    url = f"{api_client.base_url}/mweb/v1/echo"
+    mismatches = 0
+    for _ in range(count):
+        if use_context:
+            with token_manager.use_account(account_index):
+                result = api_client._send_request("POST", url, json={})
+        else:
+            # 旧用法：切换全局当前账号后发送请求
+            token_manager.switch_to_account(account_index)
+            result = api_client._send_request("POST", url, json={})
+        if not result or result["data"]["sessionid"] != expected:
+            mismatches += 1
+    return mismatches
+
+
+def run(api_client, args, use_context):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        futures = [executor.submit(worker, api_client, i % args.accounts, args.requests, use_context)
+                   for i in range(args.threads)]
+        mismatches = sum(f.result() for f in futures)
+    elapsed = time.perf_counter() - start
+    total = args.threads * args.requests
+    name = "use_account" if use_context else "switch_to_account"
+    print(f"{name:<18} 请求 {total:6d}  账号错配 {mismatches:6d}  耗时 {elapsed:6.2f} s")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=20, help="账号数量")
+    parser.add_argument("--threads", type=int, default=40, help="并发线程数")
+    parser.add_argument("--requests", type=int, default=50, help="每个线程的请求数")
+    args = parser.parse_args()
+
+    # 关闭请求日志，避免输出淹没结果
+    logging.disable(logging.CRITICAL)
+
+    server = start_echo_server()
+    # 关闭限流，只验证签名账号是否正确
+    config = {"accounts": [{"sessionid": f"session-{i:03d}", "description": f"账号{i + 1}"}
+                           for i in range(args.accounts)],
+              "rate_limit": {"enabled": False}}
+    api_client = ApiClient(TokenManager(config), config)
+    api_client.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print("=" * 60)
+    print(f"{args.accounts} 个账号, {args.threads} 个并发线程")
+    print("=" * 60)
+    run(api_client, args, use_context=False)
+    mismatches = run(api_client, args, use_context=True)
+    server.shutdown()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+多账号调度
+把并发的生成任务分散到所有已配置的账号上。每个账号按以下信号打分，分数最低者优先：
+积分快照、进行中的任务数、近期失败次数、上游排队长度；命中风控/登录失效码的账号进入冷却期。
+
+准入控制：acquire 时按预估消耗预留积分，可用积分 = 积分快照 - 进行中任务的预留。
+积分未知（尚未查询或最近一次查询失败）的账号排在有积分快照的账号之后，且同一时间只放行一个任务。
+会透支的任务改派到其他账号或直接拒绝；提交成功后 commit 把预留转为本地扣减，
+未提交/提交失败的任务在 release 时归还预留。
+
+调度器在进程内共享（get_account_scheduler），所有节点实例与 Web 服务器的进行中任务数、预留互相可见；
+账号状态按账号键（sessionid 摘要）保存，账号增删导致索引变化时状态不会错位。
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 节点账号下拉中的自动调度选项
+AUTO_ACCOUNT = "自动调度"
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# 默认调度参数，可通过 config.json 的 scheduler 段覆盖
+DEFAULT_SCHEDULER_CONFIG = {
+    "max_inflight_per_account": 2,
+    # 这些返回码说明账号本身不可用（登录失效/风控），账号进入长冷却
+    "risk_codes": ["1015", "34010105"],
+    "risk_cooldown": 1800,
+    # 普通失败在统计窗口内累计，连续失败达到阈值后短暂冷却
+    "failure_window": 600,
+    "failure_threshold": 3,
+    "failure_cooldown": 120,
+    # 打分权重
+    "inflight_weight": 10.0,
+    "failure_weight": 5.0,
+    "queue_weight": 0.1,
+    "credit_weight": 0.05,
+    "credit_cap": 200,
+    # 积分未知的账号额外加分（分数越低越优先），应大于 credit_cap × credit_weight
+    "unknown_credit_penalty": 20.0,
+    # 指定账号的积分不足以覆盖预留时，改派到其他账号（False 则直接拒绝）
+    "reroute_on_overdraw": True
+}
+
+
+class AccountState:
+    """单个账号的调度状态"""
+
+    def __init__(self):
+        self.inflight = 0
+        self.failures: List[float] = []
+        self.cooldown_until = 0.0
+        self.queue_length = 0
+        self.last_acquired = 0.0
+        self.last_error = ""
+        # 已预留但尚未提交的积分
+        self.reserved = 0
+
+
+class AccountScheduler:
+    """按负载、积分与健康状况为每次生成选择账号"""
+
+    def __init__(self, token_manager, config: Optional[Dict[str, Any]] = None):
+        scheduler_config = dict(DEFAULT_SCHEDULER_CONFIG)
+        scheduler_config.update((config or {}).get("scheduler", {}))
+        self.config = scheduler_config
+        self.token_manager = token_manager
+        self.risk_codes = {str(code) for code in scheduler_config["risk_codes"]}
+        self._lock = threading.Lock()
+        self._states: Dict[str, AccountState] = {}
+
+    def bind(self, token_manager):
+        """切换到新的 TokenManager（账号增删后组件重建），已有的账号状态按账号键保留"""
+        with self._lock:
+            self.token_manager = token_manager
+
+    def _state(self, account_index: int) -> AccountState:
+        key = self.token_manager.get_account_key(account_index) or str(account_index)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = AccountState()
+        return state
+
+    def _credit_info(self, account_index: int) -> Optional[Dict[str, Any]]:
+        """可信的积分快照；没有快照或最近一次查询失败时返回None（积分未知）"""
+        credit_cache = self.token_manager.credit_cache
+        credit_info = credit_cache.get(account_index)
+        if credit_info is None or credit_cache.failed(account_index):
+            return None
+        return credit_info
+
+    def _score(self, account_index: int, state: AccountState, now: float) -> float:
+        cfg = self.config
+        credit_info = self._credit_info(account_index)
+        if credit_info is None:
+            credit_score = cfg["unknown_credit_penalty"]
+        else:
+            credit_score = -min(credit_info.get("total_credit", 0), cfg["credit_cap"]) * cfg["credit_weight"]
+        recent_failures = sum(1 for t in state.failures if now - t <= cfg["failure_window"])
+        return (state.inflight * cfg["inflight_weight"]
+                + recent_failures * cfg["failure_weight"]
+                + state.queue_length * cfg["queue_weight"]
+                + credit_score)
+
+    def _available_credit(self, account_index: int) -> Optional[int]:
+        """扣除预留后的可用积分；限免期返回None（不限制），积分未知时按0计算"""
+        credit_info = self._credit_info(account_index)
+        if credit_info and credit_info.get("is_free_period", False):
+            return None
+        total_credit = credit_info.get("total_credit", 0) if credit_info else 0
+        return total_credit - self._state(account_index).reserved
+
+    def _has_credit(self, account_index: int, required_credit: int) -> bool:
+        available = self._available_credit(account_index)
+        if available is None:
+            return True
+        if self._credit_info(account_index) is None:
+            # 积分未知时不排除该账号，但同一时间只放行一个任务，快照会在后台补齐
+            return self._state(account_index).reserved == 0
+        return available >= required_credit
+
+    def _choose(self, required_credit: int, now: float, exclude: Optional[int] = None) -> Optional[int]:
+        """在未冷却且可用积分足够的账号中选出分数最低的账号（调用方需持有锁）"""
+        candidates = [i for i, account in enumerate(self.token_manager.accounts)
+                      if i != exclude
+                      and account.get("sessionid")
+                      and self._state(i).cooldown_until <= now
+                      and self._has_credit(i, required_credit)]
+        if not candidates:
+            return None
+        # 优先选择未达并发上限的账号；全部满载时仍选负载最低的账号排队，而不是直接失败
+        limit = self.config["max_inflight_per_account"]
+        available = [i for i in candidates if self._state(i).inflight < limit] or candidates
+        return min(available, key=lambda i: (self._score(i, self._state(i), now), self._state(i).last_acquired))
+
+    def acquire(self, required_credit: int = 0, account_index: Optional[int] = None) -> Optional[int]:
+        """为一次生成选择账号，占用一个并发名额并预留预估积分
+        Args:
+            required_credit: 本次生成预估消耗的积分
+            account_index: 指定账号时不做选择；该账号可用积分不足时按 reroute_on_overdraw 改派或拒绝
+        Returns:
+            int: 账号索引，没有可用账号（或会透支）时返回None
+        """
+        now = time.time()
+        with self._lock:
+            if account_index is None:
+                account_index = self._choose(required_credit, now)
+                if account_index is None:
+                    logger.warning("[Dreamina] ⚠️ 没有可用的账号（均在冷却中或积分不足）")
+                    return None
+            elif required_credit and not self._has_credit(account_index, required_credit):
+                available = self._available_credit(account_index)
+                if not self.config["reroute_on_overdraw"]:
+                    logger.warning(f"[Dreamina] ⚠️ 账号{account_index + 1}可用积分{available}不足{required_credit}，拒绝提交")
+                    return None
+                rerouted = self._choose(required_credit, now, exclude=account_index)
+                if rerouted is None:
+                    logger.warning(f"[Dreamina] ⚠️ 账号{account_index + 1}可用积分{available}不足{required_credit}，"
+                                   f"且没有其他可用账号，拒绝提交")
+                    return None
+                logger.info(f"[Dreamina] 🔀 账号{account_index + 1}可用积分{available}不足{required_credit}，"
+                            f"改派到账号{rerouted + 1}")
+                account_index = rerouted
+            state = self._state(account_index)
+            state.inflight += 1
+            state.last_acquired = now
+            state.reserved += required_credit
+        logger.debug(f"[Dreamina] 调度到账号{account_index + 1}（进行中: {state.inflight}，预留: {state.reserved}）")
+        return account_index
+
+    def commit(self, account_index: int, amount: int):
+        """任务已提交：把预留转为积分缓存中的本地扣减（稍后与服务器对账）"""
+        with self._lock:
+            state = self._state(account_index)
+            state.reserved = max(0, state.reserved - amount)
+        self.token_manager.credit_cache.debit(account_index, amount)
+
+    def release(self, account_index: int, success: Optional[bool] = True, reserved_credit: int = 0):
+        """生成结束后释放并发名额，失败会计入近期失败统计
+        Args:
+            account_index: 账号索引
+            success: 是否成功，None 表示任务被取消（不影响失败统计）
+            reserved_credit: 仍未提交（未 commit）的预留积分，一并归还
+        """
+        now = time.time()
+        with self._lock:
+            state = self._state(account_index)
+            state.inflight = max(0, state.inflight - 1)
+            state.reserved = max(0, state.reserved - reserved_credit)
+            if success is None:
+                return
+            if success:
+                state.failures.clear()
+                return
+            window = self.config["failure_window"]
+            state.failures = [t for t in state.failures if now - t <= window] + [now]
+            if len(state.failures) >= self.config["failure_threshold"]:
+                state.cooldown_until = max(state.cooldown_until, now + self.config["failure_cooldown"])
+                logger.warning(f"[Dreamina] ⚠️ 账号{account_index + 1}近期连续失败{len(state.failures)}次，暂停调度")
+
+    @contextmanager
+    def lease(self, required_credit: int = 0, account_index: Optional[int] = None):
+        """acquire/release 的上下文管理器形式
+        块正常结束视为已提交（预留转为本地扣减）；块内抛出异常视为失败，归还预留。
+        """
+        index = self.acquire(required_credit, account_index)
+        success = False
+        try:
+            yield index
+            success = True
+        finally:
+            if index is not None:
+                if success:
+                    self.commit(index, required_credit)
+                self.release(index, success, 0 if success else required_credit)
+
+    def record_error(self, account_index: int, ret_code: str):
+        """记录接口返回的错误码，风控/登录失效码会让账号进入冷却"""
+        ret_code = str(ret_code)
+        if ret_code not in self.risk_codes:
+            return
+        with self._lock:
+            state = self._state(account_index)
+            state.cooldown_until = time.time() + self.config["risk_cooldown"]
+            state.last_error = ret_code
+        logger.warning(f"[Dreamina] ⚠️ 账号{account_index + 1}返回风控/登录失效码 {ret_code}，"
+                       f"冷却{self.config['risk_cooldown']}秒")
+
+    def record_queue(self, account_index: int, queue_length: int):
+        """记录账号最近一次看到的上游排队长度"""
+        with self._lock:
+            self._state(account_index).queue_length = max(0, int(queue_length or 0))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各账号的调度状态快照"""
+        now = time.time()
+        with self._lock:
+            result = []
+            for i in range(len(self.token_manager.accounts)):
+                state = self._state(i)
+                result.append({
+                    "account_index": i,
+                    "inflight": state.inflight,
+                    "recent_failures": sum(1 for t in state.failures if now - t <= self.config["failure_window"]),
+                    "cooldown_remaining": max(0, int(state.cooldown_until - now)),
+                    "queue_length": state.queue_length,
+                    "reserved": state.reserved,
+                    "last_error": state.last_error
+                })
+            return result
+
+    def budget(self) -> List[Dict[str, Any]]:
+        """各账号的积分预算：积分快照、进行中任务的预留、可用积分（None 表示限免期不限制）
+        积分未知的账号 total_credit 为None，可用积分按0计算。
+        """
+        with self._lock:
+            result = []
+            for i in range(len(self.token_manager.accounts)):
+                credit_info = self._credit_info(i)
+                result.append({
+                    "account_index": i,
+                    "total_credit": credit_info.get("total_credit") if credit_info else None,
+                    "credit_failed": self.token_manager.credit_cache.failed(i),
+                    "is_free_period": bool(credit_info and credit_info.get("is_free_period", False)),
+                    "reserved": self._state(i).reserved,
+                    "available": self._available_credit(i),
+                    "inflight": self._state(i).inflight
+                })
+            return result
+
+
+def get_account_scheduler(token_manager, config: Optional[Dict[str, Any]] = None) -> AccountScheduler:
+    """进程内共享的账号调度器，调度参数取首次调用时的 scheduler 配置
+    每次调用都绑定到传入的 TokenManager，使账号列表与最近一次初始化的组件一致。
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AccountScheduler(token_manager, config)
+        else:
+            _scheduler.bind(token_manager)
+        return _scheduler
@@ -7,20 +7,90 @@ import uuid
 import random
 import hashlib
 import hmac
+import sqlite3
 import binascii
 import datetime
+import functools
 import urllib.parse
-import torch
-import numpy as np
-from PIL import Image
+import threading
 import io
-from typing import Dict, Optional, Any, Tuple, List
+from typing import TYPE_CHECKING, Dict, Optional, Any, Tuple, List
 
 # 确保从同级目录导入
 from .token_manager import TokenManager
+from .account_scheduler import get_account_scheduler
+from . import deadline
+from .job_journal import JobJournal, PENDING_STATES, STATE_COMPLETED, STATE_FAILED, STATE_SUBMITTING
+
+if TYPE_CHECKING:
+    # torch 只在下载结果或处理张量时延迟导入，Web 服务器启动时不加载
+    import torch
 
 logger = logging.getLogger(__name__)
 
+# 结果图片的完整尺寸（large_images 原图）
+SCENE_FULL = "full"
+
+# get_history_by_ids 请求的图片尺寸档位，uniq_key 即调用方可以选择的 scene
+IMAGE_SCENE_LIST = [
+    {"scene": "normal", "width": 2400, "height": 2400, "uniq_key": "2400", "format": "webp"},
+    {"scene": "loss", "width": 1080, "height": 1080, "uniq_key": "1080", "format": "webp"},
+    {"scene": "loss", "width": 720, "height": 720, "uniq_key": "720", "format": "webp"},
+    {"scene": "loss", "width": 480, "height": 480, "uniq_key": "480", "format": "webp"},
+    {"scene": "loss", "width": 360, "height": 360, "uniq_key": "360", "format": "webp"}
+]
+
+# 节点/前端可选择的下载尺寸
+SCENE_OPTIONS = [SCENE_FULL] + [item["uniq_key"] for item in IMAGE_SCENE_LIST[:3]]
+
+# 业务接口的公共请求头，cookie/device-time/sign 在每次请求时填入
+REQUEST_HEADERS_TEMPLATE = {
+    'accept': 'application/json, text/plain, */*',
+    'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
+    'app-sdk-version': '48.0.0',
+    'appid': '513641',
+    'appvr': '5.8.0',
+    'content-type': 'application/json',
+    'lan': 'en',
+    'loc': 'US',
+    'origin': 'https://dreamina.capcut.com',
+    'pf': '7',
+    'priority': 'u=1, i',
+    'referer': 'https://dreamina.capcut.com/',
+    'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Microsoft Edge";v="138"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-site',
+    'sign-ver': '1',
+    'tdid': 'web',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+}
+
+# SigV4 派生签名密钥缓存容量，同一上传凭证在同一天内只需派生一次
+SIGNING_KEY_CACHE_SIZE = 64
+
+
+@functools.lru_cache(maxsize=SIGNING_KEY_CACHE_SIZE)
+def _derive_signing_key(secret_key, datestamp, region, service):
+    """派生AWS V4签名密钥（四次HMAC），按 (secret, date, region, service) 缓存"""
+    k_date = hmac.new(f"AWS4{secret_key}".encode('utf-8'), datestamp.encode('utf-8'), hashlib.sha256).digest()
+    k_region = hmac.new(k_date, region.encode('utf-8'), hashlib.sha256).digest()
+    k_service = hmac.new(k_region, service.encode('utf-8'), hashlib.sha256).digest()
+    return hmac.new(k_service, b'aws4_request', hashlib.sha256).digest()
+
+
+def bind_account(method):
+    """让提交/轮询方法接受 account_index 关键字参数，方法内的所有请求都使用该账号签名"""
+    @functools.wraps(method)
+    def wrapper(self, *args, account_index=None, **kwargs):
+        if account_index is None:
+            return method(self, *args, **kwargs)
+        with self.token_manager.use_account(account_index):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class ApiClient:
     def __init__(self, token_manager, config):
         self.token_manager = token_manager
@@ -29,49 +99,53 @@ class ApiClient:
         self.base_url = "https://mweb-api-sg.capcut.com"  # 改回正确的域名
         self.aid = "513641"  # 修改为成功的aid
         self.app_version = "5.8.0"
+        self._image_downloader = None
+        self._image_downloader_lock = threading.Lock()
+        # 进程内共享，所有节点与 Web 服务器看到同一份进行中任务数与预留
+        self.account_scheduler = get_account_scheduler(token_manager, config)
+        self.job_journal = JobJournal.from_config(config)
+
+    @property
+    def image_downloader(self):
+        """结果图片下载器，首次下载时才创建（会导入 torch）"""
+        if self._image_downloader is None:
+            with self._image_downloader_lock:
+                if self._image_downloader is None:
+                    from .image_loader import ImageDownloader
+                    self._image_downloader = ImageDownloader(self.config)
+        return self._image_downloader
 
-    def _get_headers(self, uri="/"):
-        """获取请求头"""
-        token_info = self.token_manager.get_token(uri)
+    def _get_headers(self, uri="/", account_index=None):
+        """获取请求头
+        静态字段来自 REQUEST_HEADERS_TEMPLATE，每次只填入 cookie、device-time、sign。
+        Args:
+            uri: API路径
+            account_index: 账号索引，未指定时使用当前上下文的账号
+        """
+        token_info = self.token_manager.get_token(uri, account_index, with_bogus=False)
         if not token_info:
             return {}
             
-        headers = {
-            'accept': 'application/json, text/plain, */*',
-            'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
-            'app-sdk-version': '48.0.0',
-            'appid': '513641',
-            'appvr': '5.8.0',
-            'content-type': 'application/json',
-            'cookie': token_info["cookie"],
-            'device-time': token_info["device_time"],
-            'lan': 'en',
-            'loc': 'US',
-            'origin': 'https://dreamina.capcut.com',
-            'pf': '7',
-            'priority': 'u=1, i',
-            'referer': 'https://dreamina.capcut.com/',
-            'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Microsoft Edge";v="138"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'sec-fetch-dest': 'empty',
-            'sec-fetch-mode': 'cors',
-            'sec-fetch-site': 'same-site',
-            'sign': token_info["sign"],
-            'sign-ver': '1',
-            'tdid': 'web',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
-        }
+        headers = dict(REQUEST_HEADERS_TEMPLATE)
+        headers['cookie'] = token_info["cookie"]
+        headers['device-time'] = token_info["device_time"]
+        headers['sign'] = token_info["sign"]
         return headers
 
-    def _send_request(self, method, url, **kwargs):
-        """发送HTTP请求"""
+    def _send_request(self, method, url, account_index=None, dedupe=None, **kwargs):
+        """发送HTTP请求
+        Args:
+            account_index: 签名使用的账号索引，未指定时使用当前上下文的账号
+            dedupe: 提交请求结果未知时的查重回调，返回已存在的结果时不再重复提交
+        """
+        if account_index is None:
+            account_index = self.token_manager.current_account_index
         try:
             # 获取URI
             uri = url.split(self.base_url)[-1].split('?')[0]
             
             # 获取headers
-            headers = self._get_headers(uri)
+            headers = self._get_headers(uri, account_index)
             
             # 如果kwargs中有headers，合并它们
             if 'headers' in kwargs:
@@ -83,8 +157,12 @@ class ApiClient:
             logger.debug(f"[Dreamina] 🔄 发送请求: {method} {uri}")
             
             try:
-                response = requests.request(method, url, timeout=30, **kwargs)
+                response = self.token_manager.request(method, url, account_index, dedupe=dedupe, **kwargs)
+                if isinstance(response, dict):
+                    return response
                 logger.debug(f"[Dreamina] ✅ HTTP请求发送成功")
+            except deadline.GenerationAborted:
+                raise
             except requests.exceptions.Timeout as e:
                 logger.error(f"[Dreamina] ❌ 请求超时: {e}")
                 return None
@@ -107,12 +185,15 @@ class ApiClient:
                 # 如果是错误响应，记录错误信息
                 if ret_code != '0':
                     logger.error(f"[Dreamina] ❌ API错误: {ret_code} - {err_msg}")
+                    self.account_scheduler.record_error(account_index, ret_code)
                 
                 return response_json
             except json.JSONDecodeError as e:
                 logger.error(f"[Dreamina] ❌ 响应不是有效的JSON: {e}")
                 return None
             
+        except deadline.GenerationAborted:
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"[Dreamina] ❌ 网络请求异常: {e}")
             return None
@@ -120,13 +201,112 @@ class ApiClient:
             logger.error(f"[Dreamina] ❌ 请求处理异常: {e}")
             return None
 
-    def generate_t2i(self, prompt: str, model: str, ratio: str, seed: int = -1):
+    def _lookup_submission(self, submit_id):
+        """按 submit_id 查询任务是否已被上游受理（提交结果未知时查重）
+        Returns:
+            dict: 已受理时返回与提交接口结构相同的响应；未查到返回None
+        Raises:
+            requests.exceptions.RequestException: 查询本身失败，无法确认是否已提交
+        """
+        url = f"{self.base_url}/mweb/v1/get_history_by_ids"
+        params = {
+            "aid": self.aid,
+            "device_platform": "web",
+            "region": "US",
+            "da_version": "3.2.8",
+            "web_version": "6.6.0",
+            "aigc_features": "app_lip_sync"
+        }
+        data = {
+            "submit_ids": [submit_id],
+            "image_info": self._build_image_info()
+        }
+        result = self._send_request("POST", url, params=params, json=data)
+        if not result or result.get("ret") != "0":
+            raise requests.exceptions.RequestException(f"按 submit_id 查重失败: {submit_id}")
+
+        history_data = result.get("data", {}).get(submit_id)
+        if not history_data:
+            return None
+        history_id = history_data.get("history_record_id") or history_data.get("history_id")
+        logger.info(f"[Dreamina] 🔍 submit_id={submit_id} 已被受理 (ID: {history_id})")
+        return {"ret": "0", "data": {"aigc_data": {"history_record_id": history_id}}}
+
+    def _submit_generate(self, url, params, data, kind, job_params=None):
+        """幂等提交生成任务
+        发送前按 submit_id 写入任务日志；同一 submit_id 已被受理时直接复用原任务，
+        提交结果未知时按 submit_id 查重，避免重复生成和重复扣费。
+        Args:
+            url: 生成接口URL
+            params: 查询参数
+            data: 请求体，submit_id 取自 data["submit_id"]
+            kind: 任务类型（t2i / i2i），记录在任务日志中
+            job_params: 记录在任务日志中的生成参数
+        Returns:
+            dict: 提交接口响应（复用原任务时为结构相同的响应）；结果未知或请求失败返回None
+        """
+        submit_id = data["submit_id"]
+        job = self.job_journal.get(submit_id)
+        if job and job["state"] == STATE_SUBMITTING:
+            # 上次提交的结果未知（如等待响应时进程退出），先查重再决定是否提交
+            try:
+                existing = self._lookup_submission(submit_id)
+            except deadline.GenerationAborted:
+                raise
+            except requests.exceptions.RequestException as e:
+                logger.error(f"[Dreamina] ❌ 无法确认任务是否已提交，暂不重复提交: {e}")
+                return None
+            if existing:
+                self.job_journal.mark_submitted(submit_id, existing["data"]["aigc_data"]["history_record_id"])
+                job = self.job_journal.get(submit_id)
+
+        if job and job["history_id"]:
+            logger.info(f"[Dreamina] 🔁 submit_id={submit_id} 已提交过，复用原任务 (ID: {job['history_id']})")
+            return {"ret": "0", "data": {"aigc_data": {"history_record_id": job["history_id"]}}}
+
+        self.job_journal.record_submit(submit_id, kind, self.token_manager.current_account_index, job_params)
+        response = self._send_request("POST", url, params=params, json=data,
+                                      dedupe=lambda: self._lookup_submission(submit_id))
+        if response and response.get("ret") == "0":
+            history_id = response.get("data", {}).get("aigc_data", {}).get("history_record_id")
+            self.job_journal.mark_submitted(submit_id, history_id)
+        elif response:
+            # 上游明确拒绝，任务未创建，同一 submit_id 之后可以重新提交
+            self.job_journal.mark_finished(submit_id, STATE_FAILED,
+                                           {"ret": response.get("ret"), "errmsg": response.get("errmsg")})
+        # 没有响应时结果未知，保持 submitting 状态，下次提交同一 submit_id 时先查重
+        return response
+
+    def _record_job_outcome(self, result, submit_id=None, history_id=None):
+        """轮询到终态时更新任务日志（不在日志中的任务忽略，日志写入失败不影响轮询）
+        Args:
+            result: 轮询结果，URL列表表示完成，含 failed/blocked 的字典表示失败
+            submit_id: 按提交ID查找任务
+            history_id: 按历史ID查找任务
+        """
+        try:
+            job = self.job_journal.get(submit_id) if submit_id else self.job_journal.find_by_history_id(history_id)
+            if not job or job["state"] not in PENDING_STATES:
+                return
+            if isinstance(result, list) and result:
+                self.job_journal.mark_finished(job["submit_id"], STATE_COMPLETED, result)
+            elif isinstance(result, dict) and (result.get("failed") or result.get("blocked")):
+                self.job_journal.mark_finished(job["submit_id"], STATE_FAILED, result)
+        except sqlite3.Error as e:
+            logger.warning(f"[Dreamina] ⚠️ 更新任务日志失败: {e}")
+
+    @bind_account
+    def generate_t2i(self, prompt: str, model: str, ratio: str, seed: int = -1, scene: Optional[str] = None,
+                     submit_id: Optional[str] = None, resolution: Optional[str] = None):
         """处理文生图请求 - 更新为最新API格式
         Args:
             prompt: 提示词
             model: 模型名称
             ratio: 图片比例
             seed: 随机种子
+            scene: 返回的图片尺寸档位（见 SCENE_OPTIONS），默认原图
+            submit_id: 客户端生成的提交ID，重试时传入同一ID不会重复生成
+            resolution: 分辨率类型（1k/2k/4k），默认使用配置中的 resolution_type / ratios
         Returns:
             dict: 包含生成的图片URL列表
         """
@@ -136,8 +316,9 @@ class ApiClient:
                 logger.error("[Dreamina] ❌ SessionID验证失败，请检查账号配置")
                 return None
                 
-            # 获取图片尺寸
-            width, height = self._get_ratio_dimensions(ratio)
+            # 获取本次请求的分辨率与图片尺寸
+            resolution_type, ratios = self._resolve_resolution(resolution)
+            width, height = self._get_ratio_dimensions(ratio, ratios)
             
             # 生成随机种子，确保在合理范围内
             if seed == -1:
@@ -145,8 +326,8 @@ class ApiClient:
             # 确保用户提供的种子在合理范围内
             seed = max(1, min(seed, 999999999))
             
-            # 生成提交ID
-            submit_id = str(uuid.uuid4())
+            # 生成提交ID（调用方传入时沿用，保证重试幂等）
+            submit_id = submit_id or str(uuid.uuid4())
             
             # 准备请求数据 - 使用最新API格式
             url = f"{self.base_url}/mweb/v1/aigc_draft/generate"
@@ -169,7 +350,7 @@ class ApiClient:
             logger.info(f"[Dreamina] 📋 使用模型: {model} -> {model_req_key}")
             
             # 获取比例值
-            ratio_value = self._get_ratio_value(ratio)
+            ratio_value = self._get_ratio_value(ratio, ratios)
             
             # 构建草稿内容 - 使用最新格式
             # 重要：main_component_id和component_list中的id必须相同
@@ -217,7 +398,7 @@ class ApiClient:
                                     "id": str(uuid.uuid4()),
                                     "height": height,
                                     "width": width,
-                                    "resolution_type": self.config.get("params", {}).get("resolution_type", "2k")
+                                    "resolution_type": resolution_type
                                 },
                                 "intelligent_ratio": False
                             }
@@ -270,7 +451,9 @@ class ApiClient:
             logger.debug(f"[Dreamina]   - 提交ID: {submit_id}")
             
             # 发送生成请求
-            response = self._send_request("POST", url, params=params, json=data)
+            response = self._submit_generate(url, params, data, "t2i",
+                                             {"prompt": prompt, "model": model, "ratio": ratio, "seed": seed, "scene": scene,
+                                              "resolution": resolution_type})
             
             if not response or response.get("ret") != "0":
                 logger.error(f"[Dreamina] ❌ 文生图请求失败")
@@ -293,7 +476,7 @@ class ApiClient:
             logger.debug(f"[Dreamina]   - 预估积分消耗: {forecast_cost}")
             
             # 立即检查一次状态 - 使用原始的submit_id查询
-            first_check_result = self._get_generated_images(submit_id)
+            first_check_result = self._get_generated_images(submit_id, scene)
             if first_check_result:
                 logger.info("[Dreamina] ✅ 文生图生成完成，无需等待")
                 return {"urls": first_check_result, "history_record_id": history_id, "submit_id": submit_id}
@@ -301,14 +484,25 @@ class ApiClient:
             # 返回submit_id用于后续查询，history_record_id用于记录
             return {"urls": [], "history_record_id": history_id, "submit_id": submit_id}
             
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] ❌ 文生图生成异常: {e}")
             import traceback
             logger.error(f"[Dreamina] 详细错误信息: {traceback.format_exc()}")
             return None
 
-    def generate_i2i(self, image: torch.Tensor, prompt: str, model: str, ratio: str, seed: int, num_images: int = 4) -> Tuple[torch.Tensor, str, str]:
-        """处理图生图请求"""
+    @bind_account
+    def generate_i2i(self, image: "torch.Tensor", prompt: str, model: str, ratio: str, seed: int, num_images: int = 4,
+                     dtype: Optional["torch.dtype"] = None, scene: Optional[str] = None,
+                     submit_id: Optional[str] = None, resolution: Optional[str] = None) -> Tuple["torch.Tensor", str, str]:
+        """处理图生图请求
+        Args:
+            dtype: 输出图片批次的浮点精度，默认 float32
+            scene: 下载的图片尺寸档位（见 SCENE_OPTIONS），默认原图
+            submit_id: 客户端生成的提交ID，重试时传入同一ID不会重复生成
+            resolution: 分辨率类型（1k/2k/4k），默认使用配置中的 resolution_type / ratios
+        """
         try:
             if not self.token_manager:
                 return self._create_error_result("插件未正确初始化，请检查后台日志。")
@@ -326,19 +520,27 @@ class ApiClient:
                     images=image,
                     prompt=prompt,
                     model=model,
-                    ratio=ratio
+                    ratio=ratio,
+                    scene=scene,
+                    submit_id=submit_id,
+                    resolution=resolution
                 )
                 input_image_path = None
             else:
-                # 单图流程：先保存临时文件再上传
-                input_image_path = self._save_input_image(image)
-                if not input_image_path:
+                # 单图流程：张量先保存为临时文件再上传，传入的是文件路径时直接上传
+                reference_path = self._save_input_image(image)
+                if not reference_path:
                     return self._create_error_result("保存输入图像失败。")
+                # 只清理本方法创建的临时文件，调用方传入的文件由调用方管理
+                input_image_path = None if isinstance(image, str) else reference_path
                 result = self.upload_image_and_generate_with_reference(
-                    image_path=input_image_path,
+                    image_path=reference_path,
                     prompt=prompt,
                     model=model,
-                    ratio=ratio
+                    ratio=ratio,
+                    scene=scene,
+                    submit_id=submit_id,
+                    resolution=resolution
                 )
             
             if not result:
@@ -357,8 +559,8 @@ class ApiClient:
                 max_retries = max_wait_time // check_interval
                 
                 for attempt in range(max_retries):
-                    time.sleep(check_interval)
-                    res = self._get_generated_images_by_history_id(history_id)
+                    deadline.sleep(check_interval)
+                    res = self._get_generated_images_by_history_id(history_id, scene)
                     # 若网页端拒绝（如 fail_code=1180），立即结束
                     if isinstance(res, dict) and res.get("blocked"):
                         return self._create_error_result(f"网页端拒绝生成: fail_code={res.get('fail_code')}, msg={res.get('fail_msg')}")
@@ -367,12 +569,11 @@ class ApiClient:
                         return self._create_error_result(f"网页端返回失败: fail_code={res.get('fail_code')}, msg={res.get('fail_msg')}")
                     if isinstance(res, list) and res:
                         urls_to_download = res
-                        images = self._download_images(urls_to_download)
-                        if not images:
+                        image_batch = self._download_images(urls_to_download, dtype)
+                        if image_batch is None:
                             return self._create_error_result("下载图片失败，可能链接已失效。")
                         
-                        image_batch = torch.cat(images, dim=0)
-                        generation_info = self._generate_info_text(prompt, model, ratio, len(images))
+                        generation_info = self._generate_info_text(prompt, model, ratio, image_batch.shape[0])
                         image_urls_text = "\n".join(urls_to_download)
                         
                         # 清理临时文件
@@ -406,10 +607,10 @@ class ApiClient:
                 max_retries = max_wait_time // check_interval
                 
                 for attempt in range(max_retries):
-                    time.sleep(check_interval)
+                    deadline.sleep(check_interval)
                     logger.info(f"[Dreamina] 🔍 检查生成状态... ({attempt + 1}/{max_retries})")
                     
-                    res = self._get_generated_images_by_history_id(history_id)
+                    res = self._get_generated_images_by_history_id(history_id, scene)
                     # 若网页端拒绝（如 fail_code=1180），立即结束
                     if isinstance(res, dict) and res.get("blocked"):
                         return self._create_error_result(f"网页端拒绝生成: fail_code={res.get('fail_code')}, msg={res.get('fail_msg')}")
@@ -419,12 +620,11 @@ class ApiClient:
                     if isinstance(res, list) and res:
                         logger.info(f"[Dreamina] ✅ 图片生成完成，获取到{len(res)}张图片")
                         urls_to_download = res
-                        images = self._download_images(urls_to_download)
-                        if not images:
+                        image_batch = self._download_images(urls_to_download, dtype)
+                        if image_batch is None:
                             return self._create_error_result("下载图片失败，可能链接已失效。")
                         
-                        image_batch = torch.cat(images, dim=0)
-                        generation_info = self._generate_info_text(prompt, model, ratio, len(images))
+                        generation_info = self._generate_info_text(prompt, model, ratio, image_batch.shape[0])
                         image_urls_text = "\n".join(urls_to_download)
                         
                         # 清理临时文件
@@ -442,12 +642,11 @@ class ApiClient:
                 return self._create_error_result("API未返回图片URL。")
             
             urls_to_download = urls
-            images = self._download_images(urls_to_download)
-            if not images:
+            image_batch = self._download_images(urls_to_download, dtype)
+            if image_batch is None:
                 return self._create_error_result("下载图片失败，可能链接已失效。")
             
-            image_batch = torch.cat(images, dim=0)
-            generation_info = self._generate_info_text(prompt, model, ratio, len(images))
+            generation_info = self._generate_info_text(prompt, model, ratio, image_batch.shape[0])
             image_urls = "\n".join(urls_to_download)
 
             # 清理临时文件
@@ -457,22 +656,42 @@ class ApiClient:
             except Exception as e:
                 logger.warning(f"[Dreamina] 清理临时文件失败: {e}")
 
-            logger.debug(f"[Dreamina] 成功生成 {len(images)} 张图片。")
+            logger.debug(f"[Dreamina] 成功生成 {image_batch.shape[0]} 张图片。")
             return (image_batch, generation_info, image_urls, history_id)
             
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.exception(f"[Dreamina] 生成图片时发生意外错误")
             return self._create_error_result(f"发生未知错误: {e}")
 
-    def _get_ratio_value(self, ratio: str) -> int:
+    def _resolve_resolution(self, resolution: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """返回本次请求使用的分辨率类型与比例配置，不修改共享的配置
+        Args:
+            resolution: 分辨率类型（1k/2k/4k），None 时使用配置中的 resolution_type / ratios
+        Returns:
+            tuple: (分辨率类型, {比例: 尺寸配置})
+        """
+        params = self.config.get("params", {})
+        if resolution is None:
+            return params.get("resolution_type", "2k"), params.get("ratios", {})
+        ratios = params.get(f"{resolution}_ratios")
+        if ratios is None:
+            logger.warning(f"[Dreamina] ⚠️ 未找到 {resolution}_ratios，使用默认 2k_ratios")
+            ratios = params.get("2k_ratios", {})
+        return resolution, ratios
+
+    def _get_ratio_value(self, ratio: str, ratios: Optional[Dict[str, Any]] = None) -> int:
         """将比例字符串转换为数值
         Args:
             ratio: 比例字符串，如 "4:3"
+            ratios: 比例配置，默认使用配置中的 ratios
         Returns:
             int: 比例对应的数值
         """
         # 从配置文件读取正确的ratio_type
-        ratios = self.config.get("params", {}).get("ratios", {})
+        if ratios is None:
+            ratios = self.config.get("params", {}).get("ratios", {})
         ratio_config = ratios.get(ratio)
         
         if ratio_config and "ratio_type" in ratio_config:
@@ -495,14 +714,16 @@ class ApiClient:
         logger.debug(f"[Dreamina] 配置中未找到比例{ratio}，使用备用映射: ratio_type={ratio_type}")
         return ratio_type
 
-    def _get_ratio_dimensions(self, ratio):
+    def _get_ratio_dimensions(self, ratio, ratios=None):
         """获取指定比例的图片尺寸
         Args:
             ratio: 图片比例，如 "1:1", "16:9", "9:16" 等
+            ratios: 比例配置，默认使用配置中的 ratios
         Returns:
             tuple: (width, height)
         """
-        ratios = self.config.get("params", {}).get("ratios", {})
+        if ratios is None:
+            ratios = self.config.get("params", {}).get("ratios", {})
         ratio_config = ratios.get(ratio)
         
         if not ratio_config:
@@ -581,7 +802,7 @@ class ApiClient:
             }
             
             logger.info("[Dreamina] 🔍 正在获取上传token...")
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = self.token_manager.request("POST", url, headers=headers, json=data)
             
             if response.status_code != 200:
                 logger.error(f"[Dreamina] 获取上传token失败，HTTP状态码: {response.status_code}")
@@ -600,6 +821,8 @@ class ApiClient:
             logger.info("[Dreamina] ✅ 上传token获取成功")
             return upload_data
             
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] 获取上传token时发生异常: {e}")
             return None
@@ -677,7 +900,7 @@ class ApiClient:
             
             url = f'https://imagex-normal-sg.capcutapi.com/?{canonical_querystring}'
             
-            response = requests.get(url, headers=headers)
+            response = self.token_manager.request("GET", url, headers=headers)
             if response.status_code != 200:
                 logger.error(f"[Dreamina] Failed to get upload authorization: {response.text}")
                 return None
@@ -708,7 +931,7 @@ class ApiClient:
                 'referer': 'https://mweb-api-sg.capcut.com/'
             }
             
-            response = requests.post(url, headers=headers, data=content)
+            response = self.token_manager.request("POST", url, headers=headers, data=content)
             if response.status_code != 200:
                 logger.error(f"[Dreamina] Failed to upload image: {response.text}")
                 return None
@@ -768,7 +991,7 @@ class ApiClient:
             }
             
             commit_url = "https://imagex-normal-sg.capcutapi.com"
-            response = requests.post(f"{commit_url}?{canonical_querystring}", headers=headers, data=payload)
+            response = self.token_manager.request("POST", f"{commit_url}?{canonical_querystring}", headers=headers, data=payload)
             if response.status_code != 200:
                 logger.error(f"[Dreamina] Failed to commit upload: {response.text}")
                 return None
@@ -781,6 +1004,8 @@ class ApiClient:
             # 返回图片URI
             return store_uri
             
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] Error uploading image: {e}")
             return None
@@ -853,19 +1078,25 @@ class ApiClient:
             logger.error(f"[Dreamina] Error getting image description: {e}")
             return ""
 
-    def upload_image_and_generate_with_reference(self, image_path, prompt, model="3.0", ratio="1:1"):
+    @bind_account
+    def upload_image_and_generate_with_reference(self, image_path, prompt, model="3.0", ratio="1:1", scene=None,
+                                                 submit_id=None, resolution=None):
         """上传参考图并生成新图片
         Args:
             image_path: 参考图片路径
             prompt: 提示词
             model: 模型名称
             ratio: 图片比例
+            scene: 返回的图片尺寸档位
+            submit_id: 客户端生成的提交ID，重试时传入同一ID不会重复生成
+            resolution: 分辨率类型（1k/2k/4k），默认使用配置中的 resolution_type / ratios
         Returns:
             dict: 包含生成的图片URL列表
         """
         try:
-            # 获取图片尺寸
-            width, height = self._get_ratio_dimensions(ratio)
+            # 获取本次请求的分辨率与图片尺寸
+            resolution_type, ratios = self._resolve_resolution(resolution)
+            width, height = self._get_ratio_dimensions(ratio, ratios)
             
             # 获取上传token
             upload_token = self._get_upload_token()
@@ -903,8 +1134,8 @@ class ApiClient:
             
             logger.info(f"[Dreamina] 📋 图生图使用模型: {model} -> {model_req_key}")
             
-            # 准备请求参数
-            submit_id = str(uuid.uuid4())
+            # 准备请求参数（调用方传入 submit_id 时沿用，保证重试幂等）
+            submit_id = submit_id or str(uuid.uuid4())
             draft_id = str(uuid.uuid4())
             component_id = str(uuid.uuid4())
             
@@ -945,13 +1176,13 @@ class ApiClient:
                                 "model": model_req_key,
                                 "prompt": f"##{prompt}",
                                 "sample_strength": 0.5,
-                                "image_ratio": self._get_ratio_value(ratio),
+                                "image_ratio": self._get_ratio_value(ratio, ratios),
                                 "large_image_info": {
                                     "type": "",
                                     "id": str(uuid.uuid4()),
                                     "height": height,
                                     "width": width,
-                                    "resolution_type": self.config.get("params", {}).get("resolution_type", "2k")
+                                    "resolution_type": resolution_type
                                 },
                                 "intelligent_ratio": False
                             },
@@ -998,7 +1229,7 @@ class ApiClient:
             logger.debug(f"[Dreamina] - draft_id: {draft_id}")
             logger.debug(f"[Dreamina] - component_id: {component_id}")
             logger.debug(f"[Dreamina] - image_uri: {image_uri}")
-            logger.debug(f"[Dreamina] - image_ratio: {self._get_ratio_value(ratio)}")
+            logger.debug(f"[Dreamina] - image_ratio: {self._get_ratio_value(ratio, ratios)}")
             logger.debug(f"[Dreamina] - large_image_info: {width}x{height}")
             
             # 准备请求数据 - 使用最新的API格式
@@ -1055,7 +1286,9 @@ class ApiClient:
             logger.debug(f"[Dreamina] Headers: {json.dumps(headers, indent=2, ensure_ascii=False)}")
             
             # 发送生成请求
-            response = self._send_request("POST", url, params=params, json=data)
+            response = self._submit_generate(url, params, data, "i2i",
+                                             {"prompt": prompt, "model": model, "ratio": ratio, "scene": scene,
+                                              "resolution": resolution_type})
             
             if not response or response.get("ret") != "0":
                 logger.error(f"[Dreamina] Failed to generate image with reference: {response}")
@@ -1084,7 +1317,7 @@ class ApiClient:
             check_interval = timeout_config.get("check_interval", 10)  # 默认10秒间隔
             
             # 立即获取一次状态，检查排队信息
-            first_check_result = self._get_generated_images_by_history_id(history_id)
+            first_check_result = self._get_generated_images_by_history_id(history_id, scene)
             queue_info = self._get_queue_info_from_response(history_id)
             
             # 如果有排队信息且图片未生成完成，立即返回排队信息
@@ -1103,23 +1336,31 @@ class ApiClient:
             
             return {"urls": [], "history_record_id": history_id}
             
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] Error generating image with reference: {e}")
             return None
 
-    def upload_images_and_generate_with_references(self, images: List[torch.Tensor], prompt, model="3.0", ratio="1:1"):
+    @bind_account
+    def upload_images_and_generate_with_references(self, images: List["torch.Tensor"], prompt, model="3.0", ratio="1:1", scene=None,
+                                                   submit_id=None, resolution=None):
         """上传多张参考图并生成新图片（最多6张）
         Args:
             images: 参考图张量列表
             prompt: 提示词
             model: 模型名称
             ratio: 图片比例
+            scene: 返回的图片尺寸档位
+            submit_id: 客户端生成的提交ID，重试时传入同一ID不会重复生成
+            resolution: 分辨率类型（1k/2k/4k），默认使用配置中的 resolution_type / ratios
         Returns:
             dict: 包含生成的图片URL列表/排队信息
         """
         try:
-            # 获取图片尺寸
-            width, height = self._get_ratio_dimensions(ratio)
+            # 获取本次请求的分辨率与图片尺寸
+            resolution_type, ratios = self._resolve_resolution(resolution)
+            width, height = self._get_ratio_dimensions(ratio, ratios)
 
             # 获取上传token（一次，多图复用）
             upload_token = self._get_upload_token()
@@ -1127,7 +1368,7 @@ class ApiClient:
                 logger.error("[Dreamina] Failed to get upload token")
                 return None
 
-            # 逐张保存并上传
+            # 逐张保存并上传（只记录本方法创建的临时文件，调用方传入的文件路径不删除）
             image_paths = []
             image_uris = []
             for idx, tensor in enumerate(images[:6]):
@@ -1135,7 +1376,8 @@ class ApiClient:
                 if not path:
                     logger.error(f"[Dreamina] 第{idx+1}张参考图保存失败")
                     continue
-                image_paths.append(path)
+                if not isinstance(tensor, str):
+                    image_paths.append(path)
                 uri = self._upload_image(path, upload_token)
                 if not uri:
                     logger.error(f"[Dreamina] 第{idx+1}张参考图上传失败")
@@ -1171,7 +1413,7 @@ class ApiClient:
                 "uri": uri
             } for uri in image_uris]
 
-            submit_id = str(uuid.uuid4())
+            submit_id = submit_id or str(uuid.uuid4())
             draft_id = str(uuid.uuid4())
             component_id = str(uuid.uuid4())
 
@@ -1211,13 +1453,13 @@ class ApiClient:
                                 "model": model_req_key,
                                 "prompt": f"##{prompt}",
                                 "sample_strength": 0.5,
-                                "image_ratio": self._get_ratio_value(ratio),
+                                "image_ratio": self._get_ratio_value(ratio, ratios),
                                 "large_image_info": {
                                     "type": "",
                                     "id": str(uuid.uuid4()),
                                     "height": height,
                                     "width": width,
-                                    "resolution_type": self.config.get("params", {}).get("resolution_type", "2k")
+                                    "resolution_type": resolution_type
                                 },
                                 "intelligent_ratio": False
                             },
@@ -1274,7 +1516,10 @@ class ApiClient:
             }
 
             logger.info(f"[Dreamina] 发送多参考图生图请求, 数量: {len(image_uris)}")
-            response = self._send_request("POST", url, params=params, json=data)
+            response = self._submit_generate(url, params, data, "i2i",
+                                             {"prompt": prompt, "model": model, "ratio": ratio, "scene": scene,
+                                              "resolution": resolution_type,
+                                              "reference_count": len(image_uris)})
             # 清理临时文件
             for p in image_paths:
                 try:
@@ -1296,7 +1541,7 @@ class ApiClient:
 
             logger.info(f"[Dreamina] 请求成功，history_id: {history_id}")
 
-            first_check_result = self._get_generated_images_by_history_id(history_id)
+            first_check_result = self._get_generated_images_by_history_id(history_id, scene)
             queue_info = self._get_queue_info_from_response(history_id)
             if queue_info and not first_check_result:
                 queue_msg = self._format_queue_message(queue_info)
@@ -1307,12 +1552,77 @@ class ApiClient:
                 return {"urls": first_check_result, "history_record_id": history_id}
 
             return {"urls": [], "history_record_id": history_id}
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] Error generating image with references: {e}")
             return None
 
-    def _get_generated_images(self, submit_id):
-        """通过提交ID获取生成的图片(文生图)，使用最新API格式"""
+    def _build_image_info(self):
+        """构建查询结果时携带的 image_info，服务端据此返回各尺寸档位的URL"""
+        return {
+            "width": 2048,
+            "height": 2048,
+            "format": "webp",
+            "image_scene_list": IMAGE_SCENE_LIST
+        }
+
+    def _extract_scene_variants(self, item):
+        """从 item_list 的单个条目中解析所有尺寸档位的图片URL
+        Args:
+            item: item_list 中的条目
+        Returns:
+            list: 每张图片一个字典，如 {"full": 原图URL, "2400": ..., "1080": ...}
+        """
+        image = item.get("image", {}) or {}
+        common_attr = item.get("common_attr", {}) or {}
+        scene_urls = {str(k): v for k, v in (common_attr.get("cover_url_map") or {}).items() if v}
+
+        full_urls = [large.get("image_url") for large in image.get("large_images", []) if large.get("image_url")]
+        if not full_urls and image.get("image_url"):
+            full_urls = [image["image_url"]]
+        # 备用方案：从common_attr获取封面图
+        if not full_urls and common_attr.get("cover_url"):
+            full_urls = [common_attr["cover_url"]]
+        return [dict(scene_urls, **{SCENE_FULL: url}) for url in full_urls]
+
+    def _select_scene_urls(self, variants, scene=None):
+        """按尺寸档位选择URL，缺少该档位时回退到原图
+        Args:
+            variants: _extract_scene_variants 返回的字典列表
+            scene: 尺寸档位，None 表示原图
+        Returns:
+            list: 图片URL列表
+        """
+        scene = str(scene) if scene else SCENE_FULL
+        return [variant.get(scene) or variant[SCENE_FULL] for variant in variants]
+
+    @bind_account
+    def _get_generated_images(self, submit_id, scene=None):
+        """通过提交ID获取生成的图片(文生图)
+        Args:
+            submit_id: 提交ID
+            scene: 尺寸档位（见 SCENE_OPTIONS），默认原图
+        Returns:
+            list: 图片URL列表；失败时返回包含 failed 的字典；未完成返回None
+        """
+        result = self._get_generated_image_variants(submit_id)
+        if isinstance(result, list):
+            return self._select_scene_urls(result, scene)
+        return result
+
+    @bind_account
+    def _get_generated_image_variants(self, submit_id):
+        """通过提交ID获取生成的图片(文生图)的所有尺寸档位，使用最新API格式
+        Returns:
+            list: 每张图片的尺寸档位字典；失败时返回包含 failed 的字典；未完成返回None
+        """
+        result = self._query_image_variants(submit_id)
+        self._record_job_outcome(result, submit_id=submit_id)
+        return result
+
+    def _query_image_variants(self, submit_id):
+        """查询提交ID对应任务的状态与各尺寸档位URL（见 _get_generated_image_variants）"""
         try:
             url = f"{self.base_url}/mweb/v1/get_history_by_ids"
             
@@ -1328,7 +1638,8 @@ class ApiClient:
             
             # 使用最新的请求数据格式 - 使用submit_id查询
             data = {
-                "submit_ids": [submit_id]
+                "submit_ids": [submit_id],
+                "image_info": self._build_image_info()
             }
             
             logger.debug(f"[Dreamina] 🔍 查询生成结果: submit_id={submit_id}")
@@ -1365,39 +1676,22 @@ class ApiClient:
             # 状态码50表示任务成功完成
             if task_status == 50:
                 logger.info(f"[Dreamina] ✅ 任务完成，解析图片URL")
-                image_urls = []
+                variants = []
 
-                # 从item_list中提取图片URL
+                # 从item_list中提取图片URL（含各尺寸档位）
                 item_list = history_data.get("item_list", [])
 
                 if item_list:
                     logger.debug(f"[Dreamina] 🖼️ 找到{len(item_list)}个生成的图片")
                     for i, item in enumerate(item_list):
-                        # 优先从image.large_images获取高质量图片
-                        image = item.get("image", {})
-                        large_images = image.get("large_images", [])
-
-                        if large_images:
-                            for j, large_image in enumerate(large_images):
-                                image_url = large_image.get("image_url")
-                                if image_url:
-                                    image_urls.append(image_url)
-                                    width = large_image.get("width", 0)
-                                    height = large_image.get("height", 0)
-                                    format_type = large_image.get("format", "unknown")
-                                    logger.debug(f"[Dreamina] ✅ 图片{i+1}: {width}x{height} {format_type}")
-
-                        # 备用方案：从common_attr获取封面图
-                        if not large_images:
-                            common_attr = item.get("common_attr", {})
-                            cover_url = common_attr.get("cover_url")
-                            if cover_url:
-                                image_urls.append(cover_url)
-                                logger.debug(f"[Dreamina] ✅ 备用图片{i+1}")
+                        item_variants = self._extract_scene_variants(item)
+                        variants.extend(item_variants)
+                        if item_variants:
+                            logger.debug(f"[Dreamina] ✅ 图片{i+1}: 可用尺寸 {sorted(item_variants[0].keys())}")
 
-                if image_urls:
-                    logger.info(f"[Dreamina] ✅ 获取到{len(image_urls)}个图片URL")
-                    return image_urls
+                if variants:
+                    logger.info(f"[Dreamina] ✅ 获取到{len(variants)}个图片URL")
+                    return variants
                 else:
                     logger.error("[Dreamina] ❌ 未找到任何图片URL")
                     return None
@@ -1416,19 +1710,29 @@ class ApiClient:
                     logger.debug(f"[Dreamina] ⏳ 任务状态: {task_status}")
                 return None
                 
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] ❌ 查询生成结果时发生异常: {e}")
             import traceback
             logger.error(f"[Dreamina] 详细错误信息: {traceback.format_exc()}")
             return None
 
-    def _get_generated_images_by_history_id(self, history_id):
+    @bind_account
+    def _get_generated_images_by_history_id(self, history_id, scene=None):
         """通过历史ID获取生成的图片
         Args:
             history_id: 历史ID
+            scene: 尺寸档位（见 SCENE_OPTIONS），默认原图
         Returns:
             list: 图片URL列表
         """
+        result = self._query_images_by_history_id(history_id, scene)
+        self._record_job_outcome(result, history_id=history_id)
+        return result
+
+    def _query_images_by_history_id(self, history_id, scene=None):
+        """查询历史ID对应任务的状态与图片URL（见 _get_generated_images_by_history_id）"""
         try:
             url = f"{self.base_url}/mweb/v1/get_history_by_ids"
             
@@ -1442,18 +1746,7 @@ class ApiClient:
             # 使用与成功的curl请求一致的参数结构
             data = {
                 "history_ids": [history_id],
-                "image_info": {
-                    "width": 2048,
-                    "height": 2048,
-                    "format": "webp",
-                    "image_scene_list": [
-                        {"scene": "normal", "width": 2400, "height": 2400, "uniq_key": "2400", "format": "webp"},
-                        {"scene": "loss", "width": 1080, "height": 1080, "uniq_key": "1080", "format": "webp"},
-                        {"scene": "loss", "width": 720, "height": 720, "uniq_key": "720", "format": "webp"},
-                        {"scene": "loss", "width": 480, "height": 480, "uniq_key": "480", "format": "webp"},
-                        {"scene": "loss", "width": 360, "height": 360, "uniq_key": "360", "format": "webp"}
-                    ]
-                }
+                "image_info": self._build_image_info()
             }
 
             
@@ -1487,6 +1780,15 @@ class ApiClient:
                 resources = history_data.get("resources", [])
                 draft_content = history_data.get("draft_content", "")
                 
+                # 请求了缩小尺寸时，优先从item_list中按档位选择（resources只提供原图）
+                if scene and str(scene) != SCENE_FULL:
+                    variants = []
+                    for item in history_data.get("item_list", []):
+                        variants.extend(self._extract_scene_variants(item))
+                    if variants:
+                        logger.info(f"[Dreamina] ✅ 获取到 {len(variants)} 个图片URL（尺寸: {scene}）。")
+                        return self._select_scene_urls(variants, scene)
+
                 if not resources:
                     logger.error("[Dreamina] 未找到资源数据")
                     return None
@@ -1560,10 +1862,13 @@ class ApiClient:
                 logger.info(f"[Dreamina] ⏳ 任务状态未知: {status}")
                 return None
                 
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] 检查生成状态时发生意外错误: {e}", exc_info=True)
             return None
 
+    @bind_account
     def _get_queue_info_from_response(self, history_id):
         """从API响应中获取排队信息"""
         try:
@@ -1596,6 +1901,8 @@ class ApiClient:
                 history_data = result.get('data', {}).get(history_id, {})
                 queue_info = history_data.get('queue_info', {})
                 if queue_info:
+                    self.account_scheduler.record_queue(self.token_manager.current_account_index,
+                                                        queue_info.get('queue_length', 0))
                     return queue_info
                 return None
                 
@@ -1659,11 +1966,8 @@ class ApiClient:
             credential_scope = f"{datestamp}/{region}/{service}/aws4_request"
             string_to_sign = f"AWS4-HMAC-SHA256\n{amz_date}\n{credential_scope}\n{canonical_request_hash}"
             
-            # 计算签名密钥
-            k_date = hmac.new(f"AWS4{secret_key}".encode('utf-8'), datestamp.encode('utf-8'), hashlib.sha256).digest()
-            k_region = hmac.new(k_date, region.encode('utf-8'), hashlib.sha256).digest()
-            k_service = hmac.new(k_region, service.encode('utf-8'), hashlib.sha256).digest()
-            k_signing = hmac.new(k_service, b'aws4_request', hashlib.sha256).digest()
+            # 计算签名密钥（按 secret/日期/地区/服务 缓存）
+            k_signing = _derive_signing_key(secret_key, datestamp, region, service)
             
             # 计算签名
             signature = hmac.new(k_signing, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
@@ -1679,48 +1983,42 @@ class ApiClient:
             logger.error(f"[Dreamina] Error generating authorization: {str(e)}")
             return ""
 
-    def _create_error_result(self, error_msg: str) -> Tuple[torch.Tensor, str, str]:
+    def _create_error_result(self, error_msg: str) -> Tuple["torch.Tensor", str, str]:
         """创建错误结果
         Args:
             error_msg: 错误信息
         Returns:
             Tuple[torch.Tensor, str, str]: (错误图像, 错误信息, 空URL列表)
         """
+        from .tensor_adapter import error_image
         logger.error(f"[Dreamina] {error_msg}")
-        error_image = torch.ones(1, 256, 256, 3) * torch.tensor([1.0, 0.0, 0.0])
-        return (error_image, f"错误: {error_msg}", "")
+        return (error_image(), f"错误: {error_msg}", "")
 
-    def _download_images(self, urls: List[str]) -> List[torch.Tensor]:
-        """下载图片并转换为张量
+    def _download_images(self, urls: List[str], dtype: Optional["torch.dtype"] = None) -> Optional["torch.Tensor"]:
+        """下载图片并组装为批次张量
         Args:
             urls: 图片URL列表
+            dtype: 输出精度（float32 或 float16），默认 float32
         Returns:
-            List[torch.Tensor]: 图片张量列表
+            torch.Tensor: (N,H,W,3) 图片批次，全部下载失败时返回None
         """
-        images = []
-        for url in urls:
-            try:
-                response = requests.get(url, timeout=60)
-                response.raise_for_status()
-                img_data = response.content
-                
-                pil_image = Image.open(io.BytesIO(img_data)).convert("RGB")
-                np_image = np.array(pil_image, dtype=np.float32) / 255.0
-                tensor_image = torch.from_numpy(np_image).unsqueeze(0)
-                images.append(tensor_image)
-            except Exception as e:
-                logger.error(f"[Dreamina] 下载或处理图片失败 {url}: {e}")
-                continue
-        return images
+        if dtype is None:
+            return self.image_downloader.download(urls)
+        return self.image_downloader.download(urls, dtype)
 
-    def _save_input_image(self, image_tensor: torch.Tensor) -> Optional[str]:
+    def _save_input_image(self, image_tensor: "torch.Tensor") -> Optional[str]:
         """将输入的图像张量保存为临时文件
         Args:
-            image_tensor: 输入图像张量
+            image_tensor: 输入图像张量；已经是图片文件路径时直接返回该路径（Web 服务器上传的参考图），
+                调用方不应删除该路径
         Returns:
             str: 临时文件路径，如果保存失败则返回None
         """
+        if isinstance(image_tensor, str):
+            return image_tensor if os.path.isfile(image_tensor) else None
         try:
+            from .tensor_adapter import save_tensor_image
+
             # 确保临时目录存在
             temp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp")
             os.makedirs(temp_dir, exist_ok=True)
@@ -1729,18 +2027,7 @@ class ApiClient:
             temp_path = os.path.join(temp_dir, f"temp_input_{int(time.time())}.png")
             
             # 将张量转换为PIL图像并保存
-            if len(image_tensor.shape) == 4:  # batch, height, width, channels
-                image_tensor = image_tensor[0]  # 取第一张图片
-            
-            # 确保值在0-1范围内
-            image_tensor = torch.clamp(image_tensor, 0, 1)
-            
-            # 转换为PIL图像
-            image_np = (image_tensor.cpu().numpy() * 255).astype(np.uint8)
-            image_pil = Image.fromarray(image_np)
-            
-            # 保存图像
-            image_pil.save(temp_path)
+            save_tensor_image(image_tensor, temp_path)
             logger.info(f"[Dreamina] 输入图像已保存到: {temp_path}")
             
             return temp_path
@@ -0,0 +1,184 @@
+"""
+批量文生图
+把 提示词 × 种子 × 比例 × 模型 的组合展开为任务，按账号容量有界并发提交与轮询，
+每个任务结束时立即产出结果，全部结束后产出汇总清单（含吞吐量：张/分钟）。
+每个任务都经过调度器选择账号并预留积分，提交使用独立的 submit_id（写入任务日志），
+可整体取消：正在进行的请求与轮询在下一次等待时中止，未开始的任务不再提交。
+"""
+
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import deadline
+from .credit_cache import estimate_cost
+
+logger = logging.getLogger(__name__)
+
+# 默认参数，可通过 config.json 的 batch 段覆盖
+DEFAULT_BATCH_CONFIG = {
+    "max_concurrency": 0,   # 0 表示 可用账号数 × scheduler.max_inflight_per_account
+    "max_jobs": 500
+}
+
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+
+def expand_jobs(prompts: List[str], seeds: Optional[List[int]] = None, ratios: Optional[List[str]] = None,
+                models: Optional[List[str]] = None, config: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """展开 提示词 × 种子 × 比例 × 模型 的全部组合
+    Args:
+        prompts: 提示词列表
+        seeds: 种子列表，默认 [-1]（随机）
+        ratios: 比例列表，默认 params.default_ratio
+        models: 模型列表，默认 params.default_model
+    Returns:
+        list: 任务参数字典列表，按参数顺序排列
+    """
+    params = (config or {}).get("params", {})
+    seeds = seeds or [-1]
+    ratios = ratios or [params.get("default_ratio", "1:1")]
+    models = models or [params.get("default_model", "3.0")]
+    return [{"prompt": prompt, "seed": int(seed), "ratio": ratio, "model": model}
+            for prompt, seed, ratio, model in itertools.product(prompts, seeds, ratios, models)]
+
+
+class BatchRunner:
+    """有界并发执行一批文生图任务"""
+
+    def __init__(self, api_client, config: Optional[Dict[str, Any]] = None):
+        self.api_client = api_client
+        self.token_manager = api_client.token_manager
+        self.scheduler = api_client.account_scheduler
+        self.config = config or {}
+        batch_config = dict(DEFAULT_BATCH_CONFIG)
+        batch_config.update(self.config.get("batch", {}))
+        self.max_jobs = int(batch_config["max_jobs"])
+        self.max_concurrency = int(batch_config["max_concurrency"]) or self._account_capacity()
+        self._cancelled = threading.Event()
+
+    def _account_capacity(self) -> int:
+        accounts = sum(1 for account in self.token_manager.accounts if account.get("sessionid"))
+        return max(1, accounts * self.scheduler.config["max_inflight_per_account"])
+
+    def cancel(self):
+        """取消整批任务"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self, jobs: List[Dict[str, Any]], scene: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """执行任务并按完成顺序产出结果
+        Args:
+            jobs: expand_jobs 生成的任务列表
+            scene: 返回的图片尺寸档位，默认原图
+        Yields:
+            dict: 每个任务一条 type=result 的结果，最后一条为 type=manifest 的汇总清单
+        """
+        started = time.monotonic()
+        results = []
+        workers = min(self.max_concurrency, max(1, len(jobs)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dreamina-batch")
+        logger.info(f"[Dreamina] 📦 批量生成开始: {len(jobs)}个任务，并发{workers}")
+        try:
+            futures = [executor.submit(self._run_job, index, job, scene) for index, job in enumerate(jobs)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                yield result
+        finally:
+            # 调用方提前停止迭代（如客户端断开）时取消剩余任务
+            if len(results) < len(jobs):
+                self.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+        yield self.manifest(results, time.monotonic() - started)
+
+    def _run_job(self, index: int, job: Dict[str, Any], scene: Optional[str]) -> Dict[str, Any]:
+        result = dict(job, type="result", index=index, status=STATUS_FAILED, images=[],
+                      account_index=None, submit_id=None, history_id=None, error=None)
+        started = time.monotonic()
+        if self.cancelled:
+            result.update(status=STATUS_CANCELLED, error="批量任务已取消")
+            return result
+
+        cost = estimate_cost(self.config, job["model"], False)
+        account_index = self.scheduler.acquire(cost)
+        if account_index is None:
+            result["error"] = "没有可用的账号（均在冷却中或积分不足）"
+            return result
+
+        submit_id = str(uuid.uuid4())
+        result.update(account_index=account_index, submit_id=submit_id)
+        reserved_credit = cost
+        success = False
+        job_deadline = deadline.Deadline.from_config(self.config, interrupt=self._cancelled.is_set)
+        try:
+            with deadline.use_deadline(job_deadline), self.token_manager.use_account(account_index):
+                submitted = self.api_client.generate_t2i(job["prompt"], job["model"], job["ratio"], job["seed"],
+                                                         scene=scene, submit_id=submit_id)
+                if not submitted:
+                    job_deadline.check()
+                    result["error"] = "提交失败"
+                    return result
+                # 任务已提交：预留转为本地扣减
+                self.scheduler.commit(account_index, cost)
+                reserved_credit = 0
+                result["history_id"] = submitted.get("history_record_id")
+                urls = submitted.get("urls") or self._wait(submit_id, scene)
+            if isinstance(urls, dict):
+                result["error"] = urls.get("fail_msg") or "生成失败"
+                return result
+            result.update(status=STATUS_COMPLETED, images=urls)
+            success = True
+            return result
+        except deadline.GenerationCancelled:
+            result.update(status=STATUS_CANCELLED, error="批量任务已取消")
+            return result
+        except Exception as e:
+            logger.error(f"[Dreamina] 批量任务{index + 1}失败: {e}")
+            result["error"] = str(e)
+            return result
+        finally:
+            result["duration"] = round(time.monotonic() - started, 1)
+            cancelled = result["status"] == STATUS_CANCELLED
+            self.scheduler.release(account_index, None if cancelled else success, reserved_credit)
+
+    def _wait(self, submit_id: str, scene: Optional[str]):
+        """轮询到任务完成（URL列表）或失败（含 failed/blocked 的字典），超过截止时间时抛出 DeadlineExceeded"""
+        check_interval = self.config.get("timeout", {}).get("check_interval", 10)
+        while True:
+            deadline.sleep(check_interval)
+            res = self.api_client._get_generated_images(submit_id, scene)
+            if isinstance(res, list) and res:
+                return res
+            if isinstance(res, dict) and (res.get("failed") or res.get("blocked")):
+                return res
+
+    def manifest(self, results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        """汇总清单：按任务顺序排列的结果与吞吐量"""
+        results = sorted(results, key=lambda r: r["index"])
+        images = sum(len(r["images"]) for r in results)
+        counts = {status: sum(1 for r in results if r["status"] == status)
+                  for status in (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)}
+        minutes = elapsed / 60
+        summary = {
+            "type": "manifest",
+            "total": len(results),
+            **counts,
+            "images": images,
+            "elapsed": round(elapsed, 1),
+            "images_per_minute": round(images / minutes, 2) if minutes > 0 else 0.0,
+            "jobs_per_minute": round(counts[STATUS_COMPLETED] / minutes, 2) if minutes > 0 else 0.0,
+            "results": results
+        }
+        logger.info(f"[Dreamina] 📦 批量生成结束: 完成{counts[STATUS_COMPLETED]}/{len(results)}，"
+                    f"{images}张图片，用时{elapsed:.1f}秒，{summary['images_per_minute']}张/分钟")
+        return summary
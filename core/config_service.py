@@ -0,0 +1,113 @@
+"""
+配置文件服务
+进程内共享 config.json 的解析结果，只有文件修改时间或大小变化时才重新解析，
+由配置派生的数据（如节点下拉选项）随解析结果一起缓存，文件变化后自动失效。
+节点与 Web 服务器都通过同一个服务读写配置，保存后缓存立即更新。
+"""
+
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE_NAME = "config.json"
+TEMPLATE_FILE_NAME = "config.json.template"
+
+_services: Dict[str, "ConfigService"] = {}
+_services_lock = threading.Lock()
+
+
+class ConfigService:
+    """按文件变化重新加载的 config.json 缓存"""
+
+    def __init__(self, path: str, template_path: Optional[str] = None):
+        self.path = os.path.abspath(path)
+        self.template_path = template_path
+        self._lock = threading.RLock()
+        self._config: Optional[Dict[str, Any]] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._derived: Dict[str, Any] = {}
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def ensure_exists(self) -> bool:
+        """配置文件不存在时从模板创建
+        Returns:
+            bool: 配置文件是否存在
+        """
+        if os.path.exists(self.path):
+            return True
+        if self.template_path and os.path.exists(self.template_path):
+            shutil.copy(self.template_path, self.path)
+            logger.info("[Dreamina] 从模板创建了 config.json")
+            return True
+        return False
+
+    def get(self) -> Dict[str, Any]:
+        """返回共享的解析结果（只读，不要修改），文件变化时重新解析
+        读取或解析失败时抛出异常，由调用方决定默认值
+        """
+        with self._lock:
+            signature = self._stat()
+            if self._config is None or signature != self._signature:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                if self._config is not None:
+                    logger.info("[Dreamina] 检测到 config.json 变化，已重新加载")
+                self._config = config
+                self._signature = signature
+                self._derived = {}
+            return self._config
+
+    def load(self) -> Dict[str, Any]:
+        """返回解析结果的深拷贝，供需要修改配置的调用方使用"""
+        return copy.deepcopy(self.get())
+
+    def derived(self, name: str, build: Callable[[Dict[str, Any]], Any]) -> Any:
+        """按名称缓存由配置派生的数据，配置重新加载后重新计算
+        Args:
+            name: 缓存名称
+            build: 以配置为参数的计算函数
+        Returns:
+            build 的返回值（共享对象，不要修改）
+        """
+        with self._lock:
+            config = self.get()
+            if name not in self._derived:
+                self._derived[name] = build(config)
+            return self._derived[name]
+
+    def save(self, config: Dict[str, Any]):
+        """原子写入配置文件并更新缓存，写入失败时抛出异常"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+            self._config = copy.deepcopy(config)
+            self._signature = self._stat()
+            self._derived = {}
+
+
+def get_config_service(path: Optional[str] = None) -> ConfigService:
+    """进程内共享的配置服务，默认使用插件目录下的 config.json
+    Args:
+        path: 配置文件路径，同一路径共用一个实例
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), CONFIG_FILE_NAME)
+    path = os.path.abspath(path)
+    with _services_lock:
+        service = _services.get(path)
+        if service is None:
+            template_path = os.path.join(os.path.dirname(path), TEMPLATE_FILE_NAME)
+            service = ConfigService(path, template_path)
+            _services[path] = service
+        return service
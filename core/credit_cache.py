@@ -0,0 +1,149 @@
+"""
+账号积分缓存
+每个账号保存一份带TTL的积分快照，生成前直接读取快照，过期或缺失时在后台刷新，
+提交成功后按预估消耗本地扣减，并延迟向服务器对账，热路径不再等待积分接口。
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存参数，可通过 config.json 的 credit 段覆盖
+DEFAULT_CACHE_TTL = 300
+DEFAULT_RECONCILE_DELAY = 15
+
+
+def estimate_cost(config: Dict[str, Any], model: str, is_image2image: bool) -> int:
+    """估算一次生成的积分消耗 - 按次数计费，不是按图片数量
+    默认文生图2积分、图生图4积分，可由 params.models.<model>.cost_per_t2i / cost_per_i2i 覆盖。
+    """
+    model_config = config.get("params", {}).get("models", {}).get(model, {})
+    if is_image2image:
+        return model_config.get("cost_per_i2i", 4)
+    return model_config.get("cost_per_t2i", 2)
+
+
+class CreditCache:
+    """按账号缓存积分快照"""
+
+    def __init__(self, token_manager, config: Optional[Dict[str, Any]] = None):
+        credit_config = (config or {}).get("credit", {})
+        self.token_manager = token_manager
+        self.ttl = float(credit_config.get("cache_ttl", DEFAULT_CACHE_TTL))
+        self.reconcile_delay = float(credit_config.get("reconcile_delay", DEFAULT_RECONCILE_DELAY))
+        self._lock = threading.Lock()
+        # account_index -> (积分快照, 获取时间)
+        self._snapshots: Dict[int, tuple] = {}
+        self._refreshing = set()
+        # 最近一次查询失败（拿到备用积分）的账号，成功查询后移除
+        self._failed = set()
+        self._reconcile_timers: Dict[int, threading.Timer] = {}
+
+    def get(self, account_index: int) -> Optional[Dict[str, Any]]:
+        """读取账号积分快照，不发起网络请求
+        快照过期或不存在时在后台刷新，本次仍返回旧快照（可能为None）。
+        Args:
+            account_index: 账号索引
+        Returns:
+            dict: 积分信息副本，与 TokenManager.get_credit 的返回格式一致
+        """
+        with self._lock:
+            entry = self._snapshots.get(account_index)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            self.refresh_async(account_index)
+        return copy.deepcopy(entry[0]) if entry else None
+
+    def get_fresh(self, account_index: int) -> Optional[Dict[str, Any]]:
+        """仅返回未过期的快照，不触发刷新"""
+        with self._lock:
+            entry = self._snapshots.get(account_index)
+        if entry and time.time() - entry[1] <= self.ttl:
+            return copy.deepcopy(entry[0])
+        return None
+
+    def put(self, account_index: int, credit_info: Optional[Dict[str, Any]]):
+        """写入一份来自服务器的积分快照（其他已查询积分的地方可直接回填）
+        查询失败时的备用积分（is_fallback）不是真实数据，不写入缓存，只记录该账号查询失败。
+        """
+        if not credit_info:
+            return
+        with self._lock:
+            if credit_info.get("is_fallback", False):
+                self._failed.add(account_index)
+                return
+            self._snapshots[account_index] = (copy.deepcopy(credit_info), time.time())
+            self._failed.discard(account_index)
+
+    def failed(self, account_index: int) -> bool:
+        """账号最近一次积分查询是否失败"""
+        with self._lock:
+            return account_index in self._failed
+
+    def refresh(self, account_index: int) -> Optional[Dict[str, Any]]:
+        """同步查询服务器积分并更新快照
+        Returns:
+            dict: 查询结果，失败时为带 is_fallback 标记的备用积分（不会写入缓存）
+        """
+        credit_info = self.token_manager.get_credit(account_index=account_index)
+        self.put(account_index, credit_info)
+        return credit_info
+
+    def refresh_async(self, account_index: int):
+        """在后台线程刷新积分，同一账号同时只有一个刷新任务"""
+        with self._lock:
+            if account_index in self._refreshing:
+                return
+            self._refreshing.add(account_index)
+
+        def worker():
+            try:
+                self.refresh(account_index)
+            except Exception as e:
+                logger.debug(f"[Dreamina] 后台刷新账号{account_index + 1}积分失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(account_index)
+
+        threading.Thread(target=worker, daemon=True, name=f"dreamina-credit-{account_index}").start()
+
+    def debit(self, account_index: int, amount: int):
+        """提交成功后按预估消耗本地扣减，并安排一次延迟对账
+        限免期快照不扣减；对账会用服务器的真实值覆盖本地估算。
+        """
+        with self._lock:
+            entry = self._snapshots.get(account_index)
+            if entry and not entry[0].get("is_free_period", False):
+                credit_info = entry[0]
+                credit_info["total_credit"] = max(0, credit_info.get("total_credit", 0) - amount)
+                logger.debug(f"[Dreamina] 账号{account_index + 1}本地扣减{amount}积分，剩余约{credit_info['total_credit']}")
+        self._schedule_reconcile(account_index)
+
+    def _schedule_reconcile(self, account_index: int):
+        """延迟对账，短时间内的多次扣减合并为一次查询"""
+        with self._lock:
+            timer = self._reconcile_timers.get(account_index)
+            if timer and timer.is_alive():
+                return
+            timer = threading.Timer(self.reconcile_delay, self._reconcile, args=(account_index,))
+            timer.daemon = True
+            self._reconcile_timers[account_index] = timer
+            timer.start()
+
+    def _reconcile(self, account_index: int):
+        with self._lock:
+            self._reconcile_timers.pop(account_index, None)
+        self.refresh_async(account_index)
+
+    def invalidate(self, account_index: Optional[int] = None):
+        """丢弃指定账号（或全部账号）的快照"""
+        with self._lock:
+            if account_index is None:
+                self._snapshots.clear()
+                self._failed.clear()
+            else:
+                self._snapshots.pop(account_index, None)
+                self._failed.discard(account_index)
@@ -0,0 +1,307 @@
+"""
+积分历史本地存储与增量同步
+积分历史接口按时间倒序分页（cursor="0" 为最新一页）。同步时从最新一页向后翻页，
+遇到本地已有的记录即停止，只拉取新增记录；首次同步后按保存的游标分批回填更早的记录。
+记录保存在 SQLite 中，按天/模型的积分消耗、按小时的生成次数等统计直接在本地查询。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 积分历史记录类型
+HISTORY_TYPE_RECEIVE = 1   # 领取/充值
+HISTORY_TYPE_CONSUME = 2   # 生成消耗
+
+# 默认参数，可通过 config.json 的 credit 段覆盖
+DEFAULT_HISTORY_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "credit_history.db")
+DEFAULT_HISTORY_PAGE_SIZE = 50
+DEFAULT_HISTORY_BACKFILL_PAGES = 5
+# 单次同步最多翻的新记录页数，防止异常游标导致无限翻页
+MAX_HEAD_PAGES = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS credit_records (
+    account_key  TEXT NOT NULL,
+    record_key   TEXT NOT NULL,
+    create_time  INTEGER NOT NULL,
+    amount       INTEGER NOT NULL,
+    title        TEXT,
+    history_type INTEGER,
+    status       TEXT,
+    model        TEXT,
+    raw          TEXT,
+    PRIMARY KEY (account_key, record_key)
+);
+CREATE INDEX IF NOT EXISTS idx_credit_records_time ON credit_records(account_key, create_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    account_key   TEXT PRIMARY KEY,
+    backfill_cursor TEXT,
+    backfill_done INTEGER NOT NULL DEFAULT 0,
+    total_credit  INTEGER,
+    last_sync     REAL
+);
+"""
+
+# 消耗类记录：生成消耗类型，或金额为负
+_CONSUME_FILTER = f"(history_type = {HISTORY_TYPE_CONSUME} OR amount < 0)"
+
+
+def _record_id(record: Dict[str, Any]) -> Optional[str]:
+    """接口返回的记录ID，没有时返回None"""
+    for field in ("record_id", "id", "history_id"):
+        if record.get(field):
+            return str(record[field])
+    return None
+
+
+def _record_digest(record: Dict[str, Any]) -> str:
+    """没有ID的记录由时间、金额、标题、类型生成摘要"""
+    basis = f"{record.get('create_time', 0)}|{record.get('amount', 0)}|{record.get('title', '')}|{record.get('history_type', 0)}"
+    return hashlib.md5(basis.encode()).hexdigest()
+
+
+def _occurrence_key(digest: str, occurrence: int) -> str:
+    """同一秒内金额、标题都相同的多条记录按出现顺序编号：第一条使用摘要本身，之后为 摘要#1、摘要#2……"""
+    return digest if occurrence == 0 else f"{digest}#{occurrence}"
+
+
+class CreditHistoryStore:
+    """积分历史记录的 SQLite 存储"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_HISTORY_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def _query(self, sql: str, args: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, args).fetchall()]
+
+    def _digest_count(self, account_key: str, digest: str) -> int:
+        """本地已保存的同摘要记录数"""
+        return self._query("SELECT COUNT(*) AS n FROM credit_records WHERE account_key = ? "
+                           "AND (record_key = ? OR record_key LIKE ?)", (account_key, digest, f"{digest}#%"))[0]["n"]
+
+    def _record_keys(self, account_key: str, records: List[Dict[str, Any]], occurrences: Dict[str, int],
+                     older: bool) -> List[str]:
+        """为一页记录生成唯一键，没有ID的相同记录按出现顺序编号（见 _occurrence_key）"""
+        keys = []
+        for record in records:
+            record_id = _record_id(record)
+            if record_id:
+                keys.append(record_id)
+                continue
+            digest = _record_digest(record)
+            if digest not in occurrences:
+                # 回填的记录都早于本地已有记录，跨批次的相同记录接着本地已有的编号
+                occurrences[digest] = self._digest_count(account_key, digest) if older else 0
+            keys.append(_occurrence_key(digest, occurrences[digest]))
+            occurrences[digest] += 1
+        return keys
+
+    def insert_records(self, account_key: str, records: List[Dict[str, Any]],
+                       occurrences: Optional[Dict[str, int]] = None, older: bool = False) -> int:
+        """写入一页记录，已存在的记录忽略
+        Args:
+            occurrences: 本轮同步中各摘要已出现的次数，连续翻页时传入同一个字典，跨页的相同记录编号连续
+            older: 本页记录都早于本地已有的记录（回填）
+        Returns:
+            int: 新写入的记录数
+        """
+        keys = self._record_keys(account_key, records, {} if occurrences is None else occurrences, older)
+        rows = [(account_key, key, int(r.get("create_time", 0) or 0), int(r.get("amount", 0) or 0),
+                 r.get("title", ""), r.get("history_type", 0), str(r.get("status", "")),
+                 r.get("model_name") or r.get("model") or "", json.dumps(r, ensure_ascii=False))
+                for key, r in zip(keys, records)]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO credit_records (account_key, record_key, create_time, amount, title, "
+                "history_type, status, model, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return self._conn.total_changes - before
+
+    def get_state(self, account_key: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM sync_state WHERE account_key = ?", (account_key,))
+        return rows[0] if rows else None
+
+    def update_state(self, account_key: str, **fields):
+        """更新同步状态（backfill_cursor / backfill_done / total_credit / last_sync）"""
+        state = self.get_state(account_key) or {"account_key": account_key, "backfill_cursor": None,
+                                                 "backfill_done": 0, "total_credit": None, "last_sync": None}
+        state.update(fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (account_key, backfill_cursor, backfill_done, total_credit, last_sync) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (account_key, state["backfill_cursor"], int(bool(state["backfill_done"])),
+                 state["total_credit"], state["last_sync"]))
+
+    def recent_records(self, account_key: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的记录（接口返回的原始格式）"""
+        rows = self._query("SELECT raw FROM credit_records WHERE account_key = ? "
+                           "ORDER BY create_time DESC LIMIT ?", (account_key, limit))
+        return [json.loads(row["raw"]) for row in rows]
+
+    def _account_filter(self, account_key: Optional[str], since: float):
+        if account_key:
+            return "account_key = ? AND create_time >= ?", (account_key, int(since))
+        return "create_time >= ?", (int(since),)
+
+    def spent_by_day(self, account_key: Optional[str] = None, days: int = 30) -> List[Dict[str, Any]]:
+        """按天（本地时间）统计积分消耗"""
+        where, args = self._account_filter(account_key, time.time() - days * 86400)
+        return self._query(
+            f"SELECT date(create_time, 'unixepoch', 'localtime') AS day, SUM(ABS(amount)) AS credits, "
+            f"COUNT(*) AS generations FROM credit_records WHERE {where} AND {_CONSUME_FILTER} "
+            f"GROUP BY day ORDER BY day", args)
+
+    def spent_by_model(self, account_key: Optional[str] = None, days: int = 30) -> List[Dict[str, Any]]:
+        """按模型统计积分消耗（记录中没有模型字段时按标题归类）"""
+        where, args = self._account_filter(account_key, time.time() - days * 86400)
+        return self._query(
+            f"SELECT COALESCE(NULLIF(model, ''), title) AS model, SUM(ABS(amount)) AS credits, "
+            f"COUNT(*) AS generations FROM credit_records WHERE {where} AND {_CONSUME_FILTER} "
+            f"GROUP BY 1 ORDER BY credits DESC", args)
+
+    def generations_by_hour(self, account_key: Optional[str] = None, hours: int = 24) -> List[Dict[str, Any]]:
+        """按小时（本地时间）统计生成次数"""
+        where, args = self._account_filter(account_key, time.time() - hours * 3600)
+        return self._query(
+            f"SELECT strftime('%Y-%m-%d %H:00', create_time, 'unixepoch', 'localtime') AS hour, "
+            f"COUNT(*) AS generations, SUM(ABS(amount)) AS credits FROM credit_records "
+            f"WHERE {where} AND {_CONSUME_FILTER} GROUP BY hour ORDER BY hour", args)
+
+    def activity_summary(self, account_key: Optional[str] = None, hours: int = 24) -> Dict[str, int]:
+        """最近一段时间的生成次数、消耗积分和获得积分"""
+        where, args = self._account_filter(account_key, time.time() - hours * 3600)
+        row = self._query(
+            f"SELECT SUM(CASE WHEN {_CONSUME_FILTER} THEN 1 ELSE 0 END) AS generations, "
+            f"SUM(CASE WHEN {_CONSUME_FILTER} THEN ABS(amount) ELSE 0 END) AS spent, "
+            f"SUM(CASE WHEN {_CONSUME_FILTER} THEN 0 ELSE amount END) AS received "
+            f"FROM credit_records WHERE {where}", args)[0]
+        return {key: int(value or 0) for key, value in row.items()}
+
+
+class CreditHistory:
+    """按账号增量同步积分历史，并从本地存储提供统计"""
+
+    def __init__(self, token_manager, config: Optional[Dict[str, Any]] = None):
+        credit_config = (config or {}).get("credit", {})
+        self.token_manager = token_manager
+        path = credit_config.get("history_db")
+        if path and not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(DEFAULT_HISTORY_DB_PATH), path)
+        self.path = path or DEFAULT_HISTORY_DB_PATH
+        self.page_size = int(credit_config.get("history_page_size", DEFAULT_HISTORY_PAGE_SIZE))
+        self.backfill_pages = int(credit_config.get("history_backfill_pages", DEFAULT_HISTORY_BACKFILL_PAGES))
+        self._store = None
+        self._store_lock = threading.Lock()
+        # 同一账号同时只有一个同步
+        self._sync_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def store(self) -> CreditHistoryStore:
+        """首次使用时才创建数据库文件"""
+        with self._store_lock:
+            if self._store is None:
+                self._store = CreditHistoryStore(self.path)
+            return self._store
+
+    def _sync_lock(self, account_key: str) -> threading.Lock:
+        with self._store_lock:
+            return self._sync_locks.setdefault(account_key, threading.Lock())
+
+    def sync(self, account_index: int) -> int:
+        """增量同步一个账号的积分历史
+        Args:
+            account_index: 账号索引
+        Returns:
+            int: 本次新写入的记录数；查询失败返回-1
+        """
+        account_key = self.token_manager.get_account_key(account_index)
+        if not account_key:
+            return -1
+        with self._sync_lock(account_key):
+            store = self.store
+            state = store.get_state(account_key)
+            added = 0
+
+            # 1. 从最新一页向后翻页，遇到已有记录即停止（首次同步只取最新一页，其余交给回填）
+            cursor = "0"
+            occurrences: Dict[str, int] = {}
+            for _ in range(MAX_HEAD_PAGES if state else 1):
+                page = self.token_manager.get_credit_history(count=self.page_size, cursor=cursor,
+                                                             account_index=account_index)
+                if page is None:
+                    return added if added else -1
+                records = page.get("records", [])
+                inserted = store.insert_records(account_key, records, occurrences)
+                added += inserted
+                store.update_state(account_key, total_credit=page.get("total_credit"), last_sync=time.time())
+                cursor = page.get("new_cursor", "0") if page.get("has_more") else None
+                if inserted < len(records) or cursor is None:
+                    break
+            else:
+                if state:
+                    logger.warning(f"[Dreamina] 账号{account_index + 1}积分历史新增记录超过{MAX_HEAD_PAGES}页，未同步完整")
+
+            if state is None:
+                # 首次同步：从最新一页之后开始回填（没有更多页时无需回填）
+                store.update_state(account_key, backfill_cursor=cursor, backfill_done=cursor is None)
+                state = store.get_state(account_key)
+
+            # 2. 按保存的游标分批回填更早的记录
+            cursor = state.get("backfill_cursor")
+            if not state.get("backfill_done") and cursor:
+                occurrences = {}
+                for _ in range(self.backfill_pages):
+                    page = self.token_manager.get_credit_history(count=self.page_size, cursor=cursor,
+                                                                 account_index=account_index)
+                    if page is None:
+                        break
+                    added += store.insert_records(account_key, page.get("records", []), occurrences, older=True)
+                    if not page.get("has_more"):
+                        store.update_state(account_key, backfill_cursor=None, backfill_done=True)
+                        break
+                    cursor = page.get("new_cursor", "0")
+                    store.update_state(account_key, backfill_cursor=cursor)
+
+            if added:
+                logger.info(f"[Dreamina] 📊 账号{account_index + 1}积分历史同步: 新增{added}条")
+            return added
+
+    def _key(self, account_index: Optional[int]) -> Optional[str]:
+        return self.token_manager.get_account_key(account_index) if account_index is not None else None
+
+    def recent_records(self, account_index: int, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.recent_records(self._key(account_index), limit)
+
+    def stats(self, account_index: Optional[int] = None, days: int = 30, hours: int = 24) -> Dict[str, Any]:
+        """本地统计：按天/模型的积分消耗、按小时的生成次数
+        Args:
+            account_index: 账号索引，None 表示所有账号
+            days: 按天/模型统计的天数
+            hours: 按小时统计的小时数
+        """
+        key = self._key(account_index)
+        store = self.store
+        state = store.get_state(key) if key else None
+        return {
+            "spent_by_day": store.spent_by_day(key, days),
+            "spent_by_model": store.spent_by_model(key, days),
+            "generations_by_hour": store.generations_by_hour(key, hours),
+            "summary": store.activity_summary(key, hours),
+            "total_credit": state.get("total_credit") if state else None,
+            "last_sync": state.get("last_sync") if state else None
+        }
@@ -0,0 +1,209 @@
+"""
+每日积分自动领取
+后台线程每天在 credit.daily_claim_time（本地时间）加随机抖动后，为所有账号并发领取每日积分。
+每个账号的最近领取日期按账号键（sessionid 摘要）持久化到状态文件，进程重启后当天已领取的账号不会重复领取；
+领取成功后刷新积分缓存，生成时读取到的就是领取后的余额。
+"""
+
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 默认参数，可通过 config.json 的 credit 段覆盖
+DEFAULT_CLAIM_TIME = "00:05"
+DEFAULT_CLAIM_JITTER = 300
+DEFAULT_CLAIM_RETRY_INTERVAL = 1800
+DEFAULT_CLAIM_MAX_ATTEMPTS = 3
+DEFAULT_CLAIM_STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "credit_claims.json")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class DailyCreditScheduler:
+    """为所有账号定时领取每日积分"""
+
+    def __init__(self, token_manager, config: Optional[Dict[str, Any]] = None):
+        credit_config = (config or {}).get("credit", {})
+        self.token_manager = token_manager
+        self.claim_hour, self.claim_minute = self._parse_time(credit_config.get("daily_claim_time", DEFAULT_CLAIM_TIME))
+        self.jitter = float(credit_config.get("daily_claim_jitter", DEFAULT_CLAIM_JITTER))
+        self.retry_interval = float(credit_config.get("daily_claim_retry_interval", DEFAULT_CLAIM_RETRY_INTERVAL))
+        self.max_attempts = max(1, int(credit_config.get("daily_claim_max_attempts", DEFAULT_CLAIM_MAX_ATTEMPTS)))
+        self.max_workers = max(1, int(credit_config.get("scan_workers", 8)))
+        path = credit_config.get("claim_state_path")
+        if path and not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(DEFAULT_CLAIM_STATE_PATH), path)
+        self.state_path = path or DEFAULT_CLAIM_STATE_PATH
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+        # 当天各账号失败次数 {账号键: 次数}，跨天清零
+        self._attempts: Dict[str, int] = {}
+        self._attempts_date = None
+        self._stop = threading.Event()
+        # 停止或账号列表变化时唤醒后台线程重新计算下一次领取时间
+        self._wake = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _parse_time(value: str):
+        try:
+            hour, minute = (int(part) for part in str(value).split(":", 1))
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                return hour, minute
+        except ValueError:
+            pass
+        logger.warning(f"[Dreamina] daily_claim_time 格式无效: {value}，使用 {DEFAULT_CLAIM_TIME}")
+        return tuple(int(part) for part in DEFAULT_CLAIM_TIME.split(":"))
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"[Dreamina] 读取积分领取记录失败: {e}")
+        return {}
+
+    def _save_state(self):
+        """先写临时文件再替换，避免写入中断留下损坏的状态文件（调用方需持有锁）"""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _claimed_today(self, account_index: int, today: str) -> bool:
+        key = self.token_manager.get_account_key(account_index)
+        with self._lock:
+            return self._state.get(key, {}).get("date") == today
+
+    def pending_accounts(self, today: Optional[str] = None) -> List[int]:
+        """今天尚未领取且未超过重试次数的账号索引"""
+        today = today or datetime.date.today().isoformat()
+        with self._lock:
+            if self._attempts_date != today:
+                self._attempts_date = today
+                self._attempts.clear()
+            attempts = dict(self._attempts)
+        return [i for i, account in enumerate(self.token_manager.accounts)
+                if account.get("sessionid")
+                and not self._claimed_today(i, today)
+                and attempts.get(self.token_manager.get_account_key(i), 0) < self.max_attempts]
+
+    def claim_account(self, account_index: int) -> Optional[int]:
+        """为单个账号领取每日积分并记录
+        Returns:
+            int: 领取后的总积分，失败返回None
+        """
+        key = self.token_manager.get_account_key(account_index)
+        if not key:
+            return None
+        total = self.token_manager.receive_daily_credit(account_index=account_index)
+        with self._lock:
+            if total is None:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                return None
+            self._state[key] = {"date": datetime.date.today().isoformat(), "claimed_at": time.time(), "total_credit": total}
+            try:
+                self._save_state()
+            except Exception as e:
+                logger.warning(f"[Dreamina] 保存积分领取记录失败: {e}")
+        # 用服务器的真实余额更新积分缓存
+        self.token_manager.credit_cache.refresh(account_index)
+        return total
+
+    def claim_all(self) -> Dict[int, Optional[int]]:
+        """为今天尚未领取的所有账号并发领取
+        Returns:
+            dict: 账号索引 -> 领取后的总积分（失败为None）
+        """
+        pending = self.pending_accounts()
+        if not pending:
+            return {}
+        logger.info(f"[Dreamina] 🎁 开始为 {len(pending)} 个账号领取每日积分")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending)),
+                                thread_name_prefix="dreamina-daily-credit") as executor:
+            results = dict(zip(pending, executor.map(self.claim_account, pending)))
+        succeeded = sum(1 for total in results.values() if total is not None)
+        logger.info(f"[Dreamina] 🎁 每日积分领取完成: 成功 {succeeded}/{len(pending)}")
+        return results
+
+    def next_run_delay(self, now: Optional[datetime.datetime] = None) -> float:
+        """距下一次领取的秒数
+        今天的领取时间已过且仍有未领取的账号时尽快领取（失败的账号按重试间隔），否则等到明天的领取时间。
+        """
+        now = now or datetime.datetime.now()
+        today_run = now.replace(hour=self.claim_hour, minute=self.claim_minute, second=0, microsecond=0)
+        jitter = random.uniform(0, self.jitter)
+        if now < today_run:
+            return (today_run - now).total_seconds() + jitter
+        pending = self.pending_accounts(now.date().isoformat())
+        if pending:
+            with self._lock:
+                retrying = any(self._attempts.get(self.token_manager.get_account_key(i), 0) for i in pending)
+            return self.retry_interval + jitter if retrying else random.uniform(0, min(self.jitter, 60))
+        return (today_run + datetime.timedelta(days=1) - now).total_seconds() + jitter
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = self.next_run_delay()
+            logger.debug(f"[Dreamina] 下次领取每日积分: {delay:.0f}秒后")
+            if self._wake.wait(delay):
+                self._wake.clear()
+                continue
+            try:
+                self.claim_all()
+            except Exception as e:
+                logger.error(f"[Dreamina] 领取每日积分异常: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="dreamina-daily-credit")
+        self._thread.start()
+        logger.info(f"[Dreamina] 🎁 已启用每日积分自动领取（每天 {self.claim_hour:02d}:{self.claim_minute:02d}）")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def bind(self, token_manager):
+        """切换到新的 TokenManager（账号增删后组件重建），之后的领取使用新的账号列表
+        领取记录按账号键保存，新增账号会在下一轮领取，已删除的账号不再领取。
+        """
+        with self._lock:
+            self.token_manager = token_manager
+        self._wake.set()
+
+
+def start_daily_credit_scheduler(token_manager, config: Optional[Dict[str, Any]] = None) -> Optional[DailyCreditScheduler]:
+    """按 credit.auto_receive_daily 启动每日积分领取，同一进程只启动一个
+    Returns:
+        DailyCreditScheduler: 运行中的调度器，未启用时返回None
+    """
+    global _scheduler
+    if not (config or {}).get("credit", {}).get("auto_receive_daily", False):
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DailyCreditScheduler(token_manager, config)
+            _scheduler.start()
+        else:
+            _scheduler.bind(token_manager)
+        return _scheduler
+
+
+def rebind_daily_credit_scheduler(token_manager):
+    """组件重建后让运行中的领取调度器改用新的 TokenManager（未启动时不做任何事）"""
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.bind(token_manager)
@@ -0,0 +1,164 @@
+"""
+生成任务的截止时间与取消
+每次生成有一个总截止时间（timeout.generation_timeout），通过 contextvars 绑定到当前执行上下文：
+- 其下每个外发请求的连接/读取超时都不超过剩余时间
+- 轮询间隔、重试退避、限流等待在取消或到期时立即结束
+取消是协作式的：Web 端取消或 ComfyUI 中断后，下一次请求或等待时抛出 GenerationCancelled。
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+# 默认连接超时，可通过 config.json 的 timeout.connect_timeout 覆盖
+DEFAULT_CONNECT_TIMEOUT = 10
+# 有外部中断检查（如 ComfyUI 中断）时，等待期间的检查间隔
+INTERRUPT_POLL_INTERVAL = 0.5
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("dreamina_deadline", default=None)
+
+
+class GenerationAborted(requests.exceptions.RequestException):
+    """生成已被中止（到期或取消），不应再重试"""
+
+
+class DeadlineExceeded(GenerationAborted):
+    """超过生成的总截止时间"""
+
+
+class GenerationCancelled(GenerationAborted):
+    """生成被用户取消"""
+
+
+class Deadline:
+    """单次生成的总截止时间与取消标记"""
+
+    def __init__(self, timeout: Optional[float] = None, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 interrupt: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            timeout: 总时长（秒），None 表示不限时，只支持取消
+            connect_timeout: 单次请求的连接超时上限
+            interrupt: 外部中断检查函数，返回True时视为取消
+        """
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self.connect_timeout = connect_timeout
+        self.reason = None
+        self._interrupt = interrupt
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None,
+                    interrupt: Optional[Callable[[], bool]] = None) -> "Deadline":
+        """按 config.json 的 timeout.generation_timeout / connect_timeout 创建"""
+        timeout_config = (config or {}).get("timeout", {})
+        return cls(timeout_config.get("generation_timeout", 180),
+                   timeout_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                   interrupt)
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限时返回None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self, reason: str = "任务已取消"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancelled.is_set() and self._interrupt is not None and self._interrupt():
+            self.cancel("执行已中断")
+        return self._cancelled.is_set()
+
+    def check(self):
+        """已取消或已到期时抛出异常"""
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)
+        if self.remaining() == 0:
+            raise DeadlineExceeded("超过生成总时长限制")
+
+    def timeout(self, read_timeout: Optional[float]) -> Tuple[float, float]:
+        """把单次请求的超时裁剪到剩余时间内
+        Returns:
+            tuple: requests 使用的 (连接超时, 读取超时)
+        """
+        self.check()
+        limits = [t for t in (read_timeout, self.remaining()) if t is not None]
+        read = min(limits) if limits else None
+        connect = min(self.connect_timeout, read) if read is not None else self.connect_timeout
+        return connect, read
+
+    def sleep(self, seconds: float):
+        """可被取消的等待；等待超过剩余时间时在到期处抛出 DeadlineExceeded"""
+        self.check()
+        end = time.monotonic() + seconds
+        remaining = self.remaining()
+        if remaining is not None:
+            end = min(end, time.monotonic() + remaining)
+        while True:
+            wait = end - time.monotonic()
+            if wait <= 0:
+                break
+            if self._interrupt is not None:
+                wait = min(wait, INTERRUPT_POLL_INTERVAL)
+            if self._cancelled.wait(wait):
+                break
+            if self.cancelled:
+                break
+        self.check()
+
+
+def current_deadline() -> Optional[Deadline]:
+    """当前上下文绑定的截止时间"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]):
+    """在 with 块内绑定截止时间，块内的请求与等待都受其约束"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def check():
+    """当前生成已取消或已到期时抛出异常，没有绑定截止时间时不做任何事"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def sleep(seconds: float):
+    """受当前截止时间约束的 time.sleep"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds)
+
+
+def request_timeout(timeout: Optional[float]):
+    """受当前截止时间约束的请求超时，没有绑定截止时间时原样返回"""
+    deadline = _current_deadline.get()
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+
+def propagate(fn: Callable) -> Callable:
+    """让 fn 在其他线程（如线程池）中执行时沿用调用方当前的截止时间"""
+    deadline = _current_deadline.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_deadline(deadline):
+            return fn(*args, **kwargs)
+    return wrapper
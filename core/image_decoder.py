@@ -0,0 +1,146 @@
+"""
+可插拔的图片解码层
+按格式选择当前环境中最快的可用后端（turbojpeg / cv2 / PIL），解码失败时自动回退到下一个后端。
+所有后端都输出 (H,W,3) uint8 RGB 数组。
+"""
+
+import io
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JPEG = "jpeg"
+FORMAT_PNG = "png"
+FORMAT_WEBP = "webp"
+FORMAT_UNKNOWN = "unknown"
+
+# 默认后端优先级，可通过 config.json 的 download.decoders 覆盖
+DEFAULT_DECODER_ORDER = ["turbojpeg", "cv2", "pil"]
+
+
+def detect_format(data: bytes) -> str:
+    """根据文件头识别图片格式"""
+    if data[:3] == b"\xff\xd8\xff":
+        return FORMAT_JPEG
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return FORMAT_PNG
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return FORMAT_WEBP
+    return FORMAT_UNKNOWN
+
+
+def probe_size(data: bytes) -> Tuple[int, int]:
+    """只解析文件头获取图片尺寸，不解码像素
+    Returns:
+        tuple: (width, height)
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+class DecoderBackend(ABC):
+    """解码后端基类"""
+    name = ""
+    formats: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def decode(self, data: bytes) -> np.ndarray:
+        """解码为 (H,W,3) uint8 RGB 数组"""
+
+
+class PILBackend(DecoderBackend):
+    name = "pil"
+    formats = (FORMAT_JPEG, FORMAT_PNG, FORMAT_WEBP, FORMAT_UNKNOWN)
+
+    def decode(self, data: bytes) -> np.ndarray:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format == "JPEG":
+                # 让libjpeg直接输出RGB，跳过额外的色彩转换
+                img.draft("RGB", img.size)
+            rgb = img if img.mode == "RGB" else img.convert("RGB")
+            return np.array(rgb, dtype=np.uint8)
+
+
+class TurboJPEGBackend(DecoderBackend):
+    name = "turbojpeg"
+    formats = (FORMAT_JPEG,)
+
+    def __init__(self):
+        from turbojpeg import TurboJPEG, TJPF_RGB
+        self._jpeg = TurboJPEG()
+        self._pixel_format = TJPF_RGB
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return self._jpeg.decode(data, pixel_format=self._pixel_format)
+
+
+class OpenCVBackend(DecoderBackend):
+    name = "cv2"
+    formats = (FORMAT_JPEG, FORMAT_PNG, FORMAT_WEBP)
+
+    def __init__(self):
+        import cv2
+        self._cv2 = cv2
+
+    def decode(self, data: bytes) -> np.ndarray:
+        cv2 = self._cv2
+        encoded = np.frombuffer(data, dtype=np.uint8)
+        # IMREAD_COLOR 默认按 EXIF 方向旋转，而 probe_size 与其他后端都不旋转，忽略方向保证尺寸一致
+        bgr = cv2.imdecode(encoded, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if bgr is None:
+            raise ValueError("cv2.imdecode 解码失败")
+        # 在解码缓冲区上原地转换为RGB，避免额外分配
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+
+
+# 后端注册表：名称 -> 构造函数。构造失败（依赖未安装）的后端会被跳过
+_BACKEND_FACTORIES: Dict[str, Callable[[], DecoderBackend]] = {
+    "turbojpeg": TurboJPEGBackend,
+    "cv2": OpenCVBackend,
+    "pil": PILBackend
+}
+
+
+def register_backend(name: str, factory: Callable[[], DecoderBackend]):
+    """注册自定义解码后端"""
+    _BACKEND_FACTORIES[name] = factory
+
+
+class ImageDecoder:
+    """按格式选择解码后端，失败时自动回退"""
+
+    def __init__(self, order: Optional[List[str]] = None):
+        self.backends: List[DecoderBackend] = []
+        for name in order or DEFAULT_DECODER_ORDER:
+            factory = _BACKEND_FACTORIES.get(name)
+            if not factory:
+                logger.warning(f"[Dreamina] 未知的解码后端: {name}")
+                continue
+            try:
+                self.backends.append(factory())
+            except Exception as e:
+                logger.debug(f"[Dreamina] 解码后端 {name} 不可用: {e}")
+        # PIL 始终作为最后的兜底
+        if not any(b.name == "pil" for b in self.backends):
+            self.backends.append(PILBackend())
+        logger.debug(f"[Dreamina] 可用解码后端: {[b.name for b in self.backends]}")
+
+    def backends_for(self, fmt: str) -> List[DecoderBackend]:
+        return [b for b in self.backends if fmt in b.formats]
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """解码图片为 (H,W,3) uint8 RGB 数组"""
+        fmt = detect_format(data)
+        last_error = None
+        for backend in self.backends_for(fmt):
+            try:
+                return backend.decode(data)
+            except Exception as e:
+                last_error = e
+                logger.debug(f"[Dreamina] 解码后端 {backend.name} 处理{fmt}失败，尝试下一个: {e}")
+        raise ValueError(f"所有解码后端均无法解码该图片({fmt}): {last_error}")
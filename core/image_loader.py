@@ -0,0 +1,168 @@
+"""
+结果图片并发下载与解码
+将串行的 requests.get + PIL 解码改为有界线程池并发执行，结果保持与URL相同的顺序。
+解码由 image_decoder 按格式选择最快的可用后端。
+"""
+
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+import torch
+from PIL import Image
+
+from . import deadline
+from .image_decoder import ImageDecoder, probe_size
+
+logger = logging.getLogger(__name__)
+
+# 默认下载参数，可通过 config.json 的 download 段覆盖
+DEFAULT_DOWNLOAD_CONFIG = {
+    "max_workers": 4,
+    "timeout": 60,
+    "max_retries": 2,
+    "retry_backoff": 1.0,
+    "decoders": ["turbojpeg", "cv2", "pil"]
+}
+
+# 可重试的下载错误：超时与连接中断，以及 429 / 5xx 响应；其他 4xx（如链接过期的 403/404）直接放弃
+RETRYABLE_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError)
+RETRYABLE_STATUS = {429}
+
+# 节点可选的输出精度。ComfyUI 的 IMAGE 约定为 [0,1] 浮点张量，因此不提供 uint8
+OUTPUT_PRECISIONS = {
+    "float32": torch.float32,
+    "float16": torch.float16
+}
+
+
+class ImageDownloader:
+    """并发下载结果图片并解码为张量"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        download_config = dict(DEFAULT_DOWNLOAD_CONFIG)
+        download_config.update((config or {}).get("download", {}))
+        self.max_workers = max(1, int(download_config["max_workers"]))
+        self.timeout = download_config["timeout"]
+        self.max_retries = max(0, int(download_config["max_retries"]))
+        self.retry_backoff = float(download_config["retry_backoff"])
+        self.decoder = ImageDecoder(download_config["decoders"])
+        # 常驻线程池：工作线程的Session与解码缓冲区可以跨批次复用
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dreamina-dl")
+        # 每个工作线程持有独立的Session，复用到CDN的连接
+        self._local = threading.local()
+
+    def _get_session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """下载单张图片，超时、连接错误与 429/5xx 时按指数退避重试，其他错误直接放弃
+        Args:
+            url: 图片URL
+        Returns:
+            bytes: 图片原始数据，失败时返回None
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._get_session().get(url, timeout=deadline.request_timeout(self.timeout))
+            except deadline.GenerationAborted:
+                raise
+            except RETRYABLE_ERRORS as e:
+                error = e
+            except Exception as e:
+                logger.error(f"[Dreamina] 下载图片失败 {url}: {e}")
+                return None
+            else:
+                if response.ok:
+                    return response.content
+                error = f"HTTP {response.status_code}"
+                if response.status_code < 500 and response.status_code not in RETRYABLE_STATUS:
+                    logger.error(f"[Dreamina] 下载图片失败 {url}: {error}")
+                    return None
+            if attempt >= self.max_retries:
+                logger.error(f"[Dreamina] 下载图片失败 {url}: {error}")
+                return None
+            delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"[Dreamina] 下载图片失败，{delay:.1f}秒后重试 ({attempt + 1}/{self.max_retries}): {error}")
+            deadline.sleep(delay)
+        return None
+
+    def _fetch_and_probe(self, url: str) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+        img_data = self.fetch(url)
+        if img_data is None:
+            return None
+        try:
+            return img_data, probe_size(img_data)
+        except Exception as e:
+            logger.error(f"[Dreamina] 无法识别图片 {url}: {e}")
+            return None
+
+    def _decode_into(self, batch: torch.Tensor, index: int, img_data: bytes) -> bool:
+        try:
+            write_slot(batch, index, self.decoder.decode(img_data))
+            return True
+        except Exception as e:
+            logger.error(f"[Dreamina] 处理图片{index + 1}失败: {e}")
+            return False
+
+    def download(self, urls: List[str], dtype: torch.dtype = torch.float32) -> Optional[torch.Tensor]:
+        """并发下载图片并组装为批次张量
+        先并发下载并解析文件头确定批次尺寸，再由各线程把像素直接解码写入预分配批次的对应位置。
+        Args:
+            urls: 图片URL列表
+            dtype: 输出批次的浮点精度（float32 或 float16）
+        Returns:
+            torch.Tensor: 按URL顺序排列的 (N,H,W,3) 批次（失败的图片会被跳过），全部失败时返回None
+        """
+        if not urls:
+            return None
+        # 下载受调用方的截止时间约束，工作线程沿用该截止时间
+        fetched = [item for item in self._executor.map(deadline.propagate(self._fetch_and_probe), urls) if item is not None]
+        if not fetched:
+            return None
+        width, height = fetched[0][1]
+        batch = torch.empty((len(fetched), height, width, 3), dtype=dtype)
+        ok = list(self._executor.map(lambda args: self._decode_into(batch, *args),
+                                     [(i, data) for i, (data, _) in enumerate(fetched)]))
+        if not any(ok):
+            return None
+        if not all(ok):
+            batch = batch[torch.tensor(ok)]
+        batch.div_(255.0)
+        return batch
+
+
+def write_slot(batch: torch.Tensor, index: int, arr: np.ndarray):
+    """将一张 (H,W,3) uint8 图片写入批次的指定位置，尺寸不一致时缩放到批次尺寸"""
+    height, width = batch.shape[1:3]
+    if arr.shape[:2] != (height, width):
+        logger.warning(f"[Dreamina] 图片{index+1}尺寸 {arr.shape[1]}x{arr.shape[0]} 与批次 {width}x{height} 不一致，已缩放")
+        arr = np.array(Image.fromarray(arr).resize((width, height), Image.Resampling.LANCZOS), dtype=np.uint8)
+    # copy_ 直接完成 uint8 -> 浮点 转换，不产生中间浮点副本
+    batch[index].copy_(torch.from_numpy(arr))
+
+
+def assemble_batch(pixels: List[np.ndarray], dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """将uint8像素直接写入预分配的 (N,H,W,3) 张量并原地归一化
+    尺寸不一致的图片会缩放到第一张图片的尺寸，保证批次可用。
+    Args:
+        pixels: (H,W,3) uint8 数组列表
+        dtype: 输出精度，float16 可将常驻内存减半
+    Returns:
+        torch.Tensor: (N,H,W,3) 批次，取值范围 [0,1]
+    """
+    height, width = pixels[0].shape[:2]
+    batch = torch.empty((len(pixels), height, width, 3), dtype=dtype)
+    for i, arr in enumerate(pixels):
+        write_slot(batch, i, arr)
+    batch.div_(255.0)
+    return batch
@@ -0,0 +1,119 @@
+"""
+生成任务日志（SQLite）
+在发送提交请求之前先按客户端生成的 submit_id 落盘，之后依次记录 history_id、完成/失败状态。
+提交超时或进程重启后，可以凭 submit_id 判断任务是否已经提交，避免重复提交（重复扣费），
+并找回仍在上游运行的任务继续轮询。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+STATE_SUBMITTING = "submitting"   # 已落盘，提交结果未知
+STATE_SUBMITTED = "submitted"     # 上游已受理，生成中
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+
+PENDING_STATES = (STATE_SUBMITTING, STATE_SUBMITTED)
+
+# 默认日志文件位于插件根目录，可通过 config.json 的 journal.path 覆盖
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    submit_id     TEXT PRIMARY KEY,
+    history_id    TEXT,
+    kind          TEXT NOT NULL,
+    account_index INTEGER,
+    params        TEXT,
+    state         TEXT NOT NULL,
+    result        TEXT,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_history_id ON jobs(history_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state);
+"""
+
+
+class JobJournal:
+    """按 submit_id 记录生成任务的生命周期"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_JOURNAL_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "JobJournal":
+        """按 config.json 的 journal.path 创建，相对路径相对于插件根目录"""
+        path = (config or {}).get("journal", {}).get("path")
+        if path and not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(DEFAULT_JOURNAL_PATH), path)
+        return cls(path)
+
+    def _execute(self, sql: str, args: tuple = ()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args)
+
+    def _row_to_job(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def record_submit(self, submit_id: str, kind: str, account_index: Optional[int], params: Optional[Dict[str, Any]] = None):
+        """发送提交请求之前落盘
+        同一 submit_id 已被上游受理（有 history_id）时保留原记录；被明确拒绝过的任务允许重新提交。
+        """
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (submit_id, kind, account_index, params, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(submit_id) DO UPDATE SET state = excluded.state, account_index = excluded.account_index, "
+            "result = NULL, updated_at = excluded.updated_at WHERE jobs.history_id IS NULL",
+            (submit_id, kind, account_index, json.dumps(params or {}, ensure_ascii=False), STATE_SUBMITTING, now, now))
+
+    def mark_submitted(self, submit_id: str, history_id: Optional[str]):
+        """上游已受理任务"""
+        self._execute(
+            "UPDATE jobs SET history_id = COALESCE(?, history_id), state = ?, updated_at = ? "
+            "WHERE submit_id = ? AND state IN (?, ?)",
+            (history_id, STATE_SUBMITTED, time.time(), submit_id, *PENDING_STATES))
+
+    def mark_finished(self, submit_id: str, state: str, result: Any = None):
+        """记录任务终态（completed / failed / cancelled）及结果，已取消的任务不再被覆盖"""
+        self._execute(
+            "UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE submit_id = ? AND state != ?",
+            (state, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(),
+             submit_id, STATE_CANCELLED))
+
+    def get(self, submit_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE submit_id = ?", (submit_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def find_by_history_id(self, history_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE history_id = ?", (history_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def find(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """按 submit_id 或 history_id 查找任务"""
+        return self.get(job_id) or self.find_by_history_id(job_id)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """仍未结束的任务（提交中/生成中），按提交时间排序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY created_at", PENDING_STATES).fetchall()
+        return [self._row_to_job(row) for row in rows]
@@ -0,0 +1,148 @@
+"""
+后台任务轮询
+一个守护线程统一调度所有已提交、尚未结束的生成任务，每个任务按 timeout.check_interval 查询一次状态，
+查询本身在小线程池（timeout.poll_workers）中执行，单个任务查询变慢（超时重试、退避）不会推迟其他任务。
+任务结束（拿到图片URL或上游返回失败）或超过截止时间后，通过 Future 通知等待方，
+因此多个任务的等待时间可以重叠，而不是每个调用方各自阻塞轮询。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_POLL_WORKERS = 4
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+class PollingJob:
+    """一个等待结果的任务"""
+
+    def __init__(self, job_id: str, query: Callable[[], Any], timeout: float, interval: float,
+                 on_done: Optional[Callable[[Any], None]] = None):
+        self.job_id = job_id
+        self.query = query
+        self.on_done = on_done
+        self.expires_at = time.monotonic() + timeout
+        self.next_poll = time.monotonic() + interval
+        self.polls = 0
+        # 查询正在线程池中执行
+        self.polling = False
+        self.future: Future = Future()
+
+
+class JobPoller:
+    """共享的后台轮询器"""
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL, max_workers: int = DEFAULT_POLL_WORKERS):
+        self.interval = float(interval)
+        self._jobs: Dict[str, PollingJob] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="dreamina-poll")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="dreamina-poller")
+        self._thread.start()
+
+    def track(self, job_id: str, query: Callable[[], Any], timeout: float,
+              on_done: Optional[Callable[[Any], None]] = None) -> Future:
+        """登记一个已提交的任务
+        Args:
+            job_id: 任务ID
+            query: 查询一次状态的函数，返回URL列表（完成）、含 failed/blocked 的字典（失败）或None（未完成）
+            timeout: 最长等待秒数，超时后 Future 抛出 DeadlineExceeded
+            on_done: 任务结束时调用，参数为最终结果（超时为None，不代表账号失败），先于 Future 完成
+        Returns:
+            Future: 结果为URL列表或失败字典
+        """
+        job = PollingJob(job_id, query, timeout, self.interval, on_done)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._wake.set()
+        return job.future
+
+    def finish(self, job_id: str, result: Any) -> Optional[Future]:
+        """提交时已拿到结果的任务直接结束（同样会调用 on_done）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            self._finish(job, result)
+            return job.future
+        return None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def _finish(self, job: PollingJob, result: Any = None, error: Optional[Exception] = None):
+        with self._lock:
+            if self._jobs.get(job.job_id) is not job:
+                return
+            del self._jobs[job.job_id]
+        if job.on_done is not None:
+            try:
+                job.on_done(None if error else result)
+            except Exception as e:
+                logger.error(f"[Dreamina] 任务 {job.job_id} 结束回调失败: {e}")
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def _poll(self, job: PollingJob):
+        """在线程池中查询一次任务状态"""
+        job.polls += 1
+        try:
+            result = job.query()
+        except Exception as e:
+            logger.warning(f"[Dreamina] 查询任务 {job.job_id} 状态失败: {e}")
+            result = None
+        finally:
+            with self._lock:
+                job.polling = False
+                job.next_poll = time.monotonic() + self.interval
+            self._wake.set()
+        if isinstance(result, list) and result:
+            self._finish(job, result)
+        elif isinstance(result, dict) and (result.get("failed") or result.get("blocked")):
+            self._finish(job, result)
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            with self._lock:
+                jobs = list(self._jobs.values())
+            # 超过截止时间的任务立即结束，即使查询仍在进行（之后返回的结果会被忽略）
+            expired = [job for job in jobs if now >= job.expires_at]
+            for job in expired:
+                logger.warning(f"[Dreamina] ⏰ 任务 {job.job_id} 等待超时")
+                self._finish(job, error=DeadlineExceeded("等待生成结果超时"))
+            with self._lock:
+                waiting = [job for job in jobs if job not in expired and not job.polling]
+                due = [job for job in waiting if job.next_poll <= now]
+                for job in due:
+                    job.polling = True
+            for job in due:
+                self._executor.submit(self._poll, job)
+            upcoming = min([job.next_poll for job in waiting if job not in due]
+                           + [job.expires_at for job in jobs if job not in expired], default=None)
+            self._wake.wait(None if upcoming is None else max(0.0, upcoming - now))
+
+
+def get_job_poller(config: Optional[Dict[str, Any]] = None) -> JobPoller:
+    """进程内共享的轮询器，轮询间隔与查询线程数取首次调用时的 timeout.check_interval / timeout.poll_workers"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            timeout_config = (config or {}).get("timeout", {})
+            _poller = JobPoller(timeout_config.get("check_interval", DEFAULT_POLL_INTERVAL),
+                                timeout_config.get("poll_workers", DEFAULT_POLL_WORKERS))
+        return _poller
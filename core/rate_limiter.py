@@ -0,0 +1,149 @@
+"""
+客户端限流
+按 (账号, 接口类别) 维护令牌桶，请求超出速率时排队等待而不是失败，
+避免批量轮询/上传触发上游限流和风控。同时统计每个桶的等待时间。
+限流器在进程内共享（get_rate_limiter），多个节点实例与 Web 服务器重建的组件共用同一组令牌桶，
+令牌桶按账号键（sessionid 摘要）区分，账号增删导致索引变化时限速状态不会错位。
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from . import deadline
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_GENERATE = "generate"
+ENDPOINT_HISTORY = "get_history_by_ids"
+ENDPOINT_UPLOAD = "upload"
+ENDPOINT_COMMERCE = "commerce"
+ENDPOINT_OTHER = "other"
+
+# 默认限流参数（rate: 每秒令牌数, burst: 桶容量），可通过 config.json 的 rate_limit 段覆盖
+DEFAULT_RATE_LIMITS = {
+    ENDPOINT_GENERATE: {"rate": 0.5, "burst": 2},
+    ENDPOINT_HISTORY: {"rate": 2.0, "burst": 5},
+    ENDPOINT_UPLOAD: {"rate": 4.0, "burst": 8},
+    ENDPOINT_COMMERCE: {"rate": 1.0, "burst": 3},
+    ENDPOINT_OTHER: {"rate": 2.0, "burst": 5}
+}
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def classify_endpoint(url: str) -> str:
+    """根据URL判断接口类别"""
+    if "/aigc_draft/generate" in url:
+        return ENDPOINT_GENERATE
+    if "/get_history_by_ids" in url:
+        return ENDPOINT_HISTORY
+    if "/commerce/" in url:
+        return ENDPOINT_COMMERCE
+    if "get_upload_token" in url or "imagex" in url or "/upload/" in url:
+        return ENDPOINT_UPLOAD
+    return ENDPOINT_OTHER
+
+
+class TokenBucket:
+    """令牌桶，令牌不足时预约未来的令牌并返回需要等待的时间"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(float(rate), 1e-6)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self) -> float:
+        """取出一个令牌，返回需要等待的秒数（调用方需持有锁）"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        self.requests += 1
+        if wait > 0:
+            self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def refund(self):
+        """归还一个未使用的令牌（等待期间请求被取消，调用方需持有锁）"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """按 (账号, 接口类别) 限流的请求调度器"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        rate_config = (config or {}).get("rate_limit", {})
+        self.enabled = rate_config.get("enabled", True)
+        self.limits = {name: dict(limit) for name, limit in DEFAULT_RATE_LIMITS.items()}
+        for name, limit in rate_config.get("endpoints", {}).items():
+            self.limits.setdefault(name, dict(DEFAULT_RATE_LIMITS[ENDPOINT_OTHER])).update(limit)
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        # 令牌桶 -> 最近一次使用时的账号索引，用于日志与统计
+        self._account_indexes: Dict[Tuple[str, str], int] = {}
+
+    def acquire(self, account_index: int, endpoint: str, account_key: Optional[str] = None) -> float:
+        """等待直到该账号的该类接口允许发送请求
+        Args:
+            account_index: 账号索引
+            endpoint: 接口类别（见 classify_endpoint）
+            account_key: 账号键，令牌桶按该键区分；未提供时使用账号索引
+        Returns:
+            float: 实际等待的秒数
+        """
+        if not self.enabled:
+            return 0.0
+        key = (account_key if account_key is not None else str(account_index), endpoint)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                limit = self.limits.get(endpoint, self.limits[ENDPOINT_OTHER])
+                bucket = self._buckets[key] = TokenBucket(limit["rate"], limit["burst"])
+            self._account_indexes[key] = account_index
+            wait = bucket.reserve()
+        if wait > 0:
+            logger.debug(f"[Dreamina] ⏳ 账号{account_index + 1} {endpoint} 请求限流，等待{wait:.2f}秒")
+            try:
+                deadline.sleep(wait)
+            except deadline.GenerationAborted:
+                # 请求不会再发出，把预约的令牌还给其他任务
+                with self._lock:
+                    bucket.refund()
+                raise
+        return wait
+
+    def stats(self) -> list:
+        """各令牌桶的请求数与等待时间统计"""
+        with self._lock:
+            result = []
+            for key, bucket in self._buckets.items():
+                result.append({
+                    "account_index": self._account_indexes[key],
+                    "endpoint": key[1],
+                    "requests": bucket.requests,
+                    "waited": bucket.waited,
+                    "total_wait": round(bucket.total_wait, 3),
+                    "avg_wait": round(bucket.total_wait / bucket.waited, 3) if bucket.waited else 0.0,
+                    "max_wait": round(bucket.max_wait, 3)
+                })
+            return sorted(result, key=lambda item: (item["account_index"], item["endpoint"]))
+
+
+def get_rate_limiter(config: Optional[Dict[str, Any]] = None) -> RateLimiter:
+    """进程内共享的限流器，限流参数取首次调用时的 rate_limit 配置"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(config)
+        return _limiter
@@ -0,0 +1,138 @@
+"""
+生成结果磁盘缓存（默认关闭，config.json 的 cache.enabled 开启）
+固定种子时，相同输入（提示词、模型、比例、分辨率、种子、参考图内容等）的生成结果按输入哈希保存到磁盘，
+工作流未改变时重新运行直接返回缓存，不再消耗积分和等待生成。
+图片以 uint8 保存（结果本身由 8 位图片解码而来，无损），总大小超过上限时按最近使用时间淘汰。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 默认参数，可通过 config.json 的 cache 段覆盖
+DEFAULT_CACHE_CONFIG = {
+    "enabled": False,
+    "dir": "cache",
+    "max_size_mb": 1024
+}
+
+CACHE_FILE_SUFFIX = ".pt"
+
+
+def hash_inputs(inputs: Dict[str, Any]) -> str:
+    """计算节点输入的哈希，张量按形状、精度与内容参与计算
+    Args:
+        inputs: 节点输入参数
+    Returns:
+        str: 十六进制 sha256
+    """
+    digest = hashlib.sha256()
+    for name in sorted(inputs):
+        value = inputs[name]
+        # 未连接的可选输入不参与计算
+        if value is None:
+            continue
+        digest.update(name.encode("utf-8"))
+        if isinstance(value, torch.Tensor):
+            tensor = value.detach().cpu().contiguous()
+            if tensor.dtype == torch.bfloat16:
+                tensor = tensor.float()
+            digest.update(f"tensor{tuple(tensor.shape)}{tensor.dtype}".encode("utf-8"))
+            digest.update(tensor.numpy().tobytes())
+        else:
+            digest.update(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """按输入哈希保存生成结果，LRU 淘汰"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        cache_config = dict(DEFAULT_CACHE_CONFIG)
+        cache_config.update((config or {}).get("cache", {}))
+        self.enabled = bool(cache_config["enabled"])
+        directory = cache_config["dir"]
+        if not os.path.isabs(directory):
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), directory)
+        self.directory = directory
+        self.max_bytes = int(float(cache_config["max_size_mb"]) * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        """是否已有该键的缓存结果"""
+        return self.enabled and os.path.isfile(self._path(key))
+
+    def get(self, key: str, dtype: torch.dtype = torch.float32) -> Optional[Tuple[torch.Tensor, str, str, str]]:
+        """读取缓存结果
+        Returns:
+            tuple: (images, generation_info, image_urls, history_id)，未命中返回None
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            entry = torch.load(path, weights_only=True)
+            # 更新修改时间作为最近使用时间
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[Dreamina] 读取结果缓存失败，已删除: {e}")
+            self._remove(path)
+            return None
+        images = entry["images"].to(dtype).div_(255.0)
+        return images, entry["info"], entry["urls"], entry["history_id"]
+
+    def put(self, key: str, result: Tuple[torch.Tensor, str, str, str]):
+        """保存生成结果，写入后按上限淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+        images, info, urls, history_id = result
+        entry = {
+            "images": images.detach().cpu().mul(255.0).round_().clamp_(0, 255).to(torch.uint8),
+            "info": info,
+            "urls": urls,
+            "history_id": history_id
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            torch.save(entry, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"[Dreamina] 写入结果缓存失败: {e}")
+            self._remove(tmp_path)
+            return
+        self._evict()
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(CACHE_FILE_SUFFIX)]
+                files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+            except OSError:
+                return
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                logger.debug(f"[Dreamina] 结果缓存超过上限，淘汰: {os.path.basename(path)}")
@@ -0,0 +1,215 @@
+"""
+请求重试策略
+统一处理超时、重试与熔断：
+- 超时取自 config.json 的 timeout 段（查询接口用 query_timeout，其余用 base_timeout）
+- 幂等请求（轮询、查询、上传）在超时/连接错误/5xx 时按指数退避加抖动重试，最多 timeout.max_retries 次
+- 提交生成不是幂等的，只有确认请求未送达（连接阶段失败、429/503 拒绝）时才重试，
+  请求已送达但结果未知时交给调用方提供的 dedupe 回调按 submit_id 查重
+- 按主机熔断：连续失败（超时、连接错误、5xx 含 503）达到阈值后 retry.breaker_reset 秒内直接拒绝请求，
+  避免在上游故障时堆积超时；429 是限流而非故障，既不计为失败也不清零失败计数；
+  被熔断拒绝的请求没有发出，与其他未送达的请求一样按退避重试；熔断到期后只放行一个试探请求，
+  试探成功恢复，失败重新熔断
+- 退避等待受当前生成的截止时间约束，取消或到期后不再重试
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from . import deadline
+from .rate_limiter import ENDPOINT_GENERATE, ENDPOINT_HISTORY, classify_endpoint
+
+logger = logging.getLogger(__name__)
+
+# 默认重试参数，可通过 config.json 的 retry 段覆盖
+DEFAULT_RETRY_CONFIG = {
+    "backoff_base": 1.0,
+    "backoff_max": 10.0,
+    "breaker_threshold": 5,
+    "breaker_reset": 30
+}
+
+# 明确表示请求被拒绝、未被处理的状态码，任何请求都可以重试
+REJECTED_STATUS = {429, 503}
+# 服务端错误，仅幂等请求重试
+SERVER_ERROR_STATUS = {500, 502, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """主机处于熔断状态，请求未发送"""
+
+
+class CircuitBreaker:
+    """单个主机的熔断器：closed -> open（拒绝请求）-> half-open（只放行一个试探请求）"""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = max(1, int(threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.failures = 0
+        self.opened_at = 0.0
+        # 半开状态下的试探请求是否正在进行
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host: str) -> bool:
+        """请求前检查熔断状态，熔断中抛出 CircuitOpenError
+        Returns:
+            bool: 本次请求是否为半开状态的试探请求
+        """
+        with self._lock:
+            if self.failures < self.threshold:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{host} 连续失败{self.failures}次，熔断中")
+            if self.trial_in_flight:
+                raise CircuitOpenError(f"{host} 熔断试探请求进行中")
+            self.trial_in_flight = True
+            return True
+
+    def cancel_trial(self):
+        """试探请求未完成（被取消）时让出试探名额"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self, host: str):
+        with self._lock:
+            self.trial_in_flight = False
+            self.failures += 1
+            if self.failures >= self.threshold:
+                # 首次达到阈值或半开试探失败时重新计时
+                self.opened_at = time.monotonic()
+                logger.warning(f"[Dreamina] ⚠️ {host} 连续失败{self.failures}次，熔断{self.reset_timeout:.0f}秒")
+
+
+def _not_sent(error: Exception) -> bool:
+    """判断异常是否发生在请求送达服务器之前（此时重试提交不会重复生成）"""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, CircuitOpenError)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        text = str(error)
+        return "NewConnectionError" in text or "NameResolutionError" in text or "Connection refused" in text
+    return False
+
+
+class RetryPolicy:
+    """按接口幂等性执行重试、退避与熔断"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        timeout_config = config.get("timeout", {})
+        retry_config = dict(DEFAULT_RETRY_CONFIG)
+        retry_config.update(config.get("retry", {}))
+        self.base_timeout = timeout_config.get("base_timeout", 30)
+        self.query_timeout = timeout_config.get("query_timeout", self.base_timeout)
+        self.max_retries = max(0, int(timeout_config.get("max_retries", 3)))
+        self.backoff_base = float(retry_config["backoff_base"])
+        self.backoff_max = float(retry_config["backoff_max"])
+        self.breaker_threshold = retry_config["breaker_threshold"]
+        self.breaker_reset = retry_config["breaker_reset"]
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def timeout_for(self, url: str) -> float:
+        """查询类接口使用 query_timeout，其余使用 base_timeout"""
+        return self.query_timeout if classify_endpoint(url) == ENDPOINT_HISTORY else self.base_timeout
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt)) * (0.5 + random.random())
+
+    def execute(self, send: Callable[[float], requests.Response], url: str,
+                idempotent: Optional[bool] = None,
+                dedupe: Optional[Callable[[], Any]] = None) -> Any:
+        """执行请求并按策略重试
+        Args:
+            send: 发送一次请求的函数，参数为本次请求的超时秒数
+            url: 请求URL，用于判断接口类别与熔断主机
+            idempotent: 是否可安全重试，默认提交生成为非幂等，其余为幂等
+            dedupe: 非幂等请求结果未知时调用，返回已存在的结果（如按 submit_id 查到的任务）则不再重试
+        Returns:
+            requests.Response: 最后一次请求的响应；dedupe 查到结果时原样返回该结果
+        Raises:
+            requests.exceptions.RequestException: 重试耗尽或不可重试的错误
+        """
+        if idempotent is None:
+            idempotent = classify_endpoint(url) != ENDPOINT_GENERATE
+        host = urlparse(url).netloc
+        breaker = self._breaker(host)
+        timeout = self.timeout_for(url)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt >= self.max_retries
+            deadline.check()
+            trial = False
+            try:
+                trial = breaker.before_request(host)
+                response = send(timeout)
+            except deadline.GenerationAborted:
+                if trial:
+                    breaker.cancel_trial()
+                raise
+            except requests.exceptions.RequestException as e:
+                # 熔断拒绝的请求没有发出，不计入失败，按未送达的请求退避重试
+                if not isinstance(e, CircuitOpenError):
+                    breaker.record_failure(host)
+                if not idempotent and not _not_sent(e):
+                    # 请求可能已送达：等待退避时间让上游落库后查重，确认未生效才重试
+                    if dedupe is None:
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"[Dreamina] 请求结果未知，{delay:.1f}秒后查重: {e}")
+                    deadline.sleep(delay)
+                    existing = dedupe()
+                    if existing is not None:
+                        logger.info(f"[Dreamina] 🔁 查重确认已提交成功，不再重复提交")
+                        return existing
+                    if last_attempt:
+                        raise
+                    logger.warning(f"[Dreamina] 查重未找到任务，重新提交 ({attempt + 1}/{self.max_retries})")
+                    continue
+                if last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"[Dreamina] 请求失败，{delay:.1f}秒后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                deadline.sleep(delay)
+                continue
+            except Exception:
+                if trial:
+                    breaker.cancel_trial()
+                raise
+
+            status = response.status_code
+            if status >= 500:
+                breaker.record_failure(host)
+            elif status == 429:
+                # 限流不代表主机故障：不影响失败计数，试探请求被限流时让出名额
+                if trial:
+                    breaker.cancel_trial()
+            else:
+                breaker.record_success()
+            retryable = status in REJECTED_STATUS or (idempotent and status in SERVER_ERROR_STATUS)
+            if not retryable or last_attempt:
+                return response
+            delay = self._backoff(attempt, response)
+            logger.warning(f"[Dreamina] HTTP {status}，{delay:.1f}秒后重试 ({attempt + 1}/{self.max_retries})")
+            deadline.sleep(delay)
+        return response
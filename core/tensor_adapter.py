@@ -0,0 +1,29 @@
+"""
+torch 张量适配层
+ApiClient 中与 ComfyUI 张量相关的转换集中在这里，只在实际用到张量时才导入，
+Web 服务器与命令行工具导入 core 时不会加载 torch / numpy。
+"""
+
+import numpy as np
+import torch
+from PIL import Image
+
+ERROR_IMAGE_SIZE = 256
+
+
+def error_image() -> torch.Tensor:
+    """生成错误结果使用的纯红色 (1,H,W,3) 图片"""
+    return torch.ones(1, ERROR_IMAGE_SIZE, ERROR_IMAGE_SIZE, 3) * torch.tensor([1.0, 0.0, 0.0])
+
+
+def save_tensor_image(image_tensor: torch.Tensor, path: str):
+    """将 ComfyUI 图片张量保存为 PNG 文件
+    Args:
+        image_tensor: (H,W,3) 或 (N,H,W,3) 张量，批次时取第一张，数值裁剪到 [0,1]
+        path: 保存路径
+    """
+    if len(image_tensor.shape) == 4:  # batch, height, width, channels
+        image_tensor = image_tensor[0]  # 取第一张图片
+    image_tensor = torch.clamp(image_tensor, 0, 1)
+    image_np = (image_tensor.cpu().numpy() * 255).astype(np.uint8)
+    Image.fromarray(image_np).save(path)
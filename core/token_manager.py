@@ -7,19 +7,66 @@ import time
 from typing import Dict, Any, Optional, List
 import logging
 import datetime
+import contextvars
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .credit_cache import CreditCache
+from .credit_history import CreditHistory
+from .rate_limiter import get_rate_limiter, classify_endpoint
+from .retry_policy import RetryPolicy
+from . import deadline
 
 logger = logging.getLogger(__name__)
 
+# msToken / a_bogus 使用的字符集
+TOKEN_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# sign 缓存容量：批量轮询时同一秒内的大量请求共享相同的 (路径后缀, 时间戳)
+SIGN_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=SIGN_CACHE_SIZE)
+def _compute_sign(path_suffix, platform_code, version_code, timestamp):
+    """计算sign（带LRU缓存），签名只依赖路径的后7个字符"""
+    sign_str = f"9e2c|{path_suffix}|{platform_code}|{version_code}|{timestamp}||11ac"
+    logger.debug(f"[Dreamina] Sign生成: {sign_str}")
+    return hashlib.md5(sign_str.encode()).hexdigest()
+
+
+# 选择账号的策略
+ACCOUNT_POLICIES = {
+    # 积分最多的账号优先，分散消耗
+    "most_credit": lambda candidates: max(candidates, key=lambda c: (c[1], -c[0])),
+    # 积分最少但足够的账号优先，先用完零散积分
+    "least_credit": lambda candidates: min(candidates, key=lambda c: (c[1], c[0])),
+    # 按配置顺序取第一个满足条件的账号（与旧行为一致）
+    "first": lambda candidates: min(candidates, key=lambda c: c[0])
+}
+
 class TokenManager:
     def __init__(self, config):
         self.config = config
         self.accounts = config.get("accounts", [])
-        self.current_account_index = 0
+        self._default_account_index = 0
+        # 当前线程/上下文绑定的账号索引，并发请求之间互不影响；未绑定时使用全局当前账号
+        self._bound_account_index = contextvars.ContextVar(f"dreamina_account_{id(self)}", default=None)
         self.version_code = "5.8.0"
         self.platform_code = "7"
         self.device_id = str(random.random() * 999999999999999999 + 7000000000000000000)
         self.web_id = str(random.random() * 999999999999999999 + 7000000000000000000)
         self.user_id = str(random.random() * 999999999999999999 + 7000000000000000000) # Changed to generate a random user_id
+        self.credit_cache = CreditCache(self, config)
+        # 积分历史的本地存储与增量同步
+        self.credit_history = CreditHistory(self, config)
+        # 进程内所有出站请求共用的限流器，按 (账号, 接口类别) 限速
+        self.rate_limiter = get_rate_limiter(config)
+        # 超时/重试/熔断策略，所有出站请求共用
+        self.retry_policy = RetryPolicy(config)
+        # cookie 缓存: (sessionid, web_id) -> (静态前缀, 静态后缀, 时间戳, 完整cookie)
+        # 只有 sid_guard/ssid_ucp_v1/sid_ucp_v1 随时间变化，按秒重新计算
+        self._cookie_cache = {}
         
         logger.info(f"[Dreamina] Initialized with {len(self.accounts)} accounts")
         
@@ -67,6 +114,67 @@ class TokenManager:
             self.web_id = self._generate_web_id()
         return self.web_id
         
+    @property
+    def current_account_index(self):
+        """当前生效的账号索引：优先使用 use_account 绑定的账号，否则为全局当前账号"""
+        bound = self._bound_account_index.get()
+        return self._default_account_index if bound is None else bound
+
+    @current_account_index.setter
+    def current_account_index(self, account_index):
+        self._default_account_index = account_index
+
+    @contextmanager
+    def use_account(self, account_index):
+        """在当前线程/上下文内绑定账号
+        块内的签名、cookie、积分查询以及提交/轮询请求都使用该账号，不修改全局当前账号，
+        因此多个并发生成可以各自使用不同的账号。
+        Args:
+            account_index: 账号索引，为None时不做绑定
+        """
+        if account_index is None:
+            yield self.get_current_account()
+            return
+        if account_index < 0 or account_index >= len(self.accounts):
+            raise ValueError(f"Invalid account index: {account_index}, total accounts: {len(self.accounts)}")
+        token = self._bound_account_index.set(account_index)
+        try:
+            yield self.accounts[account_index]
+        finally:
+            self._bound_account_index.reset(token)
+
+    def throttle(self, url, account_index=None):
+        """按账号和接口类别限流，超出速率时阻塞等待
+        Args:
+            url: 请求URL，用于判断接口类别
+            account_index: 账号索引，未指定时使用当前账号
+        """
+        if account_index is None:
+            account_index = self.current_account_index
+        return self.rate_limiter.acquire(account_index, classify_endpoint(url), self.get_account_key(account_index))
+
+    def request(self, method, url, account_index=None, idempotent=None, dedupe=None, **kwargs):
+        """发送请求：每次尝试前限流，超时/重试/熔断由 retry_policy 处理
+        当前上下文绑定了截止时间时，每次尝试的连接/读取超时都不超过剩余时间。
+        Args:
+            method: HTTP方法
+            url: 请求URL
+            account_index: 限流使用的账号索引，未指定时使用当前账号
+            idempotent: 是否可安全重试，默认按接口类别判断
+            dedupe: 非幂等请求结果未知时的查重回调
+        Returns:
+            requests.Response: 响应（dedupe 查到结果时为该结果）
+        """
+        if account_index is None:
+            account_index = self.current_account_index
+        fixed_timeout = kwargs.pop("timeout", None)
+
+        def send(timeout):
+            self.throttle(url, account_index)
+            return requests.request(method, url, timeout=deadline.request_timeout(fixed_timeout or timeout), **kwargs)
+
+        return self.retry_policy.execute(send, url, idempotent=idempotent, dedupe=dedupe)
+
     def get_current_account(self):
         """获取当前账号"""
         if not self.accounts:
@@ -74,7 +182,7 @@ class TokenManager:
         return self.accounts[self.current_account_index]
         
     def switch_to_account(self, account_index):
-        """切换到指定账号"""
+        """切换全局当前账号（并发场景请使用 use_account）"""
         if not self.accounts:
             raise Exception("No accounts configured")
         if account_index < 0 or account_index >= len(self.accounts):
@@ -88,54 +196,116 @@ class TokenManager:
         """获取账号总数"""
         return len(self.accounts)
 
-    def find_account_with_sufficient_credit(self, required_credit):
-        """查找有足够积分的账号"""
-        original_index = self.current_account_index
-        
-        # 检查所有账号
+    def scan_account_credits(self, force_refresh=False):
+        """并发查询所有账号的积分，不切换当前账号
+        缓存中未过期的快照直接使用，其余账号并行查询并回填缓存。
+        Args:
+            force_refresh: 为True时忽略缓存，全部重新查询
+        Returns:
+            dict: 账号索引 -> 积分信息（查询失败的账号不包含在内）
+        """
+        credits = {}
+        pending = []
         for i in range(len(self.accounts)):
-            credit_info = self.get_credit()
-            if credit_info and credit_info["total_credit"] >= required_credit:
-                logger.info(f"[Dreamina] Found account with sufficient credit: {credit_info['total_credit']}")
-                return self.get_current_account()
-            
-            # 切换到下一个账号
-            next_index = (self.current_account_index + 1) % len(self.accounts)
-            self.switch_to_account(next_index)
-        
-        # 如果没有找到合适的账号，恢复原始账号
-        self.switch_to_account(original_index)
+            snapshot = None if force_refresh else self.credit_cache.get_fresh(i)
+            if snapshot:
+                credits[i] = snapshot
+            else:
+                pending.append(i)
+
+        if pending:
+            max_workers = self.config.get("credit", {}).get("scan_workers", 8)
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending))),
+                                    thread_name_prefix="dreamina-credit-scan") as executor:
+                for i, credit_info in zip(pending, executor.map(self.credit_cache.refresh, pending)):
+                    # 查询失败返回的备用积分不是真实数据
+                    if credit_info and not credit_info.get("is_fallback", False):
+                        credits[i] = credit_info
+        return credits
+
+    def select_account_index(self, required_credit, policy=None, force_refresh=False):
+        """按策略选出积分足够的账号索引
+        Args:
+            required_credit: 需要的积分
+            policy: 选择策略（most_credit / least_credit / first），默认读取 credit.account_policy
+            force_refresh: 为True时忽略积分缓存
+        Returns:
+            int: 账号索引，没有满足条件的账号时返回None
+        """
+        policy = policy or self.config.get("credit", {}).get("account_policy", "most_credit")
+        choose = ACCOUNT_POLICIES.get(policy)
+        if not choose:
+            logger.warning(f"[Dreamina] 未知的账号选择策略: {policy}，使用 most_credit")
+            choose = ACCOUNT_POLICIES["most_credit"]
+
+        credits = self.scan_account_credits(force_refresh)
+        # 排除积分查询失败的账号（如登录失效），避免按备用积分把它们排在最前
+        candidates = [(i, info.get("total_credit", 0)) for i, info in credits.items()
+                      if not info.get("is_fallback", False) and not self.credit_cache.failed(i)
+                      and info.get("total_credit", 0) >= required_credit]
+        if not candidates:
+            return None
+        index, total_credit = choose(candidates)
+        logger.info(f"[Dreamina] Found account with sufficient credit: 账号{index + 1} ({total_credit})")
+        return index
+
+    def find_account_with_sufficient_credit(self, required_credit, policy=None):
+        """查找有足够积分的账号（并发查询，不会切换当前账号）
+        Returns:
+            dict: 账号信息，没有满足条件的账号时返回None
+        """
+        index = self.select_account_index(required_credit, policy)
+        return self.accounts[index] if index is not None else None
+
+    def get_account(self, account_index=None):
+        """获取指定账号，未指定时返回当前账号"""
+        if account_index is None:
+            return self.get_current_account()
+        if 0 <= account_index < len(self.accounts):
+            return self.accounts[account_index]
         return None
 
-    def get_token(self, api_path="/"):
+    def get_account_key(self, account_index=None):
+        """账号的持久化键：sessionid 的摘要
+        账号增删后索引会变化，落盘的按账号状态（领取记录、积分历史）使用该键，且不保存明文sessionid。
+        Returns:
+            str: 账号键，账号不存在时返回None
+        """
+        account = self.get_account(account_index)
+        if not account:
+            return None
+        return hashlib.md5(account.get("sessionid", "").encode()).hexdigest()
+
+    def get_token(self, api_path="/", account_index=None, with_bogus=True):
         """获取token信息
         Args:
             api_path: API路径，用于生成不同的签名
+            account_index: 账号索引，未指定时使用当前账号
+            with_bogus: 是否生成 msToken / a_bogus（业务接口请求头不使用这两个字段）
         Returns:
             dict: token信息
         """
         try:
-            account = self.get_current_account()
+            account = self.get_account(account_index)
             if not account:
                 logger.error("[Dreamina] ❌ 无法获取当前账号信息")
                 return None
                 
             # 获取当前时间戳
-            timestamp = str(int(time.time()))
+            now = int(time.time())
+            timestamp = str(now)
             
             # 生成新的msToken
-            msToken = self._generate_ms_token()
+            msToken = self._generate_ms_token() if with_bogus else ""
             
             # 生成新的sign
             sign = self._generate_sign(api_path, timestamp)
             
             # 生成新的a_bogus
-            a_bogus = self._generate_a_bogus(api_path, timestamp)
+            a_bogus = self._generate_a_bogus(api_path, timestamp) if with_bogus else ""
             
-            # 生成新的cookie
-            cookie = self._generate_cookie(account)
-            
-
+            # 生成cookie（同一秒内复用）
+            cookie = self._generate_cookie(account, now)
             
             return {
                 "cookie": cookie,
@@ -152,8 +322,7 @@ class TokenManager:
     def _generate_ms_token(self):
         """生成msToken"""
         # 生成107位随机字符串
-        chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-        return ''.join(random.choice(chars) for _ in range(107))
+        return ''.join(random.choices(TOKEN_CHARS, k=107))
         
     def _generate_sign(self, api_path, timestamp):
         """生成sign
@@ -166,9 +335,7 @@ class TokenManager:
         # 使用固定的key - 根据curl示例调整
         # curl示例: device-time: 1753430107, sign: f48b6d6e16d11500afae632895dbdb97
         # API路径: /artist/v2/tools/get_upload_token
-        sign_str = f"9e2c|{api_path[-7:]}|{self.platform_code}|{self.version_code}|{timestamp}||11ac"
-        logger.debug(f"[Dreamina] Sign生成: {sign_str}")
-        return hashlib.md5(sign_str.encode()).hexdigest()
+        return _compute_sign(api_path[-7:], self.platform_code, self.version_code, timestamp)
         
     def _generate_a_bogus(self, api_path, timestamp):
         """生成a_bogus
@@ -179,59 +346,82 @@ class TokenManager:
             str: a_bogus字符串
         """
         # 生成32位随机字符串
-        chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-        return ''.join(random.choice(chars) for _ in range(32))
+        return ''.join(random.choices(TOKEN_CHARS, k=32))
         
-    def _generate_cookie(self, account):
+    def _generate_cookie(self, account, timestamp=None):
         """生成完整的cookie
+        静态部分按账号缓存，时间相关字段（sid_guard、ssid_ucp_v1、sid_ucp_v1）每秒最多计算一次。
         Args:
             account: 账号信息
+            timestamp: 当前时间戳（秒），未指定时取当前时间
         Returns:
             str: 完整的cookie字符串
         """
         try:
             # 获取基本信息
             sessionid = account.get("sessionid", "")
-            timestamp = int(time.time())
-            
-            # 生成过期时间（60天后）
-            expire_time = timestamp + 60 * 24 * 60 * 60
-            expire_date = time.strftime("%a, %d-%b-%Y %H:%M:%S GMT", time.gmtime(expire_time))
+            if timestamp is None:
+                timestamp = int(time.time())
             
             # 使用账号的web_id或生成新的
-            web_id = account.get('web_id', self._generate_web_id())
+            web_id = account.get('web_id') or self._generate_web_id()
             if not account.get('web_id'):
                 account['web_id'] = web_id
             
-            # 构建cookie部分
-            cookie_parts = [
-                f"sessionid={sessionid}",
-                f"sessionid_ss={sessionid}",
-                f"_tea_web_id={web_id}",
-                f"web_id={web_id}",
-                f"_v2_spipe_web_id={web_id}",
-                f"uid_tt={self.user_id}",
-                f"uid_tt_ss={self.user_id}",
-                f"sid_tt={sessionid}",
-                f"sid_guard={sessionid}%7C{timestamp}%7C5184000%7C{expire_date}",
-                f"ssid_ucp_v1=1.0.0-{hashlib.md5((sessionid + str(timestamp)).encode()).hexdigest()}",
-                f"sid_ucp_v1=1.0.0-{hashlib.md5((sessionid + str(timestamp)).encode()).hexdigest()}",
-                "store-region=cn-gd",
-                "store-region-src=uid",
-                "is_staff_user=false"
-            ]
+            key = (sessionid, web_id)
+            cached = self._cookie_cache.get(key)
+            if cached and cached[2] == timestamp:
+                return cached[3]
+            
+            if cached:
+                prefix, suffix = cached[0], cached[1]
+            else:
+                # 构建cookie的静态部分
+                prefix = "; ".join([
+                    f"sessionid={sessionid}",
+                    f"sessionid_ss={sessionid}",
+                    f"_tea_web_id={web_id}",
+                    f"web_id={web_id}",
+                    f"_v2_spipe_web_id={web_id}",
+                    f"uid_tt={self.user_id}",
+                    f"uid_tt_ss={self.user_id}",
+                    f"sid_tt={sessionid}"
+                ])
+                suffix = "; ".join([
+                    "store-region=cn-gd",
+                    "store-region-src=uid",
+                    "is_staff_user=false"
+                ])
+            
+            # 生成过期时间（60天后）
+            expire_time = timestamp + 60 * 24 * 60 * 60
+            expire_date = time.strftime("%a, %d-%b-%Y %H:%M:%S GMT", time.gmtime(expire_time))
+            ucp = hashlib.md5((sessionid + str(timestamp)).encode()).hexdigest()
             
-            return "; ".join(cookie_parts)
+            cookie = "; ".join([
+                prefix,
+                f"sid_guard={sessionid}%7C{timestamp}%7C5184000%7C{expire_date}",
+                f"ssid_ucp_v1=1.0.0-{ucp}",
+                f"sid_ucp_v1=1.0.0-{ucp}",
+                suffix
+            ])
+            self._cookie_cache[key] = (prefix, suffix, timestamp, cookie)
+            return cookie
             
         except Exception as e:
             logger.error(f"[Dreamina] Error generating cookie: {str(e)}")
             return ""
 
-    def get_credit(self):
-        """获取积分信息 - 更新为最新API格式"""
+    def get_credit(self, account_index=None):
+        """获取积分信息 - 更新为最新API格式
+        Args:
+            account_index: 账号索引，未指定时查询当前账号（指定时不会切换当前账号）
+        """
         url = "https://commerce-api-sg.capcut.com/commerce/v1/benefits/user_credit"
+        if account_index is None:
+            account_index = self.current_account_index
         
-        token_info = self.get_token("/commerce/v1/benefits/user_credit")
+        token_info = self.get_token("/commerce/v1/benefits/user_credit", account_index)
         if not token_info:
             logger.error("[Dreamina] 无法获取token信息")
             return self._get_fallback_credit()
@@ -262,7 +452,7 @@ class TokenManager:
         
         try:
             logger.info("[Dreamina] 🔍 正在获取积分信息...")
-            response = requests.post(url, headers=headers, json={}, timeout=30)
+            response = self.request("POST", url, account_index, headers=headers, json={})
             
             # 检查响应状态码
             if response.status_code != 200:
@@ -300,7 +490,7 @@ class TokenManager:
                     vip_credit = credit_info.get("vip_credit", 0)
                     total_credit = gift_credit + purchase_credit + vip_credit
                     
-                    logger.info(f"[Dreamina] ✅ 积分信息获取成功 - 账号{self.current_account_index + 1}:")
+                    logger.info(f"[Dreamina] ✅ 积分信息获取成功 - 账号{account_index + 1}:")
                     logger.debug(f"[Dreamina]   - 赠送积分: {gift_credit}")
                     logger.debug(f"[Dreamina]   - 购买积分: {purchase_credit}")
                     logger.debug(f"[Dreamina]   - VIP积分: {vip_credit}")
@@ -333,6 +523,8 @@ class TokenManager:
                 logger.error(f"[Dreamina] 积分获取失败: {error_msg}")
                 return self._get_fallback_credit()
                 
+        except deadline.GenerationAborted:
+            raise
         except requests.exceptions.Timeout:
             logger.error("[Dreamina] 获取积分信息超时")
             return self._get_fallback_credit()
@@ -344,9 +536,12 @@ class TokenManager:
             return self._get_fallback_credit()
     
     def _get_fallback_credit(self):
-        """获取积分失败时的备用返回值"""
+        """获取积分失败时的备用返回值
+        带 is_fallback 标记：只用于界面展示，不会写入积分缓存，也不参与账号选择
+        """
         logger.info("[Dreamina] 💡 使用备用积分信息（当前可能处于限免阶段）")
         return {
+            "is_fallback": True,
             "gift_credit": 999999,
             "purchase_credit": 0,
             "vip_credit": 0,
@@ -356,11 +551,11 @@ class TokenManager:
             "credits_detail": {}
         }
         
-    def get_credit_history(self, count=20, cursor="0"):
+    def get_credit_history(self, count=20, cursor="0", account_index=None):
         """获取积分历史记录 - 新增功能"""
         url = "https://commerce-api-sg.capcut.com/commerce/v1/benefits/user_credit_history"
         
-        token_info = self.get_token("/commerce/v1/benefits/user_credit_history")
+        token_info = self.get_token("/commerce/v1/benefits/user_credit_history", account_index)
         if not token_info:
             logger.error("[Dreamina] 无法获取token信息")
             return None
@@ -396,7 +591,7 @@ class TokenManager:
         
         try:
             logger.info(f"[Dreamina] 🔍 正在获取积分历史记录（数量：{count}，游标：{cursor}）...")
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = self.request("POST", url, account_index, headers=headers, json=data)
             
             logger.info(f"[Dreamina] 📡 积分历史API响应状态: {response.status_code}")
             
@@ -484,6 +679,8 @@ class TokenManager:
                 logger.error(f"[Dreamina] 积分历史获取失败: ret={result.get('ret')}, errmsg={error_msg}")
                 return None
                 
+        except deadline.GenerationAborted:
+            raise
         except requests.exceptions.Timeout:
             logger.error("[Dreamina] 获取积分历史超时")
             return None
@@ -496,8 +693,15 @@ class TokenManager:
             logger.error(f"[Dreamina] 详细异常信息: {traceback.format_exc()}")
             return None
             
-    def receive_daily_credit(self):
-        """领取每日积分"""
+    def receive_daily_credit(self, account_index=None):
+        """领取每日积分
+        Args:
+            account_index: 账号索引，未指定时使用当前上下文的账号
+        Returns:
+            int: 领取后的总积分，失败返回None
+        """
+        if account_index is None:
+            account_index = self.current_account_index
         url = "https://mweb-api-sg.capcut.com/commerce/v1/benefits/credit_receive"
         
         params = {
@@ -506,7 +710,7 @@ class TokenManager:
             "region": "HK"
         }
         
-        token_info = self.get_token("/commerce/v1/benefits/credit_receive")
+        token_info = self.get_token("/commerce/v1/benefits/credit_receive", account_index)
         if not token_info:
             return None
             
@@ -530,17 +734,21 @@ class TokenManager:
         }
         
         try:
-            response = requests.post(url, headers=headers, params=params, json={"time_zone": "Asia/Shanghai"})
+            # 领取积分不是幂等操作，只在确认未送达时重试
+            response = self.request("POST", url, account_index, idempotent=False, headers=headers, params=params,
+                                    json={"time_zone": "Asia/Shanghai"})
             result = response.json()
             
             if result.get("ret") == "0" and result.get("data"):
                 data = result["data"]
-                logger.info(f"[Dreamina] Account {self.current_account_index + 1} received daily credit: {data['receive_quota']}, total credit: {data['cur_total_credits']}")
+                logger.info(f"[Dreamina] Account {account_index + 1} received daily credit: {data['receive_quota']}, total credit: {data['cur_total_credits']}")
                 return data['cur_total_credits']
             else:
                 logger.error(f"[Dreamina] Failed to receive daily credit: {result}")
                 return None
                 
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] Error in receive_daily_credit: {str(e)}")
             return None
@@ -587,7 +795,7 @@ class TokenManager:
         }
         
         try:
-            response = requests.post(url, headers=headers, params=params, json=data)
+            response = self.request("POST", url, headers=headers, params=params, json=data)
             result = response.json()
             
             if result.get("ret") == "0" and result.get("data"):
@@ -603,6 +811,8 @@ class TokenManager:
                 logger.error(f"[Dreamina] Failed to get upload token: {result}")
                 return None
                 
+        except deadline.GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"[Dreamina] Error in get_upload_token: {str(e)}")
             return None
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Dreamina 异步节点：提交与获取结果分离
+- Dreamina_Submit 只负责提交任务，立即返回任务句柄，后台轮询器随即开始等待结果并预先下载图片
+- Dreamina_Collect 按句柄等待结果并输出图片
+
+多个提交节点可以通过 jobs 输入串联，获取节点连接最后一个提交节点并用 index 选择任务，
+这样所有任务都会先提交再等待，整个工作流的耗时取决于最慢的任务而不是各任务之和。
+"""
+
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import ExitStack
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+try:
+    from .dreamina_image_node import DreaminaImageNode, _comfy_interrupted, model_management
+    from .core.api_client import SCENE_OPTIONS, SCENE_FULL
+    from .core.image_loader import OUTPUT_PRECISIONS
+    from .core.credit_cache import estimate_cost
+    from .core.account_scheduler import AUTO_ACCOUNT
+    from .core.job_poller import get_job_poller
+    from .core import deadline
+except ImportError:
+    from dreamina_image_node import DreaminaImageNode, _comfy_interrupted, model_management
+    from core.api_client import SCENE_OPTIONS, SCENE_FULL
+    from core.image_loader import OUTPUT_PRECISIONS
+    from core.credit_cache import estimate_cost
+    from core.account_scheduler import AUTO_ACCOUNT
+    from core.job_poller import get_job_poller
+    from core import deadline
+
+logger = logging.getLogger(__name__)
+
+# 保留最近提交的任务句柄数量，超出后最早的句柄无法再获取结果
+MAX_TRACKED_JOBS = 64
+# 获取节点等待期间检查 ComfyUI 中断的间隔（秒）
+COLLECT_CHECK_INTERVAL = 0.5
+
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_jobs_lock = threading.Lock()
+# 任务完成后在后台预先下载图片
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dreamina-prefetch")
+
+
+def _register_job(job_id: str, entry: Dict[str, Any]):
+    with _jobs_lock:
+        _jobs[job_id] = entry
+        while len(_jobs) > MAX_TRACKED_JOBS:
+            _jobs.popitem(last=False)
+
+
+def _get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+class DreaminaSubmitNode(DreaminaImageNode):
+    """提交生成任务并立即返回句柄"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["optional"]["jobs"] = ("DREAMINA_JOBS", {"tooltip": "串联前一个提交节点的任务句柄，获取节点连接最后一个提交节点即可先全部提交再等待"})
+        return input_types
+
+    RETURN_TYPES = ("DREAMINA_JOBS", "STRING")
+    RETURN_NAMES = ("jobs", "job_id")
+    FUNCTION = "submit"
+    CATEGORY = "即梦AI"
+
+    def submit(self, prompt: str, model: str, resolution: str, ratio: str, account: str, seed: int, num_images: int = 4,
+               ref_image_1: torch.Tensor = None, ref_image_2: torch.Tensor = None, ref_image_3: torch.Tensor = None,
+               ref_image_4: torch.Tensor = None, ref_image_5: torch.Tensor = None, ref_image_6: torch.Tensor = None,
+               output_precision: str = "float32", download_size: str = SCENE_FULL,
+               jobs: Optional[Tuple[str, ...]] = None) -> Tuple[Tuple[str, ...], str]:
+        job_id = uuid.uuid4().hex
+        entry = {"prompt": prompt, "model": model, "ratio": ratio, "account": account,
+                 "estimated_cost": 0, "history_id": "", "error": None, "future": None, "download": None}
+        _register_job(job_id, entry)
+        handles = tuple(jobs or ()) + (job_id,)
+        try:
+            self._submit(entry, job_id, prompt, model, resolution, ratio, account, seed,
+                         [ref_image_1, ref_image_2, ref_image_3, ref_image_4, ref_image_5, ref_image_6],
+                         output_precision, download_size)
+        except deadline.GenerationCancelled:
+            entry["error"] = "提交已取消"
+            if model_management is not None:
+                model_management.throw_exception_if_processing_interrupted()
+        except Exception as e:
+            logger.error(f"[DreaminaNode] 提交任务失败: {e}", exc_info=True)
+            entry["error"] = f"提交任务失败: {e}"
+        if entry["error"]:
+            logger.error(f"[DreaminaNode] {entry['error']}")
+        return (handles, job_id)
+
+    def _submit(self, entry, job_id, prompt, model, resolution, ratio, account, seed, raw_refs,
+                output_precision, download_size):
+        if not self._is_configured() or not self.token_manager or not self.api_client:
+            entry["error"] = "插件未正确配置，请检查config.json文件中的账号设置"
+            return
+
+        account_index = None
+        if account != AUTO_ACCOUNT:
+            account_index = self._get_account_index_by_description(account)
+            if account_index is None:
+                entry["error"] = f"未找到账号: {account}"
+                return
+
+        ref_images = [ri for ri in raw_refs if ri is not None and self._validate_image_tensor(ri)]
+        is_image2image = len(ref_images) > 0
+        scene = None if download_size == SCENE_FULL else download_size
+        output_dtype = OUTPUT_PRECISIONS.get(output_precision, torch.float32)
+        # 分辨率随请求传入，不修改节点共享的配置（串联的多个提交节点可以使用不同分辨率）
+        resolution = str(resolution).strip()
+
+        estimated_cost = estimate_cost(self.config, model, is_image2image)
+        scheduler = self.api_client.account_scheduler
+        lease_index = scheduler.acquire(estimated_cost, account_index)
+        if lease_index is None:
+            entry["error"] = "没有可用的账号（均在冷却中或积分不足）"
+            return
+        entry.update(account=self._get_account_description(lease_index), estimated_cost=estimated_cost)
+
+        submit_id = str(uuid.uuid4())
+        tracked = False
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(deadline.use_deadline(
+                    deadline.Deadline.from_config(self.config, interrupt=_comfy_interrupted)))
+                stack.enter_context(self.token_manager.use_account(lease_index))
+                logger.info(f"[DreaminaNode] 🚀 提交{'图生图' if is_image2image else '文生图'}任务，账号: {entry['account']}")
+                if is_image2image:
+                    result = self.api_client.upload_images_and_generate_with_references(
+                        ref_images, prompt, model, ratio, scene, submit_id=submit_id, resolution=resolution)
+                else:
+                    result = self.api_client.generate_t2i(prompt, model, ratio, seed, scene=scene, submit_id=submit_id,
+                                                          resolution=resolution)
+            if not result:
+                entry["error"] = "图像生成失败，请检查网络连接和账号状态"
+                return
+
+            # 任务已提交：预留转为本地扣减
+            scheduler.commit(lease_index, estimated_cost)
+            history_id = result.get("history_record_id") or result.get("history_id") or ""
+            entry["history_id"] = history_id
+            if is_image2image:
+                query = functools.partial(self.api_client._get_generated_images_by_history_id, history_id, scene,
+                                          account_index=lease_index)
+            else:
+                query = functools.partial(self.api_client._get_generated_images, submit_id, scene,
+                                          account_index=lease_index)
+
+            def on_done(urls):
+                # 上游任务结束时释放账号名额，完成的任务立即在后台下载图片；
+                # 等待超时（urls 为None）只释放名额，不计入账号失败
+                ok = isinstance(urls, list) and bool(urls)
+                scheduler.release(lease_index, None if urls is None else ok)
+                if ok:
+                    entry["download"] = _prefetch_executor.submit(self.api_client._download_images, urls, output_dtype)
+
+            timeout = self.config.get("timeout", {}).get("generation_timeout", 180)
+            poller = get_job_poller(self.config)
+            entry["future"] = poller.track(job_id, query, timeout, on_done)
+            tracked = True
+            if result.get("urls"):
+                poller.finish(job_id, result["urls"])
+            logger.info(f"[DreaminaNode] ✅ 任务已提交，句柄: {job_id}，历史ID: {history_id}")
+        finally:
+            if not tracked:
+                scheduler.release(lease_index, False, 0 if entry["history_id"] else estimated_cost)
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        return float("NaN")
+
+
+class DreaminaCollectNode(DreaminaImageNode):
+    """等待提交节点的任务完成并输出图片"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "jobs": ("DREAMINA_JOBS", {"tooltip": "提交节点输出的任务句柄"}),
+                "index": ("INT", {"default": -1, "min": -MAX_TRACKED_JOBS, "max": MAX_TRACKED_JOBS - 1,
+                                  "tooltip": "串联多个提交节点时选择第几个任务（从0开始），-1 为最后一个"})
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("images", "generation_info", "image_urls", "history_id")
+    FUNCTION = "collect"
+    CATEGORY = "即梦AI"
+
+    def collect(self, jobs: Tuple[str, ...], index: int = -1) -> Tuple[torch.Tensor, str, str, str]:
+        try:
+            job_id = tuple(jobs or ())[index]
+        except IndexError:
+            return self._create_error_result(f"任务序号超出范围: {index}")
+        entry = _get_job(job_id)
+        if entry is None:
+            return self._create_error_result("任务句柄已失效，请重新提交")
+        if entry["error"]:
+            return self._create_error_result(entry["error"])
+
+        history_id = entry["history_id"]
+        started = time.time()
+        try:
+            urls = self._wait(entry["future"])
+            if isinstance(urls, dict):
+                return self._create_error_result(f"网页端返回失败: fail_code={urls.get('fail_code')}, msg={urls.get('fail_msg')}")
+            images = self._wait(entry["download"])
+        except deadline.GenerationCancelled:
+            if model_management is not None:
+                model_management.throw_exception_if_processing_interrupted()
+            return self._create_error_result("已取消等待")
+        except deadline.DeadlineExceeded:
+            return self._create_error_result(f"生成超时，历史ID: {history_id}")
+
+        if images is None:
+            return self._create_error_result(f"图片下载失败，历史ID: {history_id}")
+        logger.info(f"[DreaminaNode] ✅ 获取到{images.shape[0]}张图片，等待{time.time() - started:.1f}秒")
+        info_text = self._generate_info_text(
+            prompt=entry["prompt"],
+            model=entry["model"],
+            ratio=entry["ratio"],
+            num_images=images.shape[0],
+            account=entry["account"],
+            estimated_cost=entry["estimated_cost"],
+            history_id=history_id
+        )
+        urls_string = "\n".join(self._add_history_id_to_urls(urls, history_id))
+        return (images, info_text, urls_string, history_id)
+
+    def _wait(self, future):
+        """等待 Future 完成，期间响应 ComfyUI 中断"""
+        while True:
+            try:
+                return future.result(timeout=COLLECT_CHECK_INTERVAL)
+            except FutureTimeoutError:
+                if _comfy_interrupted():
+                    raise deadline.GenerationCancelled("执行已中断")
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        return float("NaN")
+
+
+NODE_CLASS_MAPPINGS = {
+    "Dreamina_Submit": DreaminaSubmitNode,
+    "Dreamina_Collect": DreaminaCollectNode
+}
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "Dreamina_Submit": "Dreamina 提交任务",
+    "Dreamina_Collect": "Dreamina 获取结果"
+}
@@ -4,42 +4,99 @@ ComfyUI插件的文生图和图生图功能合并为一个节点
 """
 
 import os
-import json
+import inspect
 import logging
 import torch
-import numpy as np
 import time
-import requests
-import io
-from PIL import Image
+import threading
+from contextlib import ExitStack
 from typing import Dict, Any, Tuple, Optional, List
 
 # 导入核心模块
 try:
     # 在ComfyUI环境中使用相对导入
     from .core.token_manager import TokenManager
-    from .core.api_client import ApiClient
+    from .core.api_client import ApiClient, SCENE_OPTIONS, SCENE_FULL
+    from .core.image_loader import OUTPUT_PRECISIONS
+    from .core.credit_cache import estimate_cost
+    from .core.account_scheduler import AUTO_ACCOUNT
+    from .core.daily_credit import start_daily_credit_scheduler
+    from .core.result_cache import ResultCache, hash_inputs
+    from .core.config_service import get_config_service
+    from .core import deadline
 except ImportError:
     # 在测试环境中使用绝对导入
     from core.token_manager import TokenManager
-    from core.api_client import ApiClient
+    from core.api_client import ApiClient, SCENE_OPTIONS, SCENE_FULL
+    from core.image_loader import OUTPUT_PRECISIONS
+    from core.credit_cache import estimate_cost
+    from core.account_scheduler import AUTO_ACCOUNT
+    from core.daily_credit import start_daily_credit_scheduler
+    from core.result_cache import ResultCache, hash_inputs
+    from core.config_service import get_config_service
+    from core import deadline
+
+try:
+    import comfy.model_management as model_management
+except ImportError:
+    # 脱离ComfyUI运行时没有中断机制
+    model_management = None
 
 logger = logging.getLogger(__name__)
 
+def _comfy_interrupted() -> bool:
+    """ComfyUI 是否请求中断当前执行"""
+    return model_management is not None and model_management.processing_interrupted()
+
+def _config_service():
+    return get_config_service(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"))
+
 def _load_config_for_class() -> Dict[str, Any]:
     """
     辅助函数：用于在节点类实例化前加载配置，
     以便为UI输入选项提供动态数据（如模型列表、账号列表）。
+    返回配置服务的共享解析结果，只在 config.json 变化时重新解析，调用方不要修改。
     """
     try:
-        plugin_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(plugin_dir, "config.json")
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return _config_service().get()
     except Exception as e:
         logger.warning(f"[DreaminaNode] 无法为UI加载配置文件: {e}。将使用默认值。")
         return {"params": {"models": {}, "ratios": {}, "default_model": "", "default_ratio": ""}, "accounts": []}
 
+def _build_ui_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """由配置计算节点下拉选项，结果随配置一起缓存"""
+    params = config.get("params", {})
+    models = params.get("models", {})
+    accounts = config.get("accounts", [])
+
+    model_options = list(models.keys()) or ["-"]
+    # 比例下拉使用 1k/2k/4k 三组比例键的并集，避免依赖当前 params.ratios
+    ratio_keys = set()
+    for key in ("1k_ratios", "2k_ratios", "4k_ratios"):
+        ratios = params.get(key, {})
+        if isinstance(ratios, dict):
+            ratio_keys.update(ratios.keys())
+    ratio_options = sorted(ratio_keys) or ["-"]
+
+    # 生成账号选择选项
+    account_options = []
+    if accounts:
+        for i, account in enumerate(accounts):
+            account_options.append(account.get("description", f"账号{i+1}"))
+        # 多账号时可交给调度器按负载/积分自动选择账号
+        if len(accounts) > 1:
+            account_options.append(AUTO_ACCOUNT)
+    else:
+        account_options = ["无可用账号"]
+
+    return {
+        "models": model_options,
+        "ratios": ratio_options,
+        "accounts": account_options,
+        "default_model": params.get("default_model", "3.0"),
+        "default_ratio": params.get("default_ratio", "1:1")
+    }
+
 class DreaminaImageNode:
     """
     即梦AI文/图生图合并节点
@@ -51,25 +108,21 @@ class DreaminaImageNode:
         self.config = self._load_config()
         self.token_manager = None
         self.api_client = None
+        self.credit_cache = None
+        self.result_cache = ResultCache(self.config)
         self._initialize_components()
     
     def _load_config(self) -> Dict[str, Any]:
         """
         加载插件的 config.json 配置文件。
+        返回配置服务解析结果的副本，生成时对 params 的临时修改不会影响其他节点。
         """
         try:
-            config_path = os.path.join(self.plugin_dir, "config.json")
-            if not os.path.exists(config_path):
-                template_path = os.path.join(self.plugin_dir, "config.json.template")
-                if os.path.exists(template_path):
-                    import shutil
-                    shutil.copy(template_path, config_path)
-                    logger.info("[DreaminaNode] 从模板创建了 config.json")
-                else:
-                    logger.error("[DreaminaNode] 配置文件和模板文件都不存在！")
-                    return {}
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            service = _config_service()
+            if not service.ensure_exists():
+                logger.error("[DreaminaNode] 配置文件和模板文件都不存在！")
+                return {}
+            config = service.load()
             logger.debug("[DreaminaNode] 配置文件加载成功")
             return config
         except Exception as e:
@@ -95,44 +148,31 @@ class DreaminaImageNode:
         try:
             self.token_manager = TokenManager(self.config)
             self.api_client = ApiClient(self.token_manager, self.config)
+            self.credit_cache = self.token_manager.credit_cache
+            # 后台预热各账号积分快照，首次生成即可显示积分
+            for i in range(self.token_manager.get_account_count()):
+                self.credit_cache.refresh_async(i)
+            # 按 credit.auto_receive_daily 启动每日积分自动领取（进程内只启动一个）
+            start_daily_credit_scheduler(self.token_manager, self.config)
             logger.debug("[DreaminaNode] 核心组件初始化成功。")
         except Exception as e:
             logger.error(f"[DreaminaNode] 核心组件初始化失败: {e}", exc_info=True)
     
     @classmethod
     def INPUT_TYPES(cls):
-        config = _load_config_for_class()
-        params = config.get("params", {})
-        models = params.get("models", {})
-        # 支持 1k/2k/4k 三组分辨率比例映射，与 Jimeng 节点对齐
-        ratios_1k = params.get("1k_ratios", {})
-        ratios_2k = params.get("2k_ratios", {})
-        ratios_4k = params.get("4k_ratios", {})
-        accounts = config.get("accounts", [])
-        
+        try:
+            options = _config_service().derived("ui_options", _build_ui_options)
+        except Exception:
+            options = _build_ui_options(_load_config_for_class())
+        model_options = list(options["models"])
+        ratio_options = list(options["ratios"])
+        account_options = list(options["accounts"])
+        resolution_options = ["1k", "2k", "4k"]
         defaults = {
-            "model": params.get("default_model", "3.0"),
+            "model": options["default_model"],
             "resolution": "2k",
-            "ratio": params.get("default_ratio", "1:1")
+            "ratio": options["default_ratio"]
         }
-        model_options = list(models.keys()) or ["-"]
-        # 比例下拉使用三组比例键的并集，避免依赖当前 params.ratios
-        ratio_keys = set()
-        if isinstance(ratios_1k, dict): ratio_keys.update(ratios_1k.keys())
-        if isinstance(ratios_2k, dict): ratio_keys.update(ratios_2k.keys())
-        if isinstance(ratios_4k, dict): ratio_keys.update(ratios_4k.keys())
-        ratio_options = list(ratio_keys) or ["-"]
-        ratio_options.sort()
-        resolution_options = ["1k", "2k", "4k"]
-        
-        # 生成账号选择选项
-        account_options = []
-        if accounts:
-            for i, account in enumerate(accounts):
-                description = account.get("description", f"账号{i+1}")
-                account_options.append(description)
-        else:
-            account_options = ["无可用账号"]
 
         return {
             "required": {
@@ -145,6 +185,8 @@ class DreaminaImageNode:
             },
             "optional": {
                 "num_images": ("INT", {"default": 4, "min": 1, "max": 4}),
+                "output_precision": (list(OUTPUT_PRECISIONS.keys()), {"default": "float32", "tooltip": "float16 可将结果图片常驻内存减半，适合长工作流"}),
+                "download_size": (SCENE_OPTIONS, {"default": SCENE_FULL, "tooltip": "下载的结果尺寸：full 为原图，1080 等缩小尺寸适合快速迭代"}),
                 "ref_image_1": ("IMAGE", {"tooltip": "参考图1，留空则不使用"}),
                 "ref_image_2": ("IMAGE", {"tooltip": "参考图2，留空则不使用"}),
                 "ref_image_3": ("IMAGE", {"tooltip": "参考图3，留空则不使用"}),
@@ -160,35 +202,6 @@ class DreaminaImageNode:
     FUNCTION = "generate_images"
     CATEGORY = "即梦AI"
     
-    def _wait_for_generation(self, history_id: str, is_image2image: bool = False) -> Optional[List[str]]:
-        """
-        轮询等待任务完成，支持文生图和图生图两种API。
-        """
-        timeout_config = self.config.get("timeout", {})
-        max_wait_time = timeout_config.get("max_wait_time", 120)
-        check_interval = timeout_config.get("check_interval", 10)
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait_time:
-            time.sleep(check_interval)
-            logger.info(f"[DreaminaNode] 轮询任务状态: {history_id}")
-            if is_image2image:
-                res = self.api_client._get_generated_images_by_history_id(history_id)
-                # 若网页端拒绝（例如 fail_code=1180），直接终止轮询
-                if isinstance(res, dict) and res.get("blocked"):
-                    logger.error(f"[DreaminaNode] 网页端拒绝生成: fail_code={res.get('fail_code')}, msg={res.get('fail_msg')}")
-                    return None
-                image_urls = res
-            else:
-                image_urls = self.api_client._get_generated_images(history_id)
-            if isinstance(image_urls, list) and image_urls:
-                logger.info(f"[DreaminaNode] 任务 {history_id} 生成成功")
-                # 为每个URL添加history_id参数，以便下游高清化节点使用
-                enhanced_urls = self._add_history_id_to_urls(image_urls, history_id)
-                return enhanced_urls
-        logger.error(f"[DreaminaNode] 等待任务 {history_id} 超时")
-        return None
-
     def _add_history_id_to_urls(self, urls: List[str], history_id: str) -> List[str]:
         """
         为图片URL添加history_id参数，以便下游高清化节点使用。
@@ -211,55 +224,31 @@ class DreaminaImageNode:
             enhanced_urls.append(enhanced_url)
         return enhanced_urls
 
-    def _download_images(self, urls: List[str]) -> List[torch.Tensor]:
-        """
-        下载图片并转换为torch张量。
-        """
-        images = []
-        for url in urls:
-            try:
-                # 移除history_id参数，因为下载图片时不需要这个参数
-                clean_url = self._remove_history_id_from_url(url)
-                response = requests.get(clean_url, timeout=60)
-                response.raise_for_status()
-                img_data = response.content
-                pil_image = Image.open(io.BytesIO(img_data)).convert("RGB")
-                np_image = np.array(pil_image, dtype=np.float32) / 255.0
-                tensor_image = torch.from_numpy(np_image).unsqueeze(0)
-                images.append(tensor_image)
-            except Exception as e:
-                logger.error(f"[DreaminaNode] 下载或处理图片失败 {url}: {e}")
-                continue
-        return images
-
-    def _remove_history_id_from_url(self, url: str) -> str:
-        """
-        从URL中移除history_id参数，用于图片下载。
-        
-        Args:
-            url: 包含history_id参数的URL
-            
-        Returns:
-            str: 清理后的URL
-        """
-        if 'history_id=' in url:
-            # 移除history_id参数
-            if '&history_id=' in url:
-                # history_id在中间或末尾
-                url = url.replace('&history_id=', '&').replace('&&', '&')
-                if url.endswith('&'):
-                    url = url[:-1]
-            elif '?history_id=' in url:
-                # history_id是第一个参数
-                if '&' in url:
-                    # 还有其他参数
-                    url = url.replace('?history_id=', '?').replace('&&', '&')
+    def _apply_resolution(self, resolution: str):
+        """按用户选择的分辨率切换分辨率映射（对文生图/图生图通用）"""
+        try:
+            params_cfg = self.config.get("params", {})
+            ratios_1k = params_cfg.get("1k_ratios", {})
+            ratios_2k = params_cfg.get("2k_ratios", {})
+            ratios_4k = params_cfg.get("4k_ratios", {})
+            key_map = {"1k": ratios_1k, "2k": ratios_2k, "4k": ratios_4k}
+            selected = key_map.get(str(resolution).strip(), ratios_2k)
+            if isinstance(selected, dict) and selected:
+                params_cfg["ratios"] = dict(selected)
+                # 同步记录分辨率类型，供 ApiClient.large_image_info.resolution_type 使用
+                if selected is ratios_1k:
+                    params_cfg["resolution_type"] = "1k"
+                elif selected is ratios_2k:
+                    params_cfg["resolution_type"] = "2k"
                 else:
-                    # 只有history_id参数
-                    url = url.split('?history_id=')[0]
-        return url
-
-
+                    params_cfg["resolution_type"] = "4k"
+                self.config["params"] = params_cfg
+                selected_group = "1k_ratios" if selected is ratios_1k else ("2k_ratios" if selected is ratios_2k else "4k_ratios")
+                logger.info(f"[DreaminaNode] 已切换分辨率组为: {selected_group}")
+            else:
+                logger.warning("[DreaminaNode] 未找到匹配的分辨率映射，将使用现有 ratios。")
+        except Exception as e:
+            logger.warning(f"[DreaminaNode] 切换分辨率映射时出错: {e}")
 
     def _validate_image_tensor(self, t: torch.Tensor) -> bool:
         """
@@ -277,25 +266,12 @@ class DreaminaImageNode:
         except Exception:
             return False
 
-    def _save_input_image(self, image_tensor: torch.Tensor) -> str:
-        """
-        将输入的图像张量保存为临时文件。
-        """
-        try:
-            temp_dir = os.path.join(self.plugin_dir, "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            temp_path = os.path.join(temp_dir, f"temp_input_{int(time.time())}.png")
-            if len(image_tensor.shape) == 4:
-                image_tensor = image_tensor[0]
-            image_tensor = torch.clamp(image_tensor, 0, 1)
-            image_np = (image_tensor.cpu().numpy() * 255).astype(np.uint8)
-            image_pil = Image.fromarray(image_np)
-            image_pil.save(temp_path)
-            logger.info(f"[DreaminaNode] 输入图像已保存到: {temp_path}")
-            return temp_path
-        except Exception as e:
-            logger.error(f"[DreaminaNode] 保存输入图像失败: {e}")
-            return None
+    def _get_account_description(self, account_index: int) -> str:
+        """获取账号索引对应的描述（与账号下拉选项一致）"""
+        accounts = self.config.get("accounts", [])
+        if 0 <= account_index < len(accounts):
+            return accounts[account_index].get("description", f"账号{account_index+1}")
+        return f"账号{account_index+1}"
 
     def _get_account_index_by_description(self, account_description: str) -> Optional[int]:
         """
@@ -326,11 +302,41 @@ class DreaminaImageNode:
 
     def generate_images(self, prompt: str, model: str, resolution: str, ratio: str, account: str, seed: int, num_images: int = 4, 
                         ref_image_1: torch.Tensor = None, ref_image_2: torch.Tensor = None, ref_image_3: torch.Tensor = None, 
-                        ref_image_4: torch.Tensor = None, ref_image_5: torch.Tensor = None, ref_image_6: torch.Tensor = None) -> Tuple[torch.Tensor, str, str, str]:
+                        ref_image_4: torch.Tensor = None, ref_image_5: torch.Tensor = None, ref_image_6: torch.Tensor = None,
+                        output_precision: str = "float32", download_size: str = SCENE_FULL) -> Tuple[torch.Tensor, str, str, str]:
         """
         生成图像的主要方法
+        开启结果缓存（cache.enabled）且种子固定时，相同输入直接返回磁盘缓存的结果。
         """
+        inputs = {name: value for name, value in locals().items() if name != "self"}
+        cache_key = self._result_cache_key(inputs) if self.result_cache.enabled and seed != -1 else None
+        if cache_key:
+            cached = self.result_cache.get(cache_key, OUTPUT_PRECISIONS.get(output_precision, torch.float32))
+            if cached is not None:
+                logger.info(f"[DreaminaNode] ♻️ 命中结果缓存，历史ID: {cached[3]}")
+                return cached
+
+        result = self._generate_images(prompt, model, resolution, ratio, account, seed, num_images,
+                                       ref_image_1, ref_image_2, ref_image_3, ref_image_4, ref_image_5, ref_image_6,
+                                       output_precision, download_size)
+        # 只缓存拿到图片的结果（排队占位图与错误结果的 image_urls 为空）
+        if cache_key and result[2]:
+            self.result_cache.put(cache_key, result)
+        return result
+
+    def _generate_images(self, prompt: str, model: str, resolution: str, ratio: str, account: str, seed: int, num_images: int = 4,
+                         ref_image_1: torch.Tensor = None, ref_image_2: torch.Tensor = None, ref_image_3: torch.Tensor = None,
+                         ref_image_4: torch.Tensor = None, ref_image_5: torch.Tensor = None, ref_image_6: torch.Tensor = None,
+                         output_precision: str = "float32", download_size: str = SCENE_FULL) -> Tuple[torch.Tensor, str, str, str]:
+        lease_index = None
+        reserved_credit = 0
+        generation_ok = False
+        account_context = ExitStack()
         try:
+            # 本次生成的总时长受 timeout.generation_timeout 约束，ComfyUI 中断时尽快结束等待与请求
+            account_context.enter_context(deadline.use_deadline(
+                deadline.Deadline.from_config(self.config, interrupt=_comfy_interrupted)))
+
             # 检查配置和组件是否正确初始化
             if not self._is_configured():
                 error_msg = "插件未正确配置，请检查config.json文件中的账号设置"
@@ -342,14 +348,15 @@ class DreaminaImageNode:
                 logger.error(f"[DreaminaNode] {error_msg}")
                 return self._create_error_result(error_msg)
             
-            # 切换到指定账号
-            account_index = self._get_account_index_by_description(account)
-            if account_index is None:
-                error_msg = f"未找到账号: {account}"
-                logger.error(f"[DreaminaNode] {error_msg}")
-                return self._create_error_result(error_msg)
-                
-            self.token_manager.switch_to_account(account_index)
+            # 解析指定账号；自动调度模式在估算积分消耗后再选择账号
+            auto_account = account == AUTO_ACCOUNT
+            account_index = None
+            if not auto_account:
+                account_index = self._get_account_index_by_description(account)
+                if account_index is None:
+                    error_msg = f"未找到账号: {account}"
+                    logger.error(f"[DreaminaNode] {error_msg}")
+                    return self._create_error_result(error_msg)
             
             # 收集参考图（最多6张），并做有效性过滤（对齐 Jimeng 逻辑）
             raw_refs = [ref_image_1, ref_image_2, ref_image_3, ref_image_4, ref_image_5, ref_image_6]
@@ -365,36 +372,37 @@ class DreaminaImageNode:
             if invalid_count > 0:
                 logger.warning(f"[DreaminaNode] 有 {invalid_count} 张参考图无效，已忽略")
             ref_images = valid_refs
+            output_dtype = OUTPUT_PRECISIONS.get(output_precision, torch.float32)
+            scene = None if download_size == SCENE_FULL else download_size
             is_image2image = len(ref_images) > 0
             logger.info(f"[DreaminaNode] 判定生成类型：{'图生图(I2I)' if is_image2image else '文生图(T2I)'}；有效参考图数量: {len(ref_images)}")
             # 按用户选择的分辨率切换分辨率映射（对文生图/图生图通用）
-            try:
-                params_cfg = self.config.get("params", {})
-                ratios_1k = params_cfg.get("1k_ratios", {})
-                ratios_2k = params_cfg.get("2k_ratios", {})
-                ratios_4k = params_cfg.get("4k_ratios", {})
-                key_map = {"1k": ratios_1k, "2k": ratios_2k, "4k": ratios_4k}
-                selected = key_map.get(str(resolution).strip(), ratios_2k)
-                if isinstance(selected, dict) and selected:
-                    params_cfg["ratios"] = dict(selected)
-                    # 同步记录分辨率类型，供 ApiClient.large_image_info.resolution_type 使用
-                    if selected is ratios_1k:
-                        params_cfg["resolution_type"] = "1k"
-                    elif selected is ratios_2k:
-                        params_cfg["resolution_type"] = "2k"
-                    else:
-                        params_cfg["resolution_type"] = "4k"
-                    self.config["params"] = params_cfg
-                    selected_group = "1k_ratios" if selected is ratios_1k else ("2k_ratios" if selected is ratios_2k else "4k_ratios")
-                    logger.info(f"[DreaminaNode] 已切换分辨率组为: {selected_group}")
-                else:
-                    logger.warning("[DreaminaNode] 未找到匹配的分辨率映射，将使用现有 ratios。")
-            except Exception as e:
-                logger.warning(f"[DreaminaNode] 切换分辨率映射时出错: {e}")
+            self._apply_resolution(resolution)
 
-            # 获取当前积分信息
-            logger.info(f"[DreaminaNode] 🔍 正在获取账号积分信息...")
-            current_credit = self.token_manager.get_credit()
+            # 估算本次生成的积分消耗 - 按次数计费，不是按图片数量
+            # 已基于是否提供参考图进行判断
+            
+            # 根据生成类型确定积分消耗（图生图默认4积分，文生图默认2积分，可由模型配置覆盖）
+            generation_type = "图生图" if is_image2image else "文生图"
+            estimated_cost = estimate_cost(self.config, model, is_image2image)
+            
+            # 登记本次生成并预留预估积分（自动调度或指定账号积分不足时由调度器选择账号），结束后在finally中释放
+            lease_index = self.api_client.account_scheduler.acquire(estimated_cost, account_index)
+            if lease_index is None:
+                return self._create_error_result("没有可用的账号（均在冷却中或积分不足）")
+            reserved_credit = estimated_cost
+            if not auto_account and lease_index != account_index:
+                account = self._get_account_description(lease_index)
+                logger.info(f"[DreaminaNode] 🔀 指定账号积分不足，改派到账号: {account}")
+            account_index = lease_index
+            if auto_account:
+                account = self._get_account_description(account_index)
+                logger.info(f"[DreaminaNode] 🔀 自动调度到账号: {account}")
+            # 本次生成的所有请求都绑定到该账号，不影响同时运行的其他任务
+            account_context.enter_context(self.token_manager.use_account(account_index))
+            
+            # 读取缓存的积分快照，过期时由后台刷新，不阻塞生成
+            current_credit = self.credit_cache.get(account_index)
             
             if current_credit:
                 total_credit = current_credit.get("total_credit", 0)
@@ -418,69 +426,21 @@ class DreaminaImageNode:
                             if days_left <= 7:  # 7天内过期的积分提醒
                                 logger.warning(f"[DreaminaNode] ⚠️ 积分即将过期: {expire_amount}积分将在{expire_date}过期")
                 
-                # 估算本次生成的积分消耗 - 按次数计费，不是按图片数量
-                # 已基于是否提供参考图进行判断
-                
-                # 根据生成类型确定积分消耗
-                if is_image2image:
-                    estimated_cost = 4  # 图生图固定消耗4积分
-                    generation_type = "图生图"
-                else:
-                    estimated_cost = 2  # 文生图固定消耗2积分
-                    generation_type = "文生图"
-                
-                # 也可以从配置文件获取，如果配置了的话
-                model_configs = self.config.get("params", {}).get("models", {})
-                model_config = model_configs.get(model, {})
-                if is_image2image:
-                    estimated_cost = model_config.get("cost_per_i2i", estimated_cost)
-                else:
-                    estimated_cost = model_config.get("cost_per_t2i", estimated_cost)
-                
-                if self.config.get("ui", {}).get("show_cost_estimation", True):
-                    logger.info(f"[DreaminaNode] 💡 本次{generation_type}预估消耗: {estimated_cost}积分")
-                
                 # 检查积分是否足够（限免期跳过检查）
                 if not is_free_period and total_credit < estimated_cost:
                     min_threshold = self.config.get("credit", {}).get("min_credit_threshold", 10)
                     if total_credit < min_threshold:
                         logger.warning(f"[DreaminaNode] ⚠️ 当前积分({total_credit})可能不足，建议检查账号状态")
             else:
-                logger.warning("[DreaminaNode] ⚠️ 无法获取积分信息，将继续尝试生成")
+                logger.info("[DreaminaNode] ℹ️ 积分信息正在后台获取，将继续生成")
             
-            # 获取积分历史记录（如果启用）
+            if self.config.get("ui", {}).get("show_cost_estimation", True):
+                logger.info(f"[DreaminaNode] 💡 本次{generation_type}预估消耗: {estimated_cost}积分")
+            
+            # 获取积分历史记录（如果启用），仅用于日志，放到后台执行
             credit_config = self.config.get("credit", {})
             if credit_config.get("enable_history", False):
-                logger.debug(f"[DreaminaNode] 📊 正在获取积分历史记录...")
-                try:
-                    history_count = credit_config.get("history_count", 10)
-                    credit_history = self.token_manager.get_credit_history(count=history_count)
-                    
-                    if credit_history:
-                        records = credit_history.get("records", [])
-                        
-                        # 分析最近的积分变化趋势
-                        recent_generations = 0
-                        recent_recharges = 0
-                        
-                        for record in records[:5]:  # 只分析最近5条记录
-                            title = record.get("title", "")
-                            history_type = record.get("history_type", 0)
-                            amount = record.get("amount", 0)
-                            
-                            if "Image generation" in title or history_type == 2:
-                                recent_generations += 1
-                            elif "Daily free" in title or history_type == 1:
-                                recent_recharges += amount
-                        
-                        if recent_generations > 0:
-                            logger.debug(f"[DreaminaNode] 📈 最近活动: {recent_generations}次生成，{recent_recharges}积分获得")
-                        else:
-                            logger.debug(f"[DreaminaNode] 📈 最近活动: 暂无生成记录，{recent_recharges}积分获得")
-                        
-                except Exception as e:
-                    logger.debug(f"[DreaminaNode] ⚠️ 获取积分历史失败: {e}")
-                    # 积分历史查询失败不应该影响主要流程，继续执行
+                threading.Thread(target=self._log_credit_history, args=(account_index,), daemon=True).start()
             else:
                 logger.debug(f"[DreaminaNode] ℹ️ 积分历史查询功能已禁用")
             
@@ -497,15 +457,25 @@ class DreaminaImageNode:
             
             if is_image2image:
                 # 图生图：传递参考图列表，让API客户端内部处理保存与批量上传
-                result = self.api_client.generate_i2i(ref_images, prompt, model, ratio, seed, num_images)
+                result = self.api_client.generate_i2i(ref_images, prompt, model, ratio, seed, num_images, dtype=output_dtype, scene=scene)
             else:
-                result = self.api_client.generate_t2i(prompt, model, ratio, seed)
+                result = self.api_client.generate_t2i(prompt, model, ratio, seed, scene=scene)
             
             if not result:
                 error_msg = "图像生成失败，请检查网络连接和账号状态"
                 logger.error(f"[DreaminaNode] {error_msg}")
                 return self._create_error_result(error_msg)
             
+            # 任务已提交：预留转为本地扣减，稍后在后台与服务器对账
+            # 图生图上传/提交失败时返回 (错误图像, 错误信息, "") 三元组，任务未提交，预留交给 release 退回
+            if is_image2image:
+                submitted = isinstance(result, tuple) and len(result) == 4 and bool(result[3])
+            else:
+                submitted = isinstance(result, dict)
+            if submitted:
+                self.api_client.account_scheduler.commit(account_index, estimated_cost)
+                reserved_credit = 0
+            
             # 处理生成结果 - 区分文生图和图生图的返回格式
             if is_image2image:
                 # 图生图：result是元组 (image_batch, generation_info, image_urls, history_id)
@@ -531,7 +501,11 @@ class DreaminaImageNode:
                         history_id=history_id
                     )
                     
+                    generation_ok = True
                     return (image_batch, enhanced_generation_info, image_urls, history_id)
+                elif isinstance(result, tuple) and len(result) == 3:
+                    # API客户端已生成错误结果
+                    return self._create_error_result(str(result[1]).replace("错误: ", "", 1))
                 else:
                     error_msg = "图生图返回格式错误"
                     logger.error(f"[DreaminaNode] {error_msg}")
@@ -546,6 +520,7 @@ class DreaminaImageNode:
                     
                     # 返回排队信息，不等待完成
                     placeholder_image = torch.zeros((1, 512, 512, 3))
+                    generation_ok = True
                     return (placeholder_image, info_text, "", history_id)
                 
                 # 获取生成的图片URLs
@@ -570,14 +545,14 @@ class DreaminaImageNode:
                         max_attempts = max_wait_time // check_interval
                         
                         for attempt in range(max_attempts):
-                            time.sleep(check_interval)
+                            deadline.sleep(check_interval)
                             
                             # 只在特定间隔显示查询进度，避免日志过多
                             if attempt % 3 == 0 or attempt == max_attempts - 1:
                                 logger.info(f"[DreaminaNode] 🔍 检查生成状态... ({attempt + 1}/{max_attempts})")
                             
                             # 文生图使用submit_id查询
-                            check_result = self.api_client._get_generated_images(submit_id)
+                            check_result = self.api_client._get_generated_images(submit_id, scene)
                             
                             if check_result:
                                 urls = check_result
@@ -594,25 +569,19 @@ class DreaminaImageNode:
                 
                 # 下载图片
                 logger.info(f"[DreaminaNode] 📥 开始下载{len(urls)}张图片...")
-                images = self.api_client._download_images(urls)
+                result_images = self.api_client._download_images(urls, output_dtype)
                 
-                if not images:
+                if result_images is None:
                     error_msg = f"图片下载失败，历史ID: {history_id}"
                     logger.error(f"[DreaminaNode] {error_msg}")
                     return self._create_error_result(error_msg)
                 
-                # 转换为张量
-                if len(images) == 1:
-                    result_images = images[0]
-                else:
-                    result_images = torch.cat(images, dim=0)
-                
                 # 生成信息文本
                 info_text = self._generate_info_text(
                     prompt=prompt, 
                     model=model, 
                     ratio=ratio, 
-                    num_images=len(images), 
+                    num_images=result_images.shape[0], 
                     account=account,
                     generation_type=generation_type,
                     estimated_cost=estimated_cost,
@@ -624,15 +593,43 @@ class DreaminaImageNode:
                 urls_with_history = self._add_history_id_to_urls(urls, history_id)
                 urls_string = "\n".join(urls_with_history)
                 
-                logger.info(f"[DreaminaNode] ✅ 生成完成！共{len(images)}张图片")
+                logger.info(f"[DreaminaNode] ✅ 生成完成！共{result_images.shape[0]}张图片")
+                generation_ok = True
                 return (result_images, info_text, urls_string, history_id)
             
+        except deadline.GenerationCancelled as e:
+            logger.warning(f"[DreaminaNode] ⏹️ 生成已取消: {e}")
+            if model_management is not None:
+                # 交给ComfyUI按中断处理，停止后续节点
+                model_management.throw_exception_if_processing_interrupted()
+            return self._create_error_result(f"生成已取消: {e}")
         except Exception as e:
             error_msg = f"生成过程中发生错误: {str(e)}"
             logger.error(f"[DreaminaNode] {error_msg}")
             import traceback
             logger.error(f"[DreaminaNode] 详细错误信息: {traceback.format_exc()}")
             return self._create_error_result(error_msg)
+        finally:
+            account_context.close()
+            if lease_index is not None:
+                self.api_client.account_scheduler.release(lease_index, generation_ok, reserved_credit)
+
+    def _log_credit_history(self, account_index: int):
+        """后台增量同步积分历史，并从本地存储输出最近的积分变化趋势"""
+        logger.debug(f"[DreaminaNode] 📊 正在同步积分历史记录...")
+        try:
+            credit_history = self.token_manager.credit_history
+            credit_history.sync(account_index)
+            summary = credit_history.stats(account_index, days=1, hours=24)["summary"]
+
+            if summary["generations"] > 0:
+                logger.debug(f"[DreaminaNode] 📈 最近24小时: {summary['generations']}次生成，消耗{summary['spent']}积分，{summary['received']}积分获得")
+            else:
+                logger.debug(f"[DreaminaNode] 📈 最近24小时: 暂无生成记录，{summary['received']}积分获得")
+
+        except Exception as e:
+            logger.debug(f"[DreaminaNode] ⚠️ 获取积分历史失败: {e}")
+            # 积分历史查询失败不应该影响主要流程，继续执行
 
     def _create_error_result(self, error_msg: str) -> Tuple[torch.Tensor, str, str, str]:
         logger.error(f"[DreaminaNode] {error_msg}")
@@ -670,8 +667,24 @@ class DreaminaImageNode:
             
         return "\n".join(info_lines)
 
+    @classmethod
+    def _result_cache_key(cls, inputs: Dict[str, Any]) -> str:
+        """结果缓存键：按 generate_images 的签名补齐未传入的默认值，IS_CHANGED 与生成时得到同一个键"""
+        parameters = inspect.signature(cls.generate_images).parameters
+        arguments = {name: param.default for name, param in parameters.items()
+                     if name != "self" and param.default is not inspect.Parameter.empty}
+        arguments.update((name, value) for name, value in inputs.items() if name in parameters)
+        return hash_inputs(arguments)
+
     @classmethod
     def IS_CHANGED(cls, **kwargs):
+        """开启结果缓存且种子固定时，只有磁盘上已有该输入的缓存结果才返回输入哈希，
+        输入不变时 ComfyUI 直接复用上次的输出；没有缓存（如上次失败或仍在排队）时每次都重新执行"""
+        result_cache = ResultCache(_load_config_for_class())
+        if result_cache.enabled and kwargs.get("seed", -1) != -1:
+            cache_key = cls._result_cache_key(kwargs)
+            if result_cache.contains(cache_key):
+                return cache_key
         return float("NaN")
 
 # ComfyUI节点注册
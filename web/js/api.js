@@ -110,6 +110,14 @@ class DreaminaAPI {
         return this.request(`/generate/status/${taskId}`);
     }
 
+    // 取消生成任务(服务端中止请求与轮询并记入历史记录)
+    async cancelTask(taskId, task = {}) {
+        return this.request(`/tasks/${encodeURIComponent(taskId)}/cancel`, {
+            method: 'POST',
+            body: JSON.stringify(task),
+        });
+    }
+
     // 获取生成结果
     async getResult(taskId) {
         return this.request(`/generate/result/${taskId}`);
@@ -290,6 +290,9 @@ class DreaminaApp {
             ratio: formData.ratio,
         });
 
+        // 客户端生成提交ID并随任务保存，页面刷新或服务器重启后重新提交时服务端据此复用原任务
+        formData.submitId = this.createSubmitId();
+
         // 创建新任务
         const taskId = ++this.taskIdCounter;
         const taskInfo = {
@@ -315,6 +318,17 @@ class DreaminaApp {
         this.executeGeneration(taskId, taskInfo);
     }
 
+    // 生成提交ID（非安全上下文中没有 crypto.randomUUID 时按 UUID v4 格式生成）
+    createSubmitId() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, (c) => {
+            const r = Math.random() * 16 | 0;
+            return (c === 'x' ? r : (r & 0x3 | 0x8)).toString(16);
+        });
+    }
+
     // 执行生成任务
     async executeGeneration(taskId, taskInfo) {
         try {
@@ -344,6 +358,7 @@ class DreaminaApp {
                         ratio: taskInfo.formData.ratio,
                         mode: taskInfo.mode,
                         images: result.images,
+                        previews: result.previews,
                         historyId: result.historyId || '',
                         duration: duration  // 添加耗时
                     });
@@ -387,6 +402,7 @@ class DreaminaApp {
                     ratio: taskInfo.formData.ratio,
                     mode: taskInfo.mode,
                     images: result.images,
+                    previews: result.previews,
                     historyId: result.historyId || '',
                     duration: duration  // 添加耗时
                 });
@@ -432,6 +448,19 @@ class DreaminaApp {
             this.activeTasks.delete(taskId);
             ui.removeTaskCard(taskId);
             ui.showToast(`任务 #${taskId} 已取消`, 'info');
+            // 通知服务端中止该任务的请求与轮询
+            const serverTaskId = (taskInfo.formData && taskInfo.formData.submitId) || taskInfo.serverTaskId;
+            if (serverTaskId) {
+                try {
+                    await api.cancelTask(serverTaskId, {
+                        formData: taskInfo.formData,
+                        mode: taskInfo.mode
+                    });
+                    await ui.renderHistory(true);
+                } catch (error) {
+                    console.error('取消服务器任务失败:', error);
+                }
+            }
             // 从服务器删除任务
             try {
                 await fetch(`${CONFIG.api.baseUrl}/tasks/active/${taskId}`, {
@@ -484,6 +513,7 @@ class DreaminaApp {
                 ratio: formData.ratio,
                 seed: formData.seed,
                 num_images: formData.numImages,
+                submitId: formData.submitId,
             });
 
             if (!response.success) {
@@ -541,6 +571,7 @@ class DreaminaApp {
                 ratio: formData.ratio,
                 seed: formData.seed,
                 num_images: formData.numImages,
+                submitId: formData.submitId,
             }, imageBlobs);
 
             if (!response.success) {
@@ -607,6 +638,7 @@ class DreaminaApp {
                     ui.updateTaskProgress(localTaskId, 100, '生成完成！');
                     return {
                         images: status.images,
+                        previews: status.previews,
                         historyId: status.historyId || serverTaskId,
                     };
                 }
@@ -1117,6 +1117,7 @@ class UIManager {
                         <div class="text-muted">
                             模型: ${item.model} | ${item.resolution} | ${item.ratio}
                             ${item.duration ? ` | <i class="fas fa-clock"></i> ${item.duration}秒` : ''}
+                            ${item.status === 'cancelled' ? ' | <i class="fas fa-ban"></i> 已取消' : ''}
                         </div>
                     </div>
                     <div class="history-item-images">
@@ -1503,9 +1504,9 @@ class UIManager {
                 return `${baseUrl}/api/images/${imageInfo.local}`;
             }
 
-            // 使用原始URL
-            const originalUrl = imageInfo.original;
-            return `${baseUrl}/api/proxy/image?url=${encodeURIComponent(originalUrl)}`;
+            // 本地图片未就绪时优先使用预览尺寸(1080),减少传输量
+            const displayUrl = imageInfo.preview || imageInfo.original;
+            return `${baseUrl}/api/proxy/image?url=${encodeURIComponent(displayUrl)}`;
         }
 
         // 如果是字符串,使用代理
@@ -11,6 +11,8 @@ import json
 import logging
 import time
 import datetime
+import threading
+import uuid
 from pathlib import Path
 import requests
 import hashlib
@@ -24,6 +26,12 @@ sys.path.insert(0, str(parent_dir))
 
 from core.token_manager import TokenManager
 from core.api_client import ApiClient
+from core.credit_cache import estimate_cost
+from core.job_journal import PENDING_STATES, STATE_CANCELLED, STATE_COMPLETED, STATE_FAILED, STATE_SUBMITTING
+from core.daily_credit import rebind_daily_credit_scheduler, start_daily_credit_scheduler
+from core.deadline import Deadline, GenerationAborted, use_deadline
+from core.batch_runner import BatchRunner, expand_jobs
+from core.config_service import get_config_service
 
 # 配置日志
 logging.basicConfig(
@@ -52,22 +60,25 @@ THUMBNAILS_DIR.mkdir(exist_ok=True)
 # 缩略图配置
 THUMBNAIL_SIZE = (400, 400)  # 缩略图最大尺寸
 
+# 结果展示使用的预览尺寸档位(下载/保存仍使用原图)
+PREVIEW_SCENE = '1080'
+
+# 已提交但尚未完成的任务所使用的账号 {task_id: (account_index, 登记时间)}
+# 轮询时切换回提交时的账号，任务结束时释放调度名额；
+# 前端不再轮询（关闭页面等）的任务超过 scheduler.task_ttl 秒后自动释放，避免账号一直被视为占用
+task_accounts = {}
+task_accounts_lock = threading.Lock()
+DEFAULT_TASK_ACCOUNT_TTL = 900
+
 def load_config():
-    """加载配置文件"""
+    """加载配置文件（与节点共用配置服务，文件未变化时不重新解析）"""
     global config
-    config_path = parent_dir / 'config.json'
-
-    if not config_path.exists():
-        # 如果不存在，从模板创建
-        template_path = parent_dir / 'config.json.template'
-        if template_path.exists():
-            import shutil
-            shutil.copy(template_path, config_path)
-            logger.info("从模板创建了 config.json")
+    service = get_config_service(str(parent_dir / 'config.json'))
 
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        # 如果不存在，从模板创建
+        service.ensure_exists()
+        config = service.load()
         logger.info("配置文件加载成功")
         return config
     except Exception as e:
@@ -77,11 +88,9 @@ def load_config():
 def save_config():
     """保存配置文件"""
     global config
-    config_path = parent_dir / 'config.json'
 
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        get_config_service(str(parent_dir / 'config.json')).save(config)
         logger.info("配置文件保存成功")
         return True
     except Exception as e:
@@ -168,6 +177,7 @@ def init_components():
     try:
         token_manager = TokenManager(config)
         api_client = ApiClient(token_manager, config)
+        rebind_daily_credit_scheduler(token_manager)
         logger.info("核心组件初始化成功")
         return True
     except Exception as e:
@@ -277,6 +287,7 @@ def add_account():
         # 重新初始化组件
         token_manager = TokenManager(config)
         api_client = ApiClient(token_manager, config)
+        rebind_daily_credit_scheduler(token_manager)
 
         logger.info(f"✅ 添加账号成功: {description}")
 
@@ -337,6 +348,7 @@ def update_account(account_id):
         # 重新初始化组件
         token_manager = TokenManager(config)
         api_client = ApiClient(token_manager, config)
+        rebind_daily_credit_scheduler(token_manager)
 
         logger.info(f"✅ 更新账号成功: {description}")
 
@@ -391,6 +403,7 @@ def delete_account(account_id):
         # 重新初始化组件
         token_manager = TokenManager(config)
         api_client = ApiClient(token_manager, config)
+        rebind_daily_credit_scheduler(token_manager)
 
         logger.info(f"✅ 删除账号成功: {deleted_account.get('description')}")
 
@@ -416,9 +429,14 @@ def get_credit(account_id):
     """获取账号积分"""
     try:
         account_index = int(account_id)
-        token_manager.switch_to_account(account_index)
+        if account_index < 0 or account_index >= token_manager.get_account_count():
+            return jsonify({
+                'success': False,
+                'message': '账号不存在'
+            }), 404
         
-        credit_info = token_manager.get_credit()
+        # 直接查询指定账号（不切换全局账号），结果同时回填积分缓存
+        credit_info = token_manager.credit_cache.refresh(account_index)
         
         if credit_info:
             return jsonify({
@@ -445,8 +463,12 @@ def get_credit_history(account_id):
         account_index = int(account_id)
         count = request.args.get('count', 20, type=int)
         
-        token_manager.switch_to_account(account_index)
-        history = token_manager.get_credit_history(count=count)
+        if account_index < 0 or account_index >= token_manager.get_account_count():
+            return jsonify({
+                'success': False,
+                'message': '账号不存在'
+            }), 404
+        history = token_manager.get_credit_history(count=count, account_index=account_index)
         
         if history:
             return jsonify({
@@ -466,6 +488,166 @@ def get_credit_history(account_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/accounts/<account_id>/credit/stats', methods=['GET'])
+def get_credit_stats(account_id):
+    """积分消耗统计（按天/模型的消耗、按小时的生成次数），从本地积分历史查询
+    account_id 为 all 时统计所有账号；sync=1 时先增量同步再统计。
+    """
+    try:
+        days = request.args.get('days', 30, type=int)
+        hours = request.args.get('hours', 24, type=int)
+        sync = request.args.get('sync', '0') == '1'
+
+        if account_id == 'all':
+            account_index = None
+            sync_indexes = range(token_manager.get_account_count())
+        else:
+            account_index = int(account_id)
+            if account_index < 0 or account_index >= token_manager.get_account_count():
+                return jsonify({
+                    'success': False,
+                    'message': '账号不存在'
+                }), 404
+            sync_indexes = [account_index]
+
+        if sync:
+            for i in sync_indexes:
+                token_manager.credit_history.sync(i)
+
+        return jsonify({
+            'success': True,
+            'stats': token_manager.credit_history.stats(account_index, days=days, hours=hours)
+        })
+
+    except Exception as e:
+        logger.error(f"获取积分统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+def acquire_account(model, is_image2image, submit_id=None):
+    """由调度器为本次生成选择账号并预留预估积分
+    同一 submit_id 已在任务日志中时沿用原账号（不再预留），否则无法按 submit_id 查重/复用原任务。
+    Returns:
+        tuple: (账号索引, 预留积分)，没有可用账号时账号索引为None
+    """
+    expire_task_accounts()
+    job = api_client.job_journal.get(submit_id) if submit_id else None
+    if job and job["account_index"] is not None and job["account_index"] < len(api_client.token_manager.accounts):
+        logger.info(f"submit_id={submit_id} 已提交过，沿用账号{job['account_index'] + 1}")
+        return api_client.account_scheduler.acquire(0, job["account_index"]), 0
+    reserved_credit = estimate_cost(config, model, is_image2image)
+    account_index = api_client.account_scheduler.acquire(reserved_credit)
+    if account_index is not None:
+        logger.info(f"调度到账号{account_index + 1}，预留积分: {reserved_credit}")
+    return account_index, reserved_credit
+
+def register_task_account(task_id, account_index):
+    """登记已提交任务的账号，任务结束或超过 scheduler.task_ttl 后释放其调度名额"""
+    expire_task_accounts()
+    with task_accounts_lock:
+        task_accounts[task_id] = (account_index, time.time())
+
+def get_task_account(task_id):
+    """返回任务登记的账号索引，未登记时返回None"""
+    entry = task_accounts.get(task_id)
+    return entry[0] if entry else None
+
+def release_task_account(task_id, success):
+    """任务结束（完成、失败或取消）时释放其账号的调度名额，success=None 表示取消"""
+    with task_accounts_lock:
+        entry = task_accounts.pop(task_id, None)
+    if entry is not None:
+        api_client.account_scheduler.release(entry[0], success)
+
+def expire_task_accounts():
+    """释放超过 scheduler.task_ttl 仍未结束的任务名额（前端不再轮询时任务无法正常释放）
+    结果未知，按取消释放，不计入账号失败统计
+    """
+    ttl = config.get("scheduler", {}).get("task_ttl", DEFAULT_TASK_ACCOUNT_TTL)
+    now = time.time()
+    with task_accounts_lock:
+        expired = [task_id for task_id, (_, registered_at) in task_accounts.items() if now - registered_at > ttl]
+    for task_id in expired:
+        logger.warning(f"任务 {task_id} 超过 {ttl} 秒未结束，释放其账号调度名额")
+        release_task_account(task_id, None)
+
+# 本进程正在执行的生成请求的截止时间，取消接口据此中止其请求、上传与轮询
+job_deadlines = {}  # {submit_id: Deadline}
+
+def register_job_deadline(submit_id):
+    """为一次生成请求创建截止时间（timeout.generation_timeout）并按 submit_id 登记"""
+    job_deadline = Deadline.from_config(config)
+    if submit_id:
+        job_deadlines[submit_id] = job_deadline
+    return job_deadline
+
+def unregister_job_deadline(submit_id, job_deadline):
+    if submit_id and job_deadlines.get(submit_id) is job_deadline:
+        del job_deadlines[submit_id]
+
+def settle_cancelled_job(account_index, reserved_credit, submit_id):
+    """被取消的生成请求结束后释放账号：上游已受理的任务积分已经扣除，预留转为扣减，否则归还"""
+    job = api_client.job_journal.get(submit_id) if submit_id else None
+    if job and job["history_id"]:
+        api_client.account_scheduler.commit(account_index, reserved_credit)
+        reserved_credit = 0
+    api_client.account_scheduler.release(account_index, None, reserved_credit)
+
+def cancelled_response():
+    return jsonify({
+        'success': False,
+        'cancelled': True,
+        'message': '任务已取消'
+    })
+
+@app.route('/api/scheduler/budget', methods=['GET'])
+def get_scheduler_budget():
+    """查看各账号的剩余可用积分（扣除已预留的部分）"""
+    try:
+        return jsonify({
+            'success': True,
+            'accounts': api_client.account_scheduler.budget()
+        })
+    except Exception as e:
+        logger.error(f"获取积分预算失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    """查看各账号的调度状态"""
+    try:
+        expire_task_accounts()
+        return jsonify({
+            'success': True,
+            'accounts': api_client.account_scheduler.stats()
+        })
+    except Exception as e:
+        logger.error(f"获取调度状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/rate_limit/stats', methods=['GET'])
+def get_rate_limit_stats():
+    """查看各账号/接口类别的限流等待统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'buckets': token_manager.rate_limiter.stats()
+        })
+    except Exception as e:
+        logger.error(f"获取限流统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @app.route('/api/generate/t2i', methods=['POST'])
 def generate_t2i():
     """文生图"""
@@ -477,6 +659,7 @@ def generate_t2i():
         ratio = data.get('ratio', '1:1')
         seed = data.get('seed', -1)
         resolution = data.get('resolution', '2k')
+        submit_id = data.get('submitId')
 
         if not prompt:
             return jsonify({
@@ -493,47 +676,51 @@ def generate_t2i():
         logger.info(f"开始文生图: {prompt[:50]}...")
         logger.info(f"参数: model={model}, ratio={ratio}, resolution={resolution}, seed={seed}")
 
-        # 临时修改配置以支持分辨率和比例
-        original_resolution = config.get("params", {}).get("resolution_type")
-        original_ratios = config.get("params", {}).get("ratios")
-
-        # 设置分辨率类型
-        config["params"]["resolution_type"] = resolution
-
-        # 根据分辨率设置对应的比例配置
-        resolution_ratios_key = f"{resolution}_ratios"
-        if resolution_ratios_key in config.get("params", {}):
-            config["params"]["ratios"] = config["params"][resolution_ratios_key]
-            logger.info(f"✅ 设置比例配置: {resolution_ratios_key}")
-            logger.info(f"✅ 当前比例 {ratio} 的尺寸: {config['params']['ratios'].get(ratio)}")
-        else:
-            # 默认使用 2k
-            config["params"]["ratios"] = config["params"].get("2k_ratios", {})
-            logger.warning(f"⚠️ 未找到 {resolution_ratios_key}，使用默认 2k_ratios")
+        account_index, reserved_credit = acquire_account(model, False, submit_id)
+        if account_index is None:
+            return jsonify({
+                'success': False,
+                'message': '没有可用的账号（均在冷却中或积分不足）'
+            }), 503
 
+        generation_deadline = register_job_deadline(submit_id)
         try:
-            # 调用 API 客户端
-            result = api_client.generate_t2i(
-                prompt=prompt,
-                model=model,
-                ratio=ratio,
-                seed=seed
-            )
+            # 调用 API 客户端，总时长受 timeout.generation_timeout 约束，可由取消接口中止
+            with use_deadline(generation_deadline):
+                result = api_client.generate_t2i(
+                    prompt=prompt,
+                    model=model,
+                    ratio=ratio,
+                    seed=seed,
+                    submit_id=submit_id,
+                    resolution=resolution,
+                    account_index=account_index
+                )
+        except Exception:
+            if not generation_deadline.cancelled:
+                api_client.account_scheduler.release(account_index, False, reserved_credit)
+                raise
+            result = None
         finally:
-            # 恢复原始配置
-            if original_resolution:
-                config["params"]["resolution_type"] = original_resolution
-            if original_ratios:
-                config["params"]["ratios"] = original_ratios
+            unregister_job_deadline(submit_id, generation_deadline)
+
+        if generation_deadline.cancelled:
+            settle_cancelled_job(account_index, reserved_credit, submit_id)
+            return cancelled_response()
         
         if not result:
+            api_client.account_scheduler.release(account_index, False, reserved_credit)
             return jsonify({
                 'success': False,
                 'message': '生成失败'
             }), 500
+
+        # 任务已提交：预留转为本地扣减
+        api_client.account_scheduler.commit(account_index, reserved_credit)
         
         # 如果是排队状态
         if result.get('is_queued'):
+            register_task_account(result.get('history_id'), account_index)
             return jsonify({
                 'success': True,
                 'queued': True,
@@ -548,6 +735,7 @@ def generate_t2i():
         
         if not urls:
             # 返回任务ID，前端需要轮询
+            register_task_account(submit_id or history_id, account_index)
             return jsonify({
                 'success': True,
                 'taskId': submit_id or history_id,
@@ -555,6 +743,7 @@ def generate_t2i():
             })
         
         # 直接返回结果
+        api_client.account_scheduler.release(account_index, True)
         return jsonify({
             'success': True,
             'completed': True,
@@ -588,6 +777,7 @@ def generate_i2i():
         seed = params.get('seed', -1)
         resolution = params.get('resolution', '2k')
         num_images = params.get('numImages', 4)
+        submit_id = params.get('submitId')
 
         if not prompt:
             return jsonify({
@@ -620,32 +810,47 @@ def generate_i2i():
         logger.info(f"开始图生图: {prompt[:50]}..., 参考图数量: {len(images)}")
         logger.info(f"参数: model={model}, ratio={ratio}, resolution={resolution}, seed={seed}")
 
-        # 临时修改配置以支持分辨率和比例
-        original_resolution = config.get("params", {}).get("resolution_type")
-        original_ratios = config.get("params", {}).get("ratios")
-
-        # 设置分辨率类型
-        config["params"]["resolution_type"] = resolution
-
-        # 根据分辨率设置对应的比例配置
-        resolution_ratios_key = f"{resolution}_ratios"
-        if resolution_ratios_key in config.get("params", {}):
-            config["params"]["ratios"] = config["params"][resolution_ratios_key]
-        else:
-            # 默认使用 2k
-            config["params"]["ratios"] = config["params"].get("2k_ratios", {})
+        account_index, reserved_credit = acquire_account(model, True, submit_id)
+        if account_index is None:
+            for img_path in images:
+                try:
+                    os.remove(img_path)
+                except:
+                    pass
+            return jsonify({
+                'success': False,
+                'message': '没有可用的账号（均在冷却中或积分不足）'
+            }), 503
 
         result = None
+        generation_ok = False
+        generation_deadline = register_job_deadline(submit_id)
         try:
-            # 调用 API 客户端
-            result = api_client.generate_i2i(
-                image=images,  # 传递图片列表
-                prompt=prompt,
-                model=model,
-                ratio=ratio,
-                seed=seed,
-                num_images=num_images
-            )
+            # 调用 API 客户端，总时长受 timeout.generation_timeout 约束，可由取消接口中止
+            try:
+                with use_deadline(generation_deadline):
+                    result = api_client.generate_i2i(
+                        image=images,  # 传递图片列表
+                        prompt=prompt,
+                        model=model,
+                        ratio=ratio,
+                        seed=seed,
+                        num_images=num_images,
+                        submit_id=submit_id,
+                        resolution=resolution,
+                        account_index=account_index
+                    )
+            except GenerationAborted as e:
+                # 已取消按取消返回；超过截止时间时预留在 finally 中退回
+                if generation_deadline.cancelled:
+                    return cancelled_response()
+                return jsonify({
+                    'success': False,
+                    'message': f'生成超时: {e}'
+                }), 504
+
+            if generation_deadline.cancelled:
+                return cancelled_response()
 
             if not result:
                 return jsonify({
@@ -657,7 +862,12 @@ def generate_i2i():
             if isinstance(result, tuple):
                 image_batch, generation_info, image_urls, history_id = result
                 urls = image_urls.split('\n') if isinstance(image_urls, str) else []
+                if history_id:
+                    # 任务已提交：预留转为本地扣减
+                    api_client.account_scheduler.commit(account_index, reserved_credit)
+                    reserved_credit = 0
 
+                generation_ok = bool(urls)
                 return jsonify({
                     'success': True,
                     'completed': True,
@@ -672,11 +882,11 @@ def generate_i2i():
                 }), 500
 
         finally:
-            # 恢复原始配置
-            if original_resolution:
-                config["params"]["resolution_type"] = original_resolution
-            if original_ratios:
-                config["params"]["ratios"] = original_ratios
+            unregister_job_deadline(submit_id, generation_deadline)
+            if generation_deadline.cancelled:
+                settle_cancelled_job(account_index, reserved_credit, submit_id)
+            else:
+                api_client.account_scheduler.release(account_index, generation_ok, reserved_credit)
 
             # 清理临时文件
             for img_path in images:
@@ -692,12 +902,79 @@ def generate_i2i():
             'message': str(e)
         }), 500
 
+# 进行中的批量生成 {batch_id: BatchRunner}，取消接口可按 batch_id 取消整批
+batch_runs = {}
+
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_batch():
+    """批量文生图：提示词 × 种子 × 比例 × 模型 的全部组合
+    以 NDJSON 流式返回，每个任务结束时输出一行结果，最后一行为汇总清单（含吞吐量）。
+    """
+    try:
+        data = request.json or {}
+        prompts = data.get('prompts') or []
+        if not isinstance(prompts, list) or not all(isinstance(p, str) and p.strip() for p in prompts):
+            return jsonify({
+                'success': False,
+                'message': '提示词列表不能为空'
+            }), 400
+        if any(len(p) > 1600 for p in prompts):
+            return jsonify({
+                'success': False,
+                'message': '提示词长度不能超过1600个字符'
+            }), 400
+
+        jobs = expand_jobs(prompts, data.get('seeds'), data.get('ratios'), data.get('models'), config)
+        runner = BatchRunner(api_client, config)
+        if len(jobs) > runner.max_jobs:
+            return jsonify({
+                'success': False,
+                'message': f'任务数{len(jobs)}超过上限{runner.max_jobs}'
+            }), 400
+
+        batch_id = data.get('batchId') or uuid.uuid4().hex
+        batch_runs[batch_id] = runner
+        logger.info(f"开始批量生成 {batch_id}: {len(jobs)}个任务")
+
+        def stream():
+            try:
+                for item in runner.run(jobs, data.get('scene')):
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+            finally:
+                batch_runs.pop(batch_id, None)
+
+        return Response(stream(), mimetype='application/x-ndjson', headers={'X-Batch-Id': batch_id})
+    except Exception as e:
+        logger.error(f"批量生成失败: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @app.route('/api/generate/status/<task_id>', methods=['GET'])
 def check_status(task_id):
     """检查生成状态"""
     try:
-        # 调用 API 客户端查询状态
-        result = api_client._get_generated_images(task_id)
+        # 已取消的任务不再查询上游
+        job = api_client.job_journal.find(task_id)
+        if job and job["state"] == STATE_CANCELLED:
+            return jsonify({
+                'success': True,
+                'completed': False,
+                'failed': True,
+                'cancelled': True,
+                'error': '任务已取消'
+            })
+
+        # 使用提交任务时的账号查询，生成记录只能由该账号查询（名额已超时释放时按任务日志中的账号）
+        account_index = get_task_account(task_id)
+        if account_index is None and job:
+            account_index = job["account_index"]
+        if account_index is not None and account_index >= token_manager.get_account_count():
+            account_index = None
+
+        # 调用 API 客户端查询状态(一次查询同时拿到原图和预览尺寸)
+        result = api_client._get_generated_image_variants(task_id, account_index=account_index)
 
         # 添加调试日志
         logger.debug(f"查询任务 {task_id} 状态,返回结果类型: {type(result)}, 内容: {result}")
@@ -725,6 +1002,7 @@ def check_status(task_id):
                     error_message = '提示词包含敏感内容，请修改后重试'
 
                 logger.warning(f"任务 {task_id} 失败: {fail_code} - {fail_msg}")
+                release_task_account(task_id, False)
                 logger.info(f"返回失败响应: failed=True, error={error_message}")
 
                 return jsonify({
@@ -737,10 +1015,14 @@ def check_status(task_id):
 
         # 检查是否返回了图片列表
         if isinstance(result, list) and result:
+            release_task_account(task_id, True)
+            job = api_client.job_journal.get(task_id)
             return jsonify({
                 'success': True,
                 'completed': True,
-                'images': result
+                'images': api_client._select_scene_urls(result),
+                'previews': api_client._select_scene_urls(result, PREVIEW_SCENE),
+                'historyId': (job or {}).get('history_id') or task_id
             })
 
         # 返回 None 表示任务不存在或查询失败
@@ -776,6 +1058,129 @@ def check_status(task_id):
             'message': error_msg
         }), 500
 
+# 任务日志重放：服务器重启后恢复仍在上游运行的任务
+# 超过该时长（秒）的未完成任务不再恢复，可通过 config.json 的 journal.resume_max_age 覆盖
+DEFAULT_RESUME_MAX_AGE = 3600
+
+def resume_pending_jobs():
+    """启动时重放任务日志，在后台继续轮询未完成的任务并保存历史记录
+    Returns:
+        int: 恢复的任务数
+    """
+    journal = api_client.job_journal
+    max_age = config.get("journal", {}).get("resume_max_age", DEFAULT_RESUME_MAX_AGE)
+    now = time.time()
+    jobs = []
+    for job in journal.pending():
+        account_index = job["account_index"]
+        if now - job["created_at"] > max_age or account_index is None \
+                or account_index >= token_manager.get_account_count():
+            journal.mark_finished(job["submit_id"], STATE_FAILED,
+                                  {"failed": True, "fail_msg": "任务已过期或账号已删除，未恢复"})
+            continue
+        # 登记任务账号：前端恢复的任务按 submit_id 查询状态时沿用该账号，任务结束时释放名额
+        api_client.account_scheduler.acquire(0, account_index)
+        register_task_account(job["submit_id"], account_index)
+        jobs.append(job)
+
+    if jobs:
+        logger.info(f"从任务日志恢复 {len(jobs)} 个未完成的任务")
+        threading.Thread(target=poll_resumed_jobs, args=(jobs, max_age), daemon=True).start()
+    return len(jobs)
+
+def poll_resumed_jobs(jobs, max_age):
+    """轮询恢复的任务直到全部结束"""
+    interval = config.get("timeout", {}).get("check_interval", 10)
+    pending = list(jobs)
+    while pending:
+        still_running = []
+        for job in pending:
+            try:
+                finished = poll_resumed_job(job["submit_id"], max_age)
+            except Exception as e:
+                logger.error(f"恢复任务 {job['submit_id']} 轮询失败: {e}")
+                finished = False
+            if not finished:
+                still_running.append(job)
+        pending = still_running
+        if pending:
+            time.sleep(interval)
+    logger.info("恢复的任务已全部结束")
+
+def poll_resumed_job(submit_id, max_age):
+    """查询一次恢复任务的状态
+    Returns:
+        bool: 任务已结束（完成、失败或已由前端处理）返回True
+    """
+    journal = api_client.job_journal
+    job = journal.get(submit_id)
+    if not job or job["state"] not in PENDING_STATES:
+        # 前端轮询或重新提交已经处理了该任务
+        release_task_account(submit_id, bool(job) and job["state"] == STATE_COMPLETED)
+        return True
+    if time.time() - job["created_at"] > max_age:
+        journal.mark_finished(submit_id, STATE_FAILED, {"failed": True, "fail_msg": "等待超时"})
+        release_task_account(submit_id, False)
+        return True
+
+    account_index = job["account_index"]
+    if job["state"] == STATE_SUBMITTING:
+        # 重启前提交结果未知：按 submit_id 查重，上游没有该任务则视为未提交
+        with token_manager.use_account(account_index):
+            try:
+                existing = api_client._lookup_submission(submit_id)
+            except requests.exceptions.RequestException:
+                return False
+        if not existing:
+            journal.mark_finished(submit_id, STATE_FAILED, {"failed": True, "fail_msg": "任务未被受理"})
+            release_task_account(submit_id, False)
+            return True
+        journal.mark_submitted(submit_id, existing["data"]["aigc_data"]["history_record_id"])
+        job = journal.get(submit_id)
+
+    previews = None
+    if job["kind"] == "t2i":
+        result = api_client._get_generated_image_variants(submit_id, account_index=account_index)
+        if isinstance(result, list) and result:
+            previews = api_client._select_scene_urls(result, PREVIEW_SCENE)
+            result = api_client._select_scene_urls(result)
+    elif job["history_id"]:
+        result = api_client._get_generated_images_by_history_id(job["history_id"], account_index=account_index)
+    else:
+        journal.mark_finished(submit_id, STATE_FAILED, {"failed": True, "fail_msg": "缺少history_id，无法恢复"})
+        release_task_account(submit_id, False)
+        return True
+
+    if isinstance(result, list) and result:
+        ingest_job_history(job, result, previews)
+        release_task_account(submit_id, True)
+        return True
+    if isinstance(result, dict) and (result.get("failed") or result.get("blocked")):
+        logger.warning(f"恢复的任务 {submit_id} 失败: {result.get('fail_code')} - {result.get('fail_msg')}")
+        release_task_account(submit_id, False)
+        return True
+    return False
+
+def ingest_job_history(job, images, previews=None):
+    """把恢复任务的结果写入历史记录（前端已保存同一 historyId 时跳过）"""
+    history_id = job["history_id"] or job["submit_id"]
+    if any(h.get('historyId') == history_id for h in history_records):
+        return
+    params = job["params"]
+    record_history({
+        'prompt': params.get('prompt', ''),
+        'model': params.get('model', ''),
+        'resolution': params.get('resolution') or '',
+        'ratio': params.get('ratio', ''),
+        'mode': job["kind"],
+        'images': images,
+        'previews': previews,
+        'historyId': history_id,
+        'duration': f"{time.time() - job['created_at']:.1f}",
+        'isNew': True
+    })
+    logger.info(f"恢复的任务 {job['submit_id']} 已完成并保存到历史记录")
+
 # 历史记录管理
 HISTORY_FILE = Path(__file__).parent / 'history.json'
 MAX_HISTORY_RECORDS = 100  # 最多保存100条记录
@@ -878,6 +1283,66 @@ def delete_active_task(task_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/tasks/<task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    """取消生成任务
+    中止本进程中执行该任务的请求、上传与轮询，任务日志标记为已取消，释放账号名额并记入历史记录。
+    task_id 可以是前端的 submitId、生成接口返回的 taskId（submit_id 或 history_id），或批量生成的 batchId。
+    """
+    try:
+        batch = batch_runs.get(task_id)
+        if batch:
+            batch.cancel()
+            logger.info(f"⏹️ 已取消批量生成: {task_id}")
+            return jsonify({
+                'success': True,
+                'cancelled': True
+            })
+
+        data = request.get_json(silent=True) or {}
+        journal = api_client.job_journal
+        job = journal.find(task_id)
+        submit_id = job["submit_id"] if job else task_id
+
+        running = job_deadlines.get(submit_id)
+        if running:
+            running.cancel("用户取消")
+        if job and job["state"] in PENDING_STATES:
+            journal.mark_finished(submit_id, STATE_CANCELLED, {"cancelled": True, "fail_msg": "用户取消"})
+
+        # 前端轮询中的任务按 taskId 登记了账号，取消后释放调度名额（不计入失败统计）
+        history_id = (job or {}).get("history_id")
+        for key in {task_id, submit_id, history_id}:
+            if key:
+                release_task_account(key, None)
+
+        cancelled = bool(running) or bool(job and job["state"] in PENDING_STATES)
+        if cancelled:
+            params = (job or {}).get("params") or data.get('formData', {})
+            record_history({
+                'prompt': params.get('prompt', ''),
+                'model': params.get('model', ''),
+                'resolution': params.get('resolution') or '',
+                'ratio': params.get('ratio', ''),
+                'mode': (job or {}).get('kind') or data.get('mode', 't2i'),
+                'images': [],
+                'historyId': history_id or submit_id,
+                'duration': f"{time.time() - job['created_at']:.1f}" if job else None,
+                'status': 'cancelled'
+            })
+            logger.info(f"⏹️ 已取消任务: {submit_id}")
+
+        return jsonify({
+            'success': True,
+            'cancelled': cancelled
+        })
+    except Exception as e:
+        logger.error(f"取消任务失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     """获取历史记录"""
@@ -894,6 +1359,89 @@ def get_history():
             'message': str(e)
         }), 500
 
+def record_history(data):
+    """创建历史记录并在后台下载图片到本地
+    Args:
+        data: 记录内容（prompt/model/resolution/ratio/mode/images/previews/historyId/duration/isNew/status）
+    Returns:
+        dict: 新建的历史记录项
+    """
+    global history_records
+
+    # 先使用原始URL创建历史记录(不等待下载)
+    original_images = data.get('images', [])
+    preview_images = data.get('previews') or []
+    local_images = []
+
+    for i, img_url in enumerate(original_images):
+        # 先保存原始URL,稍后在后台下载
+        local_images.append({
+            'original': img_url,
+            'preview': preview_images[i] if i < len(preview_images) else None,
+            'local': None,
+            'thumbnail': None
+        })
+
+    # 检查是否已存在相同的historyId(去重)
+    history_id_to_check = data.get('historyId', '')
+    if history_id_to_check:
+        # 删除已存在的相同historyId的记录
+        history_records = [h for h in history_records if h.get('historyId') != history_id_to_check]
+
+    # 创建历史记录项
+    history_item = {
+        'id': str(int(time.time() * 1000)),  # 使用时间戳作为ID
+        'timestamp': datetime.datetime.now().isoformat(),
+        'prompt': data.get('prompt', ''),
+        'model': data.get('model', ''),
+        'resolution': data.get('resolution', ''),
+        'ratio': data.get('ratio', ''),
+        'mode': data.get('mode', 't2i'),
+        'images': local_images,  # 先保存原始URL
+        'historyId': history_id_to_check,
+        'duration': data.get('duration', None),  # 保存耗时
+        'isNew': data.get('isNew', False),  # 保存新标记
+        'status': data.get('status', 'completed')  # completed / cancelled
+    }
+
+    # 添加到列表开头(最新的在前面)
+    history_records.insert(0, history_item)
+
+    # 限制历史记录数量
+    if len(history_records) > MAX_HISTORY_RECORDS:
+        history_records.pop()
+
+    # 保存到文件
+    save_history(history_records)
+
+    logger.info(f"添加历史记录: {history_item['id']}, 提示词: {history_item['prompt'][:50]}..., 图片数: {len(local_images)}")
+
+    # 在后台异步下载图片
+    def download_images_async():
+        try:
+            updated = False
+            for i, img_url in enumerate(original_images):
+                local_filename, thumbnail_filename = download_and_save_image(img_url)
+                if local_filename:
+                    # 更新历史记录中的图片信息
+                    history_item['images'][i]['local'] = local_filename
+                    history_item['images'][i]['thumbnail'] = thumbnail_filename
+                    updated = True
+                    logger.info(f"后台下载图片成功: {local_filename}")
+
+            # 如果有更新,保存到文件
+            if updated:
+                save_history(history_records)
+                logger.info(f"历史记录图片更新完成: {history_item['id']}")
+        except Exception as e:
+            logger.error(f"后台下载图片失败: {e}")
+
+    # 启动后台线程下载图片
+    thread = threading.Thread(target=download_images_async, daemon=True)
+    thread.start()
+
+    return history_item
+
 @app.route('/api/history', methods=['POST'])
 def add_history():
     """添加历史记录"""
@@ -903,76 +1451,7 @@ def add_history():
         # 调试日志
         logger.info(f"添加历史记录, isNew: {data.get('isNew', False)}")
 
-        # 先使用原始URL创建历史记录(不等待下载)
-        original_images = data.get('images', [])
-        local_images = []
-
-        for img_url in original_images:
-            # 先保存原始URL,稍后在后台下载
-            local_images.append({
-                'original': img_url,
-                'local': None,
-                'thumbnail': None
-            })
-
-        # 检查是否已存在相同的historyId(去重)
-        history_id_to_check = data.get('historyId', '')
-        if history_id_to_check:
-            # 删除已存在的相同historyId的记录
-            global history_records
-            history_records = [h for h in history_records if h.get('historyId') != history_id_to_check]
-
-        # 创建历史记录项
-        history_item = {
-            'id': str(int(time.time() * 1000)),  # 使用时间戳作为ID
-            'timestamp': datetime.datetime.now().isoformat(),
-            'prompt': data.get('prompt', ''),
-            'model': data.get('model', ''),
-            'resolution': data.get('resolution', ''),
-            'ratio': data.get('ratio', ''),
-            'mode': data.get('mode', 't2i'),
-            'images': local_images,  # 先保存原始URL
-            'historyId': history_id_to_check,
-            'duration': data.get('duration', None),  # 保存耗时
-            'isNew': data.get('isNew', False)  # 保存新标记
-        }
-
-        # 添加到列表开头(最新的在前面)
-        history_records.insert(0, history_item)
-
-        # 限制历史记录数量
-        if len(history_records) > MAX_HISTORY_RECORDS:
-            history_records.pop()
-
-        # 保存到文件
-        save_history(history_records)
-
-        logger.info(f"添加历史记录: {history_item['id']}, 提示词: {history_item['prompt'][:50]}..., 图片数: {len(local_images)}")
-
-        # 在后台异步下载图片
-        def download_images_async():
-            try:
-                updated = False
-                for i, img_url in enumerate(original_images):
-                    local_filename, thumbnail_filename = download_and_save_image(img_url)
-                    if local_filename:
-                        # 更新历史记录中的图片信息
-                        history_item['images'][i]['local'] = local_filename
-                        history_item['images'][i]['thumbnail'] = thumbnail_filename
-                        updated = True
-                        logger.info(f"后台下载图片成功: {local_filename}")
-
-                # 如果有更新,保存到文件
-                if updated:
-                    save_history(history_records)
-                    logger.info(f"历史记录图片更新完成: {history_item['id']}")
-            except Exception as e:
-                logger.error(f"后台下载图片失败: {e}")
-
-        # 启动后台线程下载图片
-        import threading
-        thread = threading.Thread(target=download_images_async, daemon=True)
-        thread.start()
+        history_item = record_history(data)
 
         return jsonify({
             'success': True,
@@ -1295,6 +1774,18 @@ if __name__ == '__main__':
         print("❌ 组件初始化失败")
         sys.exit(1)
     
+    debug = True
+
+    # 后台任务只在提供服务的进程中启动：debug 模式下重载器的监视进程不提供服务，
+    # 由重载器启动的子进程再次执行；不使用重载器时当前进程即提供服务
+    serving_process = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+    if serving_process:
+        # 恢复重启前未完成的任务
+        resume_pending_jobs()
+        # 按 credit.auto_receive_daily 启动每日积分自动领取
+        start_daily_credit_scheduler(token_manager, config)
+
     print("✅ 服务器初始化成功")
     print(f"📡 服务器地址: http://localhost:5000")
     print(f"📱 手机访问: http://[你的IP]:5000")
@@ -1304,6 +1795,6 @@ if __name__ == '__main__':
     app.run(
         host='0.0.0.0',  # 允许外部访问
         port=5000,
-        debug=True
+        debug=debug
     )
 